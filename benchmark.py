@@ -0,0 +1,208 @@
+'''Pipeline benchmark module.
+
+Times the main pipeline stages on synthetic Scorecard-shaped data (see
+synthetic_data.py) at several scales, recording throughput and peak memory
+to a JSON file that later runs can be compared against:
+
+    python benchmark.py --scales 5000,50000,500000 --output baseline.json
+    python benchmark.py --compare baseline.json
+
+Each (stage, scale) measurement runs in a fresh interpreter so that peak RSS
+reflects that stage alone. Model stages (normalization, KNN, SVR) run on a
+synthetic feature matrix rather than featurized rows, and KNN and SVR are
+capped at STAGE_MAX_ROWS rows since their cost grows quadratically; --dtype
+float32 runs them on the compact feature dtype.
+'''
+
+import argparse
+import json
+import numpy as np
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import synthetic_data
+
+
+DEFAULT_SCALES = [5000, 50000, 500000]
+DEFAULT_BENCHMARK_DIR = 'benchmark_data'
+DEFAULT_OUTPUT_FILENAME = 'benchmark_results.json'
+
+STAGES = [
+    'get_all_rows',
+    'get_filtered_rows',
+    'build_columnar_cache',
+    'get_examples',
+    'normalize_features',
+    'get_knn_predictions',
+    'get_svm_predictions',
+]
+MODEL_STAGES = ['normalize_features', 'get_knn_predictions', 'get_svm_predictions']
+STAGE_MAX_ROWS = {
+    'get_knn_predictions': 50000,
+    'get_svm_predictions': 10000,
+}
+MODEL_NUM_FEATURES = 200
+# Fraction of model-stage rows used as the training split
+TRAIN_FRACTION = 0.8
+
+
+def get_peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux (bytes on OS X)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def get_data_file_names(num_rows, num_columns):
+    data_file_name = os.path.join('data', 'SYNTHETIC_%s_%s_PP.csv' % (num_rows, num_columns))
+    dictionary_filename = os.path.join('data', 'SyntheticDictionary_%s.csv' % (num_columns))
+    return data_file_name, dictionary_filename
+
+
+def get_model_data(num_rows, seed=229, dtype=np.float64):
+    '''Synthetic feature matrix of dtype (a mix of 0/1 indicators and skewed
+    values) and two positive labels, split into train and dev.'''
+    random_state = np.random.RandomState(seed)
+    features = np.empty((num_rows, MODEL_NUM_FEATURES), dtype=dtype)
+    num_indicators = MODEL_NUM_FEATURES // 2
+    features[:, :num_indicators] = random_state.random_sample((num_rows, num_indicators)) < 0.2
+    features[:, num_indicators:] = random_state.lognormal(0, 1, (num_rows, MODEL_NUM_FEATURES - num_indicators))
+    labels = np.c_[
+        20000 + 1000 * features[:, num_indicators:num_indicators + 5].sum(axis=1),
+        30000 + 2000 * features[:, :5].sum(axis=1),
+    ] * random_state.lognormal(0, 0.1, (num_rows, 1))
+    num_train = int(num_rows * TRAIN_FRACTION)
+    return (features[:num_train], labels[:num_train]), (features[num_train:], labels[num_train:])
+
+
+def run_stage(stage, num_rows, num_columns, n_jobs, dtype='float64'):
+    '''Set up and time one stage in this process; returns a result dict.'''
+    import columnar
+    import featurize
+    import read_data
+    import regressions
+
+    data_file_name, dictionary_filename = get_data_file_names(num_rows, num_columns)
+    rows_used = min(num_rows, STAGE_MAX_ROWS.get(stage, num_rows))
+    if stage == 'get_all_rows':
+        run = lambda: read_data.get_all_rows(data_file_name)
+    elif stage == 'get_filtered_rows':
+        run = lambda: read_data.get_filtered_rows(data_file_name)
+    elif stage == 'build_columnar_cache':
+        run = lambda: columnar.build_cache(data_file_name, cache_dir=os.path.join('data', 'cold_cache'))
+    elif stage == 'get_examples':
+        columnar.load_columnar(data_file_name)
+        run = lambda: featurize.get_examples(data_file_name=data_file_name, dictionary_filename=dictionary_filename)
+    elif stage == 'normalize_features':
+        (features, labels), dev = get_model_data(rows_used, dtype=dtype)
+        run = lambda: regressions.normalize_features(features)
+    elif stage == 'get_knn_predictions':
+        train, dev = get_model_data(rows_used, dtype=dtype)
+        run = lambda: regressions.get_knn_predictions(train, dev)
+    elif stage == 'get_svm_predictions':
+        train, dev = get_model_data(rows_used, dtype=dtype)
+        run = lambda: regressions.get_svm_predictions(train, dev, n_jobs=n_jobs)
+    else:
+        raise ValueError('Unknown benchmark stage %s' % (stage))
+
+    setup_peak_rss_mb = get_peak_rss_mb()
+    start = time.time()
+    run()
+    seconds = time.time() - start
+    peak_rss_mb = get_peak_rss_mb()
+    return {
+        'stage': stage,
+        'rows': num_rows,
+        'rows_used': rows_used,
+        'columns': num_columns,
+        'dtype': dtype,
+        'seconds': seconds,
+        'rows_per_second': rows_used / seconds if seconds > 0 else None,
+        'peak_rss_mb': peak_rss_mb,
+        'stage_peak_rss_increase_mb': peak_rss_mb - setup_peak_rss_mb,
+    }
+
+
+def run_stage_subprocess(stage, num_rows, num_columns, n_jobs, benchmark_dir, dtype='float64'):
+    command = [
+        sys.executable, os.path.abspath(__file__), '--run-stage', stage,
+        '--scales', str(num_rows), '--columns', str(num_columns), '--n_jobs', str(n_jobs), '--dtype', dtype,
+    ]
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.abspath(__file__)), env.get('PYTHONPATH', '')])
+    output = subprocess.check_output(command, cwd=benchmark_dir, env=env)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def ensure_data(num_rows, num_columns, benchmark_dir):
+    data_file_name, dictionary_filename = get_data_file_names(num_rows, num_columns)
+    data_file_name = os.path.join(benchmark_dir, data_file_name)
+    dictionary_filename = os.path.join(benchmark_dir, dictionary_filename)
+    if not os.path.isdir(os.path.dirname(data_file_name)):
+        os.makedirs(os.path.dirname(data_file_name))
+    if not os.path.exists(data_file_name):
+        print 'Generating %s rows x %s columns of synthetic data...' % (num_rows, num_columns)
+        synthetic_data.generate_data(num_rows, data_file_name, dictionary_filename, num_columns=num_columns)
+
+
+def compare_results(results, baseline):
+    baseline_results = {
+        (result['stage'], result['rows'], result.get('dtype', 'float64')): result for result in baseline['results']
+    }
+    print '\n%-22s %8s %10s %10s %8s %10s' % ('stage', 'rows', 'seconds', 'baseline', 'ratio', 'peak MB')
+    for result in results:
+        key = (result['stage'], result['rows'], result.get('dtype', 'float64'))
+        baseline_seconds = baseline_results[key]['seconds'] if key in baseline_results else None
+        ratio = result['seconds'] / baseline_seconds if baseline_seconds else None
+        print '%-22s %8s %10.3f %10s %8s %10.1f' % (
+            result['stage'], result['rows'], result['seconds'],
+            '%.3f' % (baseline_seconds) if baseline_seconds is not None else '-',
+            '%.2fx' % (ratio) if ratio is not None else '-',
+            result['peak_rss_mb'])
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Benchmark pipeline stages on synthetic data')
+    parser.add_argument('--scales', default=','.join([str(scale) for scale in DEFAULT_SCALES]))
+    parser.add_argument('--columns', type=int, default=synthetic_data.DEFAULT_NUM_COLUMNS)
+    parser.add_argument('--stages', default=','.join(STAGES))
+    parser.add_argument('--n_jobs', type=int, default=1)
+    parser.add_argument('--dtype', default='float64', choices=['float64', 'float32'], help='feature dtype of the model stages')
+    parser.add_argument('--benchmark-dir', default=DEFAULT_BENCHMARK_DIR)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_FILENAME)
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--run-stage', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    scales = [int(scale) for scale in args.scales.split(',')]
+
+    if args.run_stage:
+        print json.dumps(run_stage(args.run_stage, scales[0], args.columns, args.n_jobs, args.dtype))
+        sys.exit(0)
+
+    results = []
+    for num_rows in scales:
+        stages = args.stages.split(',')
+        if any(stage not in MODEL_STAGES for stage in stages):
+            ensure_data(num_rows, args.columns, args.benchmark_dir)
+        for stage in stages:
+            print 'Running %s on %s rows...' % (stage, num_rows)
+            result = run_stage_subprocess(stage, num_rows, args.columns, args.n_jobs, args.benchmark_dir, args.dtype)
+            print '\t%.3fs, %.1f MB peak' % (result['seconds'], result['peak_rss_mb'])
+            results.append(result)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.platform(),
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+    print 'Wrote %s results to %s' % (len(results), args.output)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare_results(results, json.load(f))
@@ -0,0 +1,632 @@
+'''Columnar data cache module.
+
+This module converts a raw data file (for example data/MERGED2011_PP.csv) into
+a columnar on-disk cache so that later runs can memory-map it instead of
+parsing the text CSV again. The cache for a data file is a directory holding:
+
+    - meta.json: column names, row count, which columns are numeric, and the
+        size, modification time and SHA-1s of the source file it was built
+        from (one per appended segment of the file)
+    - strings_<i>.npy: the raw string values of column i
+    - values_<i>.npy: float values of column i (NaN where NULL or
+        PrivacySuppressed), only for columns whose other values all parse
+    - null_bitmap.npy, private_bitmap.npy: bit-packed masks with one row per
+        column marking NULL and PrivacySuppressed values respectively
+    - profile_<subset>.npz: ColumnProfile statistics for all rows or a
+        subset of them, saved as they are first requested
+    - chunk_<n>/: the strings, values and bitmaps (as above) of rows added
+        with append_rows()
+
+The cache is rebuilt whenever the source file's size changes, or its
+modification time changes and its contents hash differently. Rows appended
+with append_rows() extend the cache without a rebuild: they are written as a
+new chunk and only the appended bytes of the file are hashed. Chunks are
+merged like a binary counter, and into the main columns once they hold as
+many rows, so that each row is rewritten O(log(num_rows)) times in all.
+'''
+
+import csv
+import hashlib
+import json
+import numpy as np
+import os
+import shutil
+
+import instrument
+import read_data
+
+
+DEFAULT_CACHE_DIR = 'data/cache'
+CACHE_FORMAT_VERSION = 2
+
+# Number of rows transposed into columns at a time while building a cache
+BUILD_CHUNK_SIZE = 4096
+
+META_FILENAME = 'meta.json'
+NULL_BITMAP_FILENAME = 'null_bitmap.npy'
+PRIVATE_BITMAP_FILENAME = 'private_bitmap.npy'
+PROFILE_FILENAME_FORMAT = 'profile_%s.npz'
+CHUNK_DIRNAME_FORMAT = 'chunk_%s'
+SCRATCH_FILENAME = 'columns.tmp'
+
+
+def get_cache_path(data_file_name, cache_dir=DEFAULT_CACHE_DIR):
+    base_name = os.path.splitext(os.path.basename(data_file_name))[0]
+    return os.path.join(cache_dir, base_name)
+
+
+def hash_file(file_name, block_size=2 ** 20, start=0, stop=None):
+    '''SHA-1 of a file's bytes from start up to stop (by default the end).'''
+    sha1 = hashlib.sha1()
+    with open(file_name, 'rb') as f:
+        f.seek(start)
+        remaining = float('inf') if stop is None else stop - start
+        while remaining > 0:
+            block = f.read(int(min(block_size, remaining)))
+            if not block:
+                break
+            sha1.update(block)
+            remaining -= len(block)
+    return sha1.hexdigest()
+
+
+def hashes_match(data_file_name, hashes):
+    '''Check a file against segment hashes, a list of {'size': end offset,
+    'sha1': SHA-1 of the bytes since the previous segment's end}.'''
+    start = 0
+    for segment in hashes:
+        if hash_file(data_file_name, start=start, stop=segment['size']) != segment['sha1']:
+            return False
+        start = segment['size']
+    return True
+
+
+def get_content_hash(meta):
+    '''One SHA-1 identifying the source contents a cache was built from.'''
+    hashes = [segment['sha1'] for segment in meta['hashes']]
+    return hashes[0] if len(hashes) == 1 else hashlib.sha1(','.join(hashes)).hexdigest()
+
+
+def get_source_stamp(data_file_name):
+    stat = os.stat(data_file_name)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def is_float(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def is_missing(value):
+    return value == 'NULL' or value == 'PrivacySuppressed'
+
+
+def get_column_layouts(rows, num_keys):
+    '''First build pass: return per-column string widths and whether every
+    non-NULL/PrivacySuppressed value parses as a float.'''
+    num_rows = 0
+    widths = [1] * num_keys
+    numeric = [True] * num_keys
+    for row in rows:
+        if len(row) != num_keys:
+            raise ValueError('Data row %s has %s fields; expected %s' % (num_rows + 1, len(row), num_keys))
+        num_rows += 1
+        for i, value in enumerate(row):
+            if len(value) > widths[i]:
+                widths[i] = len(value)
+            if numeric[i] and not is_missing(value) and not is_float(value):
+                numeric[i] = False
+    return num_rows, widths, numeric
+
+
+def iter_chunks(rows, chunk_size=BUILD_CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_columns(cache_path, keys, rows, num_rows, widths, numeric):
+    '''Second build pass: fill the string columns chunk by chunk into one
+    memory-mapped scratch file, then save them one column at a time.
+
+    The kernel writes the filled pages back to the scratch file as needed,
+    so the columns are not held in memory (one mapping rather than one per
+    column keeps a wide file within the open file limit).'''
+    scratch_path = os.path.join(cache_path, SCRATCH_FILENAME)
+    offsets = np.concatenate([[0], np.cumsum([width * num_rows for width in widths])]).astype(np.int64)
+    scratch = np.memmap(scratch_path, dtype=np.uint8, mode='w+', shape=(max(1, offsets[-1]),))
+    columns = [
+        scratch[offsets[i]:offsets[i + 1]].view('S%s' % (width))
+        for i, width in enumerate(widths)
+    ]
+    start = 0
+    for chunk in iter_chunks(rows):
+        for i, values in enumerate(zip(*chunk)):
+            columns[i][start:start + len(chunk)] = values
+        start += len(chunk)
+    save_columns(cache_path, columns, num_rows, numeric)
+    del columns, scratch
+    os.remove(scratch_path)
+
+
+def save_columns(cache_path, columns, num_rows, numeric):
+    '''Save string columns, deriving the float columns and the
+    NULL/PrivacySuppressed bitmaps from them. columns may be a generator, so
+    that only one column need be in memory at a time.'''
+    num_bytes = (num_rows + 7) // 8
+    null_bitmap = np.zeros((len(numeric), num_bytes), dtype=np.uint8)
+    private_bitmap = np.zeros((len(numeric), num_bytes), dtype=np.uint8)
+    for i, column in enumerate(columns):
+        null_mask = column == 'NULL'
+        private_mask = column == 'PrivacySuppressed'
+        null_bitmap[i] = np.packbits(null_mask)
+        private_bitmap[i] = np.packbits(private_mask)
+        save_array(os.path.join(cache_path, 'strings_%s.npy' % (i)), column)
+        if numeric[i]:
+            values = np.zeros(num_rows)
+            present = ~(null_mask | private_mask)
+            values[present] = column[present].astype(float)
+            values[~present] = np.nan
+            save_array(os.path.join(cache_path, 'values_%s.npy' % (i)), values)
+    save_array(os.path.join(cache_path, NULL_BITMAP_FILENAME), null_bitmap)
+    save_array(os.path.join(cache_path, PRIVATE_BITMAP_FILENAME), private_bitmap)
+
+
+def save_array(file_name, array):
+    # Replace rather than overwrite, so arrays memory-mapped from the old
+    # file stay readable
+    temp_name = file_name + '.tmp'
+    with open(temp_name, 'wb') as f:
+        np.save(f, array)
+    os.rename(temp_name, file_name)
+
+
+def prepare_cache_path(cache_path):
+    '''Create a cache directory, or invalidate the cache already in it.'''
+    if not os.path.isdir(cache_path):
+        os.makedirs(cache_path)
+    meta_path = os.path.join(cache_path, META_FILENAME)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    remove_profiles(cache_path)
+
+
+def remove_profiles(cache_path):
+    for file_name in os.listdir(cache_path):
+        if file_name.startswith('profile_'):
+            os.remove(os.path.join(cache_path, file_name))
+
+
+def remove_chunks(cache_path, keep=()):
+    for file_name in os.listdir(cache_path):
+        if file_name.startswith(CHUNK_DIRNAME_FORMAT % ('')) and file_name not in keep:
+            shutil.rmtree(os.path.join(cache_path, file_name))
+
+
+def write_meta(cache_path, meta):
+    # Write then rename so an interrupted build never leaves a valid-looking cache
+    temp_name = os.path.join(cache_path, META_FILENAME + '.tmp')
+    with open(temp_name, 'w') as f:
+        json.dump(meta, f)
+    os.rename(temp_name, os.path.join(cache_path, META_FILENAME))
+
+
+@instrument.timed('build_cache')
+def build_cache(data_file_name=read_data.DEFAULT_DATA_FILE_NAME, cache_dir=DEFAULT_CACHE_DIR):
+    '''Convert a data file into a columnar cache and return its path.
+
+    The file is streamed twice, once to size the columns and once to fill
+    them into a memory-mapped scratch file (see write_columns), so neither
+    the rows nor the columns are ever held in memory as a whole.'''
+    cache_path = get_cache_path(data_file_name, cache_dir)
+    prepare_cache_path(cache_path)
+    remove_chunks(cache_path)
+
+    stamp = get_source_stamp(data_file_name)
+    keys = read_data.read_keys(data_file_name)
+    num_rows, widths, numeric = get_column_layouts(read_data.iter_rows(data_file_name), len(keys))
+    write_columns(cache_path, keys, read_data.iter_rows(data_file_name), num_rows, widths, numeric)
+
+    write_meta(cache_path, {
+        'version': CACHE_FORMAT_VERSION,
+        'source': os.path.abspath(data_file_name),
+        'size': stamp['size'],
+        'mtime': stamp['mtime'],
+        'hashes': [{'size': stamp['size'], 'sha1': hash_file(data_file_name, stop=stamp['size'])}],
+        'keys': keys,
+        'num_rows': num_rows,
+        'numeric': numeric,
+        'chunks': [],
+        'next_chunk': 0,
+    })
+    return cache_path
+
+
+def get_segment_numeric(segment_paths, num_columns):
+    '''Which columns have float values in every one of the segments.'''
+    return [
+        all(os.path.exists(os.path.join(path, 'values_%s.npy' % (i))) for path in segment_paths)
+        for i in xrange(num_columns)
+    ]
+
+
+def merge_segments(segment_paths, target_path, num_rows, num_columns):
+    '''Save the concatenated columns of several segments (the main columns
+    or chunks) to target_path, one column at a time.'''
+    numeric = get_segment_numeric(segment_paths, num_columns)
+
+    def iter_columns():
+        for i in xrange(num_columns):
+            yield np.concatenate([
+                np.load(os.path.join(path, 'strings_%s.npy' % (i)), mmap_mode='r') for path in segment_paths
+            ])
+    if not os.path.isdir(target_path):
+        os.makedirs(target_path)
+    save_columns(target_path, iter_columns(), num_rows, numeric)
+    for i in xrange(num_columns):
+        values_path = os.path.join(target_path, 'values_%s.npy' % (i))
+        if not numeric[i] and os.path.exists(values_path):
+            os.remove(values_path)
+
+
+def add_chunk(cache_path, meta, columns, num_rows):
+    '''Save new rows' columns as a chunk and merge chunks as needed. Returns
+    the updated meta (not yet written) and whether the chunks now hold as
+    many rows as the main columns, and should be compacted into them.'''
+    meta = dict(meta)
+    chunks = list(meta['chunks'])
+    base_rows = meta['num_rows'] - sum(chunk['num_rows'] for chunk in chunks)
+
+    def next_chunk_name():
+        meta['next_chunk'] += 1
+        return CHUNK_DIRNAME_FORMAT % (meta['next_chunk'] - 1)
+
+    name = next_chunk_name()
+    os.makedirs(os.path.join(cache_path, name))
+    numeric = [
+        is_numeric_column(column[~((column == 'NULL') | (column == 'PrivacySuppressed'))])
+        for column in columns
+    ]
+    save_columns(os.path.join(cache_path, name), columns, num_rows, numeric)
+    chunks.append({'name': name, 'num_rows': num_rows})
+
+    # Keep each chunk more than twice the size of the next, so that there
+    # are O(log(num_rows)) of them
+    while len(chunks) > 1 and chunks[-2]['num_rows'] <= 2 * chunks[-1]['num_rows']:
+        name = next_chunk_name()
+        merged_rows = chunks[-2]['num_rows'] + chunks[-1]['num_rows']
+        merge_segments(
+            [os.path.join(cache_path, chunk['name']) for chunk in chunks[-2:]],
+            os.path.join(cache_path, name), merged_rows, len(columns))
+        instrument.count('cache_chunks_merged')
+        chunks[-2:] = [{'name': name, 'num_rows': merged_rows}]
+    meta['chunks'] = chunks
+    return meta, sum(chunk['num_rows'] for chunk in chunks) >= base_rows
+
+
+def compact_chunks(cache_path, meta):
+    '''Merge every chunk into the main columns, writing meta after.'''
+    prepare_cache_path(cache_path)
+    merge_segments(
+        [cache_path] + [os.path.join(cache_path, chunk['name']) for chunk in meta['chunks']],
+        cache_path, meta['num_rows'], len(meta['keys']))
+    instrument.count('cache_compactions')
+    meta['chunks'] = []
+    write_meta(cache_path, meta)
+    remove_chunks(cache_path)
+
+
+@instrument.timed('append_rows')
+def append_rows(data_file_name, rows, keys=None, cache_dir=DEFAULT_CACHE_DIR):
+    '''Append rows to a data file and extend its columnar cache to match,
+    without parsing or rewriting the rows already in the file.
+
+    rows are lists of strings in the order of keys (by default the file's
+    own keys); file keys missing from keys are written as NULL. Returns the
+    updated ColumnarData.'''
+    data = load_columnar(data_file_name, cache_dir)
+    if keys is not None:
+        unknown_keys = [key for key in keys if key not in data.key_indices]
+        if unknown_keys:
+            raise ValueError('Keys %s are not in %s' % (', '.join(unknown_keys), data_file_name))
+        key_indices = {key: i for i, key in enumerate(keys)}
+        rows = [
+            [row[key_indices[key]] if key in key_indices else 'NULL' for key in data.keys]
+            for row in rows
+        ]
+    for row in rows:
+        if len(row) != len(data.keys):
+            raise ValueError('Appended row has %s fields; expected %s' % (len(row), len(data.keys)))
+    if not rows:
+        return data
+    old_size = os.path.getsize(data_file_name)
+    with open(data_file_name, 'ab') as f:
+        csv.writer(f, lineterminator='\r\n').writerows(rows)
+    instrument.count('rows_appended', len(rows))
+
+    cache_path = data.cache_path
+    columns = [np.array(values, dtype=str) for values in zip(*rows)]
+    meta, compact = add_chunk(cache_path, data.meta, columns, len(rows))
+    stamp = get_source_stamp(data_file_name)
+    meta.update({
+        'size': stamp['size'],
+        'mtime': stamp['mtime'],
+        'hashes': meta['hashes'] + [{'size': stamp['size'], 'sha1': hash_file(data_file_name, start=old_size)}],
+        'num_rows': data.num_rows + len(rows),
+        'numeric': [
+            numeric and column_numeric
+            for numeric, column_numeric in zip(meta['numeric'], get_segment_numeric(
+                [os.path.join(cache_path, meta['chunks'][-1]['name'])], len(columns)))
+        ],
+    })
+    if compact:
+        compact_chunks(cache_path, meta)
+    else:
+        remove_profiles(cache_path)
+        write_meta(cache_path, meta)
+        remove_chunks(cache_path, keep=[chunk['name'] for chunk in meta['chunks']])
+    return ColumnarData(cache_path)
+
+
+def is_cache_valid(data_file_name, cache_path):
+    '''Check a cache against its source file, refreshing the stored
+    modification time when only that changed.'''
+    meta_path = os.path.join(cache_path, META_FILENAME)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    stamp = get_source_stamp(data_file_name)
+    if meta.get('version') != CACHE_FORMAT_VERSION or meta['size'] != stamp['size']:
+        return False
+    if meta['mtime'] == stamp['mtime']:
+        return True
+    if not hashes_match(data_file_name, meta['hashes']):
+        return False
+    meta['mtime'] = stamp['mtime']
+    write_meta(cache_path, meta)
+    return True
+
+
+def load_columnar(data_file_name=read_data.DEFAULT_DATA_FILE_NAME, cache_dir=DEFAULT_CACHE_DIR):
+    '''Return ColumnarData for a data file, building or rebuilding its cache if needed.'''
+    cache_path = get_cache_path(data_file_name, cache_dir)
+    if not is_cache_valid(data_file_name, cache_path):
+        print 'Building columnar cache for %s...' % (data_file_name)
+        build_cache(data_file_name, cache_dir)
+    return ColumnarData(cache_path)
+
+
+class ColumnarData(object):
+    '''Memory-mapped view of a columnar cache directory.
+
+    Columns of a cache with appended chunks are the concatenation of the
+    main column and the chunks' columns (a copy rather than a memory map).'''
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        with open(os.path.join(cache_path, META_FILENAME), 'r') as f:
+            self.meta = json.load(f)
+        self.keys = [str(key) for key in self.meta['keys']]
+        self.num_rows = self.meta['num_rows']
+        self.key_indices = {key: i for i, key in enumerate(self.keys)}
+        chunks = self.meta.get('chunks', [])
+        # (directory, number of rows) of the main columns and of each chunk
+        self.segments = [(cache_path, self.num_rows - sum(chunk['num_rows'] for chunk in chunks))] + [
+            (os.path.join(cache_path, chunk['name']), chunk['num_rows']) for chunk in chunks
+        ]
+        self.bitmaps = {}
+
+    def load_array(self, file_name):
+        '''Memory-map an array of every segment, concatenating them if there
+        are chunks.'''
+        arrays = [np.load(os.path.join(path, file_name), mmap_mode='r') for path, _ in self.segments]
+        return arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+
+    def load_bitmap(self, file_name):
+        if len(self.segments) == 1:
+            return np.load(os.path.join(self.cache_path, file_name), mmap_mode='r')
+        if file_name not in self.bitmaps:
+            self.bitmaps[file_name] = np.packbits(np.concatenate([
+                np.unpackbits(np.load(os.path.join(path, file_name), mmap_mode='r'), axis=1)[:, :num_rows]
+                for path, num_rows in self.segments
+            ], axis=1), axis=1)
+        return self.bitmaps[file_name]
+
+    @property
+    def null_bitmap(self):
+        return self.load_bitmap(NULL_BITMAP_FILENAME)
+
+    @property
+    def private_bitmap(self):
+        return self.load_bitmap(PRIVATE_BITMAP_FILENAME)
+
+    def column_index(self, key):
+        return key if isinstance(key, int) else self.key_indices[key]
+
+    def is_numeric(self, key):
+        return self.meta['numeric'][self.column_index(key)]
+
+    def strings(self, key):
+        '''Raw string values of a column.'''
+        return self.load_array('strings_%s.npy' % (self.column_index(key)))
+
+    def values(self, key):
+        '''Float values of a numeric column, NaN where NULL or PrivacySuppressed.'''
+        i = self.column_index(key)
+        if not self.meta['numeric'][i]:
+            raise ValueError('Column %s is not numeric' % (self.keys[i]))
+        return self.load_array('values_%s.npy' % (i))
+
+    def unpack(self, file_name, key):
+        '''Unpack one column of a bitmap, segment by segment.'''
+        i = self.column_index(key)
+        return np.concatenate([
+            np.unpackbits(np.load(os.path.join(path, file_name), mmap_mode='r')[i])[:num_rows]
+            for path, num_rows in self.segments
+        ]).astype(bool)
+
+    def private_mask(self, key):
+        return self.unpack(PRIVATE_BITMAP_FILENAME, key)
+
+    def null_mask(self, key, count_private_as_null=True):
+        '''Boolean mask of rows whose value is NULL (or PrivacySuppressed,
+        matching read_data.is_null's default).'''
+        mask = self.unpack(NULL_BITMAP_FILENAME, key)
+        if count_private_as_null:
+            mask |= self.private_mask(key)
+        return mask
+
+    def get_filtered_row_indices(self, required_keys=read_data.DEFAULT_REQUIRED_KEYS, get_unlabeled=True):
+        '''Row indices that read_data.get_filtered_rows would select.'''
+        has_null_required = np.zeros(self.num_rows, dtype=bool)
+        for key in required_keys:
+            has_null_required |= self.null_mask(key)
+        return np.flatnonzero(has_null_required == get_unlabeled)
+
+    def rows(self, row_indices=None, selected_keys=None):
+        '''Rebuild rows as lists of strings, as read_data returns them.'''
+        selected_keys = self.keys if selected_keys is None else selected_keys
+        columns = []
+        for key in selected_keys:
+            column = self.strings(key)
+            if row_indices is not None:
+                column = column[row_indices]
+            columns.append(column.tolist())
+        if not columns:
+            return []
+        return [list(row) for row in zip(*columns)]
+
+    def get_profile(self, row_indices=None):
+        '''Return the ColumnProfile of the given rows (all rows by default),
+        computing it on first use and caching it next to the columns.'''
+        subset_hash = 'all' if row_indices is None else hashlib.sha1(
+            np.ascontiguousarray(row_indices, dtype=np.int64).tostring()).hexdigest()
+        profile_path = os.path.join(self.cache_path, PROFILE_FILENAME_FORMAT % (subset_hash))
+        if os.path.exists(profile_path):
+            return ColumnProfile.load(profile_path)
+        profile = ColumnProfile.from_columnar(self, row_indices)
+        profile.save(profile_path)
+        return profile
+
+
+class ColumnProfile(object):
+    '''Per-column statistics gathered in a single sweep over the data: NULL
+    count, PrivacySuppressed count, number of distinct values, and whether
+    every other value parses as a float.'''
+
+    def __init__(self, keys, num_rows, null_counts, private_counts, distinct_counts, numeric):
+        self.keys = list(keys)
+        self.num_rows = num_rows
+        self.null_counts = np.asarray(null_counts)
+        self.private_counts = np.asarray(private_counts)
+        self.distinct_counts = np.asarray(distinct_counts)
+        self.numeric = np.asarray(numeric, dtype=bool)
+
+    @staticmethod
+    def from_rows(rows, keys):
+        '''Profile rows of strings (for example from read_data.iter_rows) in one streaming pass.'''
+        num_rows = 0
+        null_counts = [0] * len(keys)
+        private_counts = [0] * len(keys)
+        distinct_values = [set() for _ in keys]
+        numeric = [True] * len(keys)
+        for row in rows:
+            num_rows += 1
+            for i, value in enumerate(row):
+                distinct_values[i].add(value)
+                if value == 'NULL':
+                    null_counts[i] += 1
+                elif value == 'PrivacySuppressed':
+                    private_counts[i] += 1
+                elif numeric[i] and not is_float(value):
+                    numeric[i] = False
+        return ColumnProfile(
+            keys, num_rows, null_counts, private_counts,
+            [len(values) for values in distinct_values], numeric)
+
+    @staticmethod
+    def from_columns(keys, get_column, num_rows):
+        '''Profile columns given as string arrays, get_column(key), with vectorized counts.'''
+        null_counts, private_counts, distinct_counts, numeric = [], [], [], []
+        for key in keys:
+            column = get_column(key)
+            null_mask = column == 'NULL'
+            private_mask = column == 'PrivacySuppressed'
+            null_counts.append(np.count_nonzero(null_mask))
+            private_counts.append(np.count_nonzero(private_mask))
+            distinct_counts.append(len(np.unique(column)))
+            numeric.append(is_numeric_column(column[~(null_mask | private_mask)]))
+        return ColumnProfile(keys, num_rows, null_counts, private_counts, distinct_counts, numeric)
+
+    @staticmethod
+    def from_columnar(data, row_indices=None):
+        '''Profile ColumnarData (optionally a subset of its rows) from its
+        bitmaps, reusing the cached numeric columns where possible.'''
+        num_rows = data.num_rows if row_indices is None else len(row_indices)
+        select = (lambda array: array) if row_indices is None else (lambda array: array[row_indices])
+        null_counts, private_counts, distinct_counts, numeric = [], [], [], []
+        for i in xrange(len(data.keys)):
+            null_mask = select(data.null_mask(i, count_private_as_null=False))
+            private_mask = select(data.private_mask(i))
+            column = select(data.strings(i))
+            null_counts.append(np.count_nonzero(null_mask))
+            private_counts.append(np.count_nonzero(private_mask))
+            distinct_counts.append(len(np.unique(column)))
+            numeric.append(data.is_numeric(i) or is_numeric_column(column[~(null_mask | private_mask)]))
+        return ColumnProfile(data.keys, num_rows, null_counts, private_counts, distinct_counts, numeric)
+
+    def merge(self, other):
+        '''Profile of the rows of this profile and another of the same keys.
+
+        Distinct counts cannot be combined from counts alone, so the merged
+        profile keeps the larger of the two as a lower bound.'''
+        if other.keys != self.keys:
+            raise ValueError('Cannot merge profiles of different keys')
+        return ColumnProfile(
+            self.keys, self.num_rows + other.num_rows,
+            self.null_counts + other.null_counts,
+            self.private_counts + other.private_counts,
+            np.maximum(self.distinct_counts, other.distinct_counts),
+            self.numeric & other.numeric)
+
+    def missing_counts(self):
+        '''Number of NULL or PrivacySuppressed values per column.'''
+        return self.null_counts + self.private_counts
+
+    def all_null_keys(self):
+        return set([key for key, count in zip(self.keys, self.null_counts) if count == self.num_rows])
+
+    def privacy_suppressed_keys(self):
+        return set([key for key, count in zip(self.keys, self.private_counts) if count > 0])
+
+    def save(self, file_name):
+        # np.savez adds '.npz' to names without it, so write through a file object
+        with open(file_name, 'wb') as f:
+            np.savez(
+                f, keys=np.array(self.keys), num_rows=self.num_rows,
+                null_counts=self.null_counts, private_counts=self.private_counts,
+                distinct_counts=self.distinct_counts, numeric=self.numeric)
+
+    @staticmethod
+    def load(file_name):
+        with np.load(file_name) as arrays:
+            return ColumnProfile(
+                arrays['keys'].tolist(), int(arrays['num_rows']), arrays['null_counts'],
+                arrays['private_counts'], arrays['distinct_counts'], arrays['numeric'])
+
+
+def is_numeric_column(values):
+    try:
+        values.astype(float)
+        return True
+    except ValueError:
+        return False
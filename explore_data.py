@@ -1,6 +1,7 @@
-from collections import Counter
 from matplotlib import pyplot as plt
-import csv
+import columnar
+import null_profile
+import read_data
 
 
 DICTIONARY_FILENAME = 'data/CollegeScorecardDataDictionary-09-12-2015.csv'
@@ -11,45 +12,34 @@ NAME_KEY_INDEX = 3
 def is_null(row, key, count_private_as_null=True):
     return row[key] == 'NULL' or (count_private_as_null and row[key] == 'PrivacySuppressed')
 
-def explore_nulls(keys, rows):
-    debt_key = keys.index('GRAD_DEBT_MDN')
-    earnings_key = keys.index('md_earn_wne_p6')
-    degrees_key = keys.index('CIP01ASSOC')
-    pcip_key = keys.index('PCIP01')
-    rows = [row for row in rows if (
-                not is_null(row, debt_key)
-                and not is_null(row, earnings_key)
-                and not is_null(row, degrees_key)
-                and not is_null(row, pcip_key)
-            )]
+def explore_nulls(data, required_keys=read_data.DEFAULT_REQUIRED_KEYS):
+    profile = null_profile.NullProfile(data)
+    keys = data.keys
+    row_mask = profile.get_row_mask(required_keys)
+    num_rows = profile.count_rows(row_mask)
 
     num_null = {key: 0 for key in keys}
-    both_debt_and_earnings_count = 0
+    both_debt_and_earnings_count = profile.count_rows(
+        row_mask & ~profile.get_rows_missing_any(['GRAD_DEBT_MDN', 'md_earn_wne_p6']))
     max_key_index = keys.index('RPY_1YR_RT')
-    for row in rows:
-        if not (row[debt_key] == 'NULL' or row[debt_key] == 'PrivacySuppressed') and not (
-            row[earnings_key] == 'NULL' or row[earnings_key] == 'PrivacySuppressed'):
-            both_debt_and_earnings_count += 1
-        for i in xrange(max_key_index): #xrange(len(keys)):
-            if is_null(row, i):
-                num_null[keys[i]] += 1
+    missing_counts = profile.missing_counts(row_mask)
+    for i in xrange(max_key_index): #xrange(len(keys)):
+        num_null[keys[i]] += missing_counts[i]
     keys_by_nullity = sorted(keys, key=lambda k: num_null[k])
-    print '%s of %s schools have the debt and earnings fields' % (both_debt_and_earnings_count, len(rows))
+    print '%s of %s schools have the debt and earnings fields' % (both_debt_and_earnings_count, num_rows)
 
-    preddeg_key = keys.index('PREDDEG')
-    preddegs = [row[preddeg_key] for row in rows]
-    print Counter(preddegs)
-    sat_scores = []
-    adm_rates = []
-    sat_key = keys.index('SAT_AVG')
-    adm_key = keys.index('ADM_RATE')
-    for row in rows:
-        if not is_null(row, sat_key):
-            sat_scores.append(row[preddeg_key])
-        if not is_null(row, adm_key):
-            adm_rates.append(row[preddeg_key])
-    print Counter(sat_scores)
-    print Counter(adm_rates)
+    print profile.value_counts('PREDDEG', row_mask)
+    print profile.value_counts('PREDDEG', row_mask & ~profile.get_rows_missing_any(['SAT_AVG']))
+    print profile.value_counts('PREDDEG', row_mask & ~profile.get_rows_missing_any(['ADM_RATE']))
+
+    p8_keys = profile.get_keys_matching('_earn_wne_p8')
+    if p8_keys:
+        no_p8_mask = row_mask & profile.get_rows_missing_all(p8_keys)
+        print '%s of %s schools have none of the %s _earn_wne_p8 fields' % (profile.count_rows(no_p8_mask), num_rows, len(p8_keys))
+        print profile.value_counts('PREDDEG', no_p8_mask)
+        for pattern, count in profile.missing_patterns(p8_keys, row_mask)[:5]:
+            missing_keys = [key for key, missing in zip(p8_keys, pattern) if missing]
+            print '%5s schools missing %s' % (count, ', '.join(missing_keys) or 'none')
 
     reverse_counts = {}
     nulls_arr = []
@@ -62,13 +52,6 @@ def explore_nulls(keys, rows):
             reverse_counts[null_count] = 0
         reverse_counts[null_count] += 1
     
-    '''
-    keys_2159 = [keys.index(key) for key in keys if '_earn_wne_p8' in key]
-    for row in rows:
-        if all([row[k] == 'NULL' or row[k] == 'PrivacySuppressed' for k in keys_2159]):
-            print '%s --- %s' % (row[NAME_KEY_INDEX], row[keys.index('PREDDEG')])
-    '''
-
     plt.title('Keys that are non-NULL for at least one school')
     plt.xlabel('Number of schools for which key is NULL')
     plt.ylabel('Number of keys')
@@ -76,7 +59,7 @@ def explore_nulls(keys, rows):
     plt.show()
 
     with open('key_null_counts.txt', 'w') as outfile:
-        outfile.write('Total schools: %s\n' % (len(rows)))
+        outfile.write('Total schools: %s\n' % (num_rows))
         outfile.write('Total number of keys: %s\n' % (len(keys)))
         outfile.write('Reverse counts: number of null to number of fields with that number null:\n')
         for null_count in sorted(reverse_counts):
@@ -85,12 +68,10 @@ def explore_nulls(keys, rows):
         for key in keys_by_nullity:
             outfile.write('%5s %s\n' % (num_null[key], key))
         outfile.write('School names')
-        for row in rows:
-            outfile.write('%s\n' % (row[NAME_KEY_INDEX]))
+        for name in data.strings(NAME_KEY_INDEX)[profile.get_row_indices(row_mask)]:
+            outfile.write('%s\n' % (name))
 
 
 if __name__ == '__main__':
-    with open(DATA_FILENAME, 'r') as data_file:
-        raw_rows = [row for row in csv.reader(data_file)]
-        keys, rows = raw_rows[0], raw_rows[1:]
-        # explore_nulls(keys, rows)
\ No newline at end of file
+    data = columnar.load_columnar(DATA_FILENAME)
+    # explore_nulls(data)
\ No newline at end of file
@@ -0,0 +1,115 @@
+'''Feature artifact module.
+
+Featurized examples are handed from featurize.py to regressions.py as a
+directory of raw .npy arrays plus a JSON header, so that regressions can
+memory-map them instead of re-parsing CSV text. An artifact directory holds:
+
+    - header.json: feature, label and privacy-suppressed feature names, the
+        number of examples and the feature dtype
+    - features.npy: one row of feature values per example (float64, or
+        float32 from featurize.py --float32), or instead
+        features_sparse.npz: the same as a scipy.sparse CSR matrix
+    - labels.npy: one row of label values per example (NaN if unlabeled)
+    - privacy_suppressed_features.npy: PrivacySuppressed-coded features
+
+Run as a script to convert existing feature and label CSV files:
+
+    python feature_artifacts.py out_features.csv out_labels.csv [artifact_dir]
+'''
+
+import csv
+import json
+import numpy as np
+import os
+import scipy.sparse
+import sys
+
+
+DEFAULT_ARTIFACT_DIR = 'features'
+
+HEADER_FILENAME = 'header.json'
+FEATURES_FILENAME = 'features.npy'
+SPARSE_FEATURES_FILENAME = 'features_sparse.npz'
+LABELS_FILENAME = 'labels.npy'
+PRIVACY_SUPPRESSED_FILENAME = 'privacy_suppressed_features.npy'
+
+
+def write_artifact(features, feature_names, labels, label_names, privacy_suppressed_values=None, privacy_suppressed_names=None, artifact_dir=DEFAULT_ARTIFACT_DIR):
+    if not os.path.isdir(artifact_dir):
+        os.makedirs(artifact_dir)
+    sparse = scipy.sparse.issparse(features)
+    # Features keep a float dtype such as float32; anything else is stored as float64
+    dtype = getattr(features, 'dtype', None)
+    dtype = dtype if dtype is not None and dtype.kind == 'f' else np.float64
+    features = features.tocsr().astype(dtype) if sparse else np.asarray(features, dtype=dtype)
+    if privacy_suppressed_values is None:
+        privacy_suppressed_values = np.zeros((features.shape[0], 0), dtype=dtype)
+        privacy_suppressed_names = []
+    # Only one of the dense and sparse feature files is kept
+    for file_name in [FEATURES_FILENAME, SPARSE_FEATURES_FILENAME]:
+        if os.path.exists(os.path.join(artifact_dir, file_name)):
+            os.remove(os.path.join(artifact_dir, file_name))
+    if sparse:
+        scipy.sparse.save_npz(os.path.join(artifact_dir, SPARSE_FEATURES_FILENAME), features)
+    else:
+        np.save(os.path.join(artifact_dir, FEATURES_FILENAME), features)
+    np.save(os.path.join(artifact_dir, LABELS_FILENAME), np.asarray(labels, dtype=float))
+    np.save(os.path.join(artifact_dir, PRIVACY_SUPPRESSED_FILENAME), np.asarray(privacy_suppressed_values, dtype=dtype))
+    with open(os.path.join(artifact_dir, HEADER_FILENAME), 'w') as f:
+        json.dump({
+            'num_examples': features.shape[0],
+            'sparse': sparse,
+            'dtype': np.dtype(dtype).name,
+            'feature_names': list(feature_names),
+            'label_names': list(label_names),
+            'privacy_suppressed_names': list(privacy_suppressed_names),
+        }, f)
+
+
+def artifact_exists(artifact_dir=DEFAULT_ARTIFACT_DIR):
+    return os.path.exists(os.path.join(artifact_dir, HEADER_FILENAME))
+
+
+def read_artifact(artifact_dir=DEFAULT_ARTIFACT_DIR, mmap_mode='c'):
+    '''Return (header, features, labels, privacy_suppressed_values).
+
+    Arrays are memory-mapped copy-on-write by default, so callers may modify
+    them (for example to normalize in place) without touching the files.
+    Sparse features are loaded into memory as a CSR matrix.'''
+    with open(os.path.join(artifact_dir, HEADER_FILENAME), 'r') as f:
+        header = json.load(f)
+    for names_key in ['feature_names', 'label_names', 'privacy_suppressed_names']:
+        header[names_key] = [str(name) for name in header[names_key]]
+    load = lambda file_name: np.load(os.path.join(artifact_dir, file_name), mmap_mode=mmap_mode)
+    if header.get('sparse'):
+        features = scipy.sparse.load_npz(os.path.join(artifact_dir, SPARSE_FEATURES_FILENAME)).tocsr()
+    else:
+        features = load(FEATURES_FILENAME)
+    return header, features, load(LABELS_FILENAME), load(PRIVACY_SUPPRESSED_FILENAME)
+
+
+def read_feature_selection(feature_selection):
+    '''Return the indices of features kept by a feature-selection mask file
+    (a single line of comma-separated 0/1 flags, one per feature).'''
+    with open(feature_selection, 'r') as f:
+        mask = [int(s.strip()) for s in f.read().strip().split(',')]
+    return np.flatnonzero(mask)
+
+
+def write_feature_selection(mask, feature_selection):
+    with open(feature_selection, 'w') as f:
+        f.write(','.join(['1' if keep else '0' for keep in mask]))
+
+
+def read_csv_matrix(filename):
+    with open(filename, 'r') as f:
+        raw_rows = [row for row in csv.reader(f)]
+    return raw_rows[0], np.array([[float(val) for val in row] for row in raw_rows[1:]])
+
+
+if __name__=='__main__':
+    feature_names, features = read_csv_matrix(sys.argv[1])
+    label_names, labels = read_csv_matrix(sys.argv[2])
+    artifact_dir = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_ARTIFACT_DIR
+    write_artifact(features, feature_names, labels, label_names, artifact_dir=artifact_dir)
+    print 'Wrote %s examples with %s features to %s' % (len(features), len(feature_names), artifact_dir)
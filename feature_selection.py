@@ -0,0 +1,124 @@
+'''Feature selection module.
+
+Computes per-column statistics of a feature matrix in one vectorized pass
+(over blocks of columns) and turns the chosen filters into a single column
+mask:
+
+    - positive count: rows with a value above 0 (find_all_0_features)
+    - distinct count: number of different values (a column with one value
+        carries no information)
+    - variance
+    - availability: fraction of rows not coded -1.0, the PrivacySuppressed
+        marker of the PrivacySuppressed-coded features
+
+The mask is saved in the comma-separated 0/1 form that
+regressions.read_features_and_labels(feature_selection=...) reads:
+
+    python feature_selection.py --min-distinct 2 --output feature_selection.csv
+
+Such masks select among the regular features, in which -1.0 is an ordinary
+value, so the command line has no availability filter; featurize.py applies
+that one to the PrivacySuppressed-coded features
+(filter_privacy_suppressed_features).
+'''
+
+import argparse
+import numpy as np
+import scipy.sparse
+
+import feature_artifacts
+
+
+DEFAULT_SELECTION_FILENAME = 'feature_selection.csv'
+PRIVACY_SUPPRESSED_VALUE = -1.0
+
+# Columns of the feature matrix processed at a time
+COLUMN_BLOCK_SIZE = 256
+
+
+class ColumnStats(object):
+    '''Per-column statistics of a feature matrix.'''
+
+    def __init__(self, num_rows, positive_counts, distinct_counts, variances, available_counts):
+        self.num_rows = num_rows
+        self.positive_counts = positive_counts
+        self.distinct_counts = distinct_counts
+        self.variances = variances
+        self.available_counts = available_counts
+
+    @staticmethod
+    def from_matrix(features, block_size=COLUMN_BLOCK_SIZE):
+        '''Compute the statistics of a 2D array (or sparse matrix) of features,
+        one block of columns at a time.'''
+        if not scipy.sparse.issparse(features):
+            features = np.asarray(features)
+            if features.dtype.kind != 'f':
+                features = features.astype(float)
+        num_rows, num_columns = features.shape
+        positive_counts = np.zeros(num_columns, dtype=np.int64)
+        distinct_counts = np.zeros(num_columns, dtype=np.int64)
+        variances = np.zeros(num_columns)
+        available_counts = np.zeros(num_columns, dtype=np.int64)
+        for start in xrange(0, num_columns, block_size):
+            block = features[:, start:start + block_size]
+            block = block.toarray() if scipy.sparse.issparse(block) else block
+            stop = start + block.shape[1]
+            positive_counts[start:stop] = np.count_nonzero(block > 0, axis=0)
+            available_counts[start:stop] = np.count_nonzero(block != PRIVACY_SUPPRESSED_VALUE, axis=0)
+            if num_rows:
+                variances[start:stop] = block.var(axis=0, dtype=np.float64)
+                sorted_block = np.sort(block, axis=0)
+                distinct_counts[start:stop] = 1 + np.count_nonzero(sorted_block[1:] != sorted_block[:-1], axis=0)
+        return ColumnStats(num_rows, positive_counts, distinct_counts, variances, available_counts)
+
+    def available_fractions(self):
+        if self.num_rows == 0:
+            return np.zeros(len(self.available_counts))
+        return self.available_counts / float(self.num_rows)
+
+    def get_mask(self, min_positive=None, min_distinct=None, min_variance=None, required_available=None):
+        '''Boolean mask of the columns passing every filter that is set: at
+        least min_positive positive values, min_distinct distinct values,
+        variance above min_variance, and a fraction of at least
+        required_available of values that are not PrivacySuppressed.'''
+        mask = np.ones(len(self.distinct_counts), dtype=bool)
+        if min_positive is not None:
+            mask &= self.positive_counts >= min_positive
+        if min_distinct is not None:
+            mask &= self.distinct_counts >= min_distinct
+        if min_variance is not None:
+            mask &= self.variances > min_variance
+        if required_available is not None:
+            mask &= self.available_fractions() >= required_available
+        return mask
+
+
+def select_columns(features, mask):
+    '''Apply a column mask to a 2D array, a sparse matrix or a list of rows,
+    returning the same kind of value.'''
+    indices = np.flatnonzero(mask)
+    if scipy.sparse.issparse(features) or isinstance(features, np.ndarray):
+        return features[:, indices]
+    if len(features) == 0:
+        return []
+    return np.asarray(features)[:, indices].tolist()
+
+
+def select_names(names, mask):
+    return [name for name, keep in zip(names, mask) if keep]
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Select features of the featurize.py artifact by column statistics')
+    parser.add_argument('--artifact-dir', default=feature_artifacts.DEFAULT_ARTIFACT_DIR)
+    parser.add_argument('--min-positive', type=int)
+    parser.add_argument('--min-distinct', type=int, default=2)
+    parser.add_argument('--min-variance', type=float)
+    parser.add_argument('--output', default=DEFAULT_SELECTION_FILENAME)
+    args = parser.parse_args()
+
+    header, features, labels, privacy_suppressed_values = feature_artifacts.read_artifact(args.artifact_dir)
+    stats = ColumnStats.from_matrix(features)
+    mask = stats.get_mask(args.min_positive, args.min_distinct, args.min_variance)
+    feature_artifacts.write_feature_selection(mask, args.output)
+    print 'Kept %s of %s features; wrote selection to %s' % (np.count_nonzero(mask), len(mask), args.output)
@@ -14,11 +14,21 @@ be predicted). Featurization steps include:
         case)
 '''
 
+import columnar
+import cPickle as pickle
 import csv
+import feature_artifacts
+import feature_selection
+import instrument
+import numpy as np
 import read_data
+import regressions
+import scipy.sparse
+import sys
 
 
 DICTIONARY_FILENAME = 'data/CollegeScorecardDataDictionary-09-12-2015.csv'
+TRANSFORMER_FILENAME = 'feature_transformer.pickle'
 
 LABEL_KEYS = [
     'GRAD_DEBT_MDN',
@@ -62,7 +72,7 @@ def get_categorical_keys(key_rows):
     return categorical_keys
 
 
-def get_non_feature_keys(rows, keys, key_row_lookup):
+def get_non_feature_keys(rows, keys, key_row_lookup, profile=None):
     prediction_keys = set([
         key for key in keys
         if key in key_row_lookup and is_prediction_key(key_row_lookup[key])
@@ -71,10 +81,9 @@ def get_non_feature_keys(rows, keys, key_row_lookup):
         key for key in keys
         if key.endswith('_N')
     ])
-    all_null_keys = set([
-        keys[i] for i in xrange(len(keys))
-        if all([is_null(row, i) for row in rows])
-    ])
+    if profile is None:
+        profile = columnar.ColumnProfile.from_rows(rows, keys)
+    all_null_keys = profile.all_null_keys()
     non_numerical_keys = set(['INSTNM', 'STABBR', 'ZIP', 'CITY'])
     
     non_feature_keys = prediction_keys.union(
@@ -84,134 +93,403 @@ def get_non_feature_keys(rows, keys, key_row_lookup):
     return non_feature_keys
 
 
-def get_examples(label_keys=LABEL_KEYS):
-    rows, keys = read_data.get_filtered_rows()
-
-    with open(DICTIONARY_FILENAME, 'r') as dict_file:
-        key_rows = [row for row in csv.reader(dict_file)][1:]
+def read_key_rows(dictionary_filename=DICTIONARY_FILENAME):
+    with open(dictionary_filename, 'r') as dict_file:
+        return [row for row in csv.reader(dict_file)][1:]
+
+
+def get_feature_layout(keys, non_feature_keys, privacy_suppressed_keys, categorical_keys):
+    '''Work out the output columns of get_examples once for all rows.
+
+    Returns (feature_layout, privacy_suppressed_layout), each a list of
+    (feature name, key, kind, category value) tuples sorted by feature name.
+    kind is one of 'value', 'is_null', 'category' or 'privacy_suppressed'.
+    As with the per-row feature dicts this replaces, a later definition of a
+    feature name wins over an earlier one.'''
+    features = {}
+    privacy_suppressed_features = {}
+    for key in keys:
+        if key in non_feature_keys:
+            continue
+        if key in privacy_suppressed_keys:
+            privacy_suppressed_features[key] = (key, 'privacy_suppressed', None)
+            continue
+        is_null_key = '%s_is_NULL' % (key)
+        if key in categorical_keys:
+            features[is_null_key] = (key, 'is_null', None)
+            for category_value, category_label in categorical_keys[key]:
+                category_key = '%s = %s' % (key, category_label)
+                features[category_key] = (key, 'category', category_value)
+        else: # Non-categorical keys
+            # TODO: alternative ways of dealing with PrivacySuppressed?
+            features[key] = (key, 'value', None)
+            features[is_null_key] = (key, 'is_null', None)
+
+    # Arrange features alphabetically for more consistent ordering
+    # between runs and easier exploration of the fitted model
+    def to_layout(feature_specs):
+        return [(name,) + feature_specs[name] for name in sorted(feature_specs)]
+    return to_layout(features), to_layout(privacy_suppressed_features)
+
+
+def get_profile_layouts(keys, key_rows, profile):
+    '''Feature layouts (see get_feature_layout) for columns with the given
+    ColumnProfile and data dictionary rows.'''
     key_row_lookup = {key_row[4]: key_row for key_row in key_rows if key_row[4]}
-    
-    non_feature_keys = get_non_feature_keys(rows, keys, key_row_lookup)
-    privacy_suppressed_keys = set([
-        keys[i] for i in xrange(len(keys))
-        if any([row[i] == 'PrivacySuppressed' for row in rows])
-    ])
-    categorical_keys = get_categorical_keys(key_rows)
-
-    label_indices = [keys.index(label_key) for label_key in label_keys]
-
-    examples = []
-    privacy_suppressed_values = []
-
-    for row in rows:
-        features = {}
-        privacy_suppressed_features = {}
-        for i in xrange(len(keys)):
-            if keys[i] not in non_feature_keys:
-                if keys[i] in privacy_suppressed_keys:
-                    if is_null(row, i):
-                        value = 0.0
-                    elif row[i] == 'PrivacySuppressed':
-                        value = -1.0
-                    else:
-                        value = float(row[i])
-                    privacy_suppressed_features[keys[i]] = value
-                else:
-                    is_null_key = '%s_is_NULL' % (keys[i])
-                    
-                    if keys[i] in categorical_keys:
-                        category_value_is_null = is_null(row, i)
-                        features[is_null_key] = 1.0 if category_value_is_null else 0.0
-                        for category_value, category_label in categorical_keys[keys[i]]:
-                            category_key = '%s = %s' % (keys[i], category_label)
-                            features[category_key] = (
-                                1.0 if not category_value_is_null and row[i] == category_value
-                                else 0.0
-                            )
-                    
-                    else: # Non-categorical keys
-                        # TODO: alternative ways of dealing with PrivacySuppressed?
-                        if is_null(row, i):
-                            features[keys[i]] = 0.0
-                            features[is_null_key] = 1.0
-                        else:
-                            features[keys[i]] = float(row[i])
-                            features[is_null_key] = 0.0
-        
-        # Arrange features alphabetically for more consistent ordering
-        # between runs and easier exploration of the fitted model
-        feature_values = [features[key] for key in sorted(features)]
-        try:
-            labels = [float(row[label_index]) for label_index in label_indices]
-        except ValueError:
-            labels = [row[label_index].strip() for label_index in label_indices]
-        examples.append((feature_values, labels))
-        privacy_suppressed_values.append([privacy_suppressed_features[key] for key in sorted(privacy_suppressed_features)])
-
-    return examples, sorted(features), label_keys, privacy_suppressed_values, sorted(privacy_suppressed_features)
+    non_feature_keys = get_non_feature_keys(None, keys, key_row_lookup, profile=profile)
+    return get_feature_layout(
+        keys, non_feature_keys, profile.privacy_suppressed_keys(), get_categorical_keys(key_rows))
+
+
+def get_row_column_getter(rows, keys):
+    '''Return a function giving the string values of a key's column of rows
+    as an array; keys missing from the rows read as NULL.'''
+    key_indices = {key: i for i, key in enumerate(keys)}
+
+    def get_column(key):
+        if key not in key_indices:
+            return np.array(['NULL'] * len(rows))
+        i = key_indices[key]
+        return np.array([row[i] for row in rows])
+    return get_column
+
+
+def get_feature_values(kind, column, null_mask, category_value):
+    '''Float values of one feature, given its key's string column.'''
+    if kind == 'is_null':
+        return null_mask.astype(float)
+    if kind == 'category':
+        return (~null_mask & (column == category_value)).astype(float)
+    values = np.zeros(len(column))
+    present = ~null_mask
+    if kind == 'privacy_suppressed':
+        private_mask = column == 'PrivacySuppressed'
+        values[private_mask] = -1.0
+        present &= ~private_mask
+    values[present] = column[present].astype(float)
+    return values
+
+
+def iter_feature_values(layout, get_column):
+    '''Yield (position, float64 values) for each feature of a layout,
+    reading each key's column once.'''
+    current_key, column, null_mask = None, None, None
+    for j, (name, key, kind, category_value) in enumerate(layout):
+        if key != current_key:
+            current_key = key
+            column = get_column(key)
+            null_mask = column == 'NULL'
+        yield j, get_feature_values(kind, column, null_mask, category_value)
+
+
+def set_scaler_statistics(scaler, num_rows, means, variances):
+    scaler.means = means
+    return scaler.set_variances(num_rows, variances)
+
+
+def fit_feature_scaler(layout, get_column, num_rows):
+    '''Fit a regressions.FeatureScaler to the features of a layout column by
+    column, without building their matrix.'''
+    means, variances = np.zeros(len(layout)), np.zeros(len(layout))
+    for j, values in iter_feature_values(layout, get_column):
+        means[j], variances[j] = values.mean(), values.var()
+    return set_scaler_statistics(regressions.FeatureScaler(), num_rows, means, variances)
+
+
+def fill_feature_matrix(layout, get_column, num_rows, sparse=False, dtype=regressions.DEFAULT_DTYPE, scaler=None):
+    '''Build the float matrix (of dtype) for a feature layout, one column at
+    a time. A regressions.FeatureScaler passed as scaler is fit to the
+    features as their columns are filled.
+
+    With sparse, returns a scipy.sparse CSR matrix holding only the nonzero
+    values; the mostly-zero indicator columns then cost nothing per row.'''
+    instrument.count('feature_columns_filled', len(layout))
+    if sparse:
+        column_rows, column_values = [], []
+    else:
+        matrix = np.zeros((num_rows, len(layout)), dtype=dtype)
+    if scaler is not None:
+        means, variances = np.zeros(len(layout)), np.zeros(len(layout))
+    for j, values in iter_feature_values(layout, get_column):
+        if scaler is not None:
+            means[j], variances[j] = values.mean(), values.var()
+        if sparse:
+            nonzero_rows = np.flatnonzero(values)
+            column_rows.append(nonzero_rows)
+            column_values.append(values[nonzero_rows])
+        else:
+            matrix[:, j] = values
+    if scaler is not None:
+        set_scaler_statistics(scaler, num_rows, means, variances)
+    if not sparse:
+        return matrix
+    instrument.count('feature_nonzeros', sum(len(rows) for rows in column_rows))
+    indptr = np.concatenate([[0], np.cumsum([len(rows) for rows in column_rows])])
+    data = np.concatenate(column_values).astype(dtype) if column_values else np.zeros(0, dtype=dtype)
+    indices = np.concatenate(column_rows) if column_rows else np.zeros(0, dtype=np.intp)
+    return scipy.sparse.csc_matrix((data, indices, indptr), shape=(num_rows, len(layout))).tocsr()
+
+
+def parse_labels(label_values):
+    try:
+        return [float(value) for value in label_values]
+    except ValueError:
+        return [value.strip() for value in label_values]
+
+
+def get_label_matrix(label_columns, num_rows):
+    '''Return labels as a float array, with NaN for every label of a row in
+    which any label fails to parse.'''
+    labels = np.full((num_rows, len(label_columns)), np.nan)
+    for row_index, label_values in enumerate(zip(*label_columns)):
+        parsed_labels = parse_labels(label_values)
+        if not isinstance(parsed_labels[0], str):
+            labels[row_index] = parsed_labels
+    return labels
+
+
+class FeatureTransformer(object):
+    '''Featurizes data rows with a schema fit once on training data.
+
+    fit() makes every decision get_examples depends on the full data for
+    (non-feature keys, PrivacySuppressed keys, categorical expansions and the
+    sorted feature order) and fits a regressions.FeatureScaler to the
+    features. transform() then featurizes any batch of rows, down to a
+    single new school, consistently with that schema. In transformed rows,
+    PrivacySuppressed values of keys that were never suppressed in the
+    training data are treated as NULL.
+
+    With sparse, transformed features are scipy.sparse CSR matrices (see
+    fill_feature_matrix), which normalization only scales. Transformed
+    features are of dtype (regressions.COMPACT_DTYPE halves their memory).'''
+
+    def __init__(self, label_keys=LABEL_KEYS, normalize=False, sparse=False, dtype=regressions.DEFAULT_DTYPE):
+        self.label_keys = label_keys
+        self.normalize = normalize
+        self.sparse = sparse
+        self.dtype = dtype
+        self.feature_layout = None
+        self.privacy_suppressed_layout = None
+        self.scaler = None
+
+    @property
+    def feature_names(self):
+        return [spec[0] for spec in self.feature_layout]
+
+    @property
+    def privacy_suppressed_names(self):
+        return [spec[0] for spec in self.privacy_suppressed_layout]
+
+    def fit(self, rows, keys, key_rows=None):
+        return self.fit_columns(keys, get_row_column_getter(rows, keys), len(rows), key_rows=key_rows)
+
+    def fit_layouts(self, keys, get_column, num_rows, key_rows=None, profile=None):
+        if key_rows is None:
+            key_rows = read_key_rows()
+        if profile is None:
+            profile = columnar.ColumnProfile.from_columns(keys, get_column, num_rows)
+        self.feature_layout, self.privacy_suppressed_layout = get_profile_layouts(keys, key_rows, profile)
+
+    def fit_columns(self, keys, get_column, num_rows, key_rows=None, profile=None):
+        '''Fit from column accessors; get_column(key) returns a key's string
+        values. A precomputed ColumnProfile of the columns may be passed in.
+        The scaler is fit column by column, without a feature matrix.'''
+        self.fit_layouts(keys, get_column, num_rows, key_rows, profile)
+        self.scaler = fit_feature_scaler(self.feature_layout, self.get_feature_column_getter(get_column), num_rows)
+        return self
+
+    def fit_transform_columns(self, keys, get_column, num_rows, key_rows=None, profile=None):
+        '''Fit as fit_columns does and return transform_columns of the same
+        rows, featurizing them only once.'''
+        self.fit_layouts(keys, get_column, num_rows, key_rows, profile)
+        self.scaler = regressions.FeatureScaler()
+        features = fill_feature_matrix(
+            self.feature_layout, self.get_feature_column_getter(get_column), num_rows, sparse=self.sparse,
+            dtype=self.dtype, scaler=self.scaler)
+        return self.finish_transform(features, get_column, num_rows)
+
+    def get_feature_column_getter(self, get_column):
+        '''Wrap get_column so that PrivacySuppressed values of keys that are
+        not PrivacySuppressed keys read as NULL.'''
+        privacy_suppressed_keys = set([spec[1] for spec in self.privacy_suppressed_layout])
+
+        def get_feature_column(key):
+            column = get_column(key)
+            if key not in privacy_suppressed_keys:
+                column = np.where(column == 'PrivacySuppressed', 'NULL', column)
+            return column
+        return get_feature_column
+
+    def transform_columns(self, get_column, num_rows):
+        '''Return (features, privacy_suppressed_values) float matrices; the
+        features are sparse if the transformer is.'''
+        features = fill_feature_matrix(
+            self.feature_layout, self.get_feature_column_getter(get_column), num_rows, sparse=self.sparse,
+            dtype=self.dtype)
+        return self.finish_transform(features, get_column, num_rows)
+
+    def finish_transform(self, features, get_column, num_rows):
+        if self.normalize:
+            features = self.scaler.transform(features)
+        privacy_suppressed_values = fill_feature_matrix(
+            self.privacy_suppressed_layout, get_column, num_rows, dtype=self.dtype)
+        return features, privacy_suppressed_values
+
+    def transform(self, rows, keys):
+        return self.transform_columns(get_row_column_getter(rows, keys), len(rows))
+
+    def transform_row(self, row, keys):
+        features, privacy_suppressed_values = self.transform([row], keys)
+        return features[0], privacy_suppressed_values[0]
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(filename):
+        with open(filename, 'rb') as f:
+            transformer = pickle.load(f)
+        # Transformers saved before the dtype option were float64
+        transformer.__dict__.setdefault('dtype', regressions.DEFAULT_DTYPE)
+        return transformer
+
+
+def load_filtered_columns(data_file_name=read_data.DEFAULT_DATA_FILE_NAME):
+    '''Return (data, row_indices, get_column) for the rows get_filtered_rows
+    selects, where get_column(key) gives that key's column of those rows.
+    data_file_name may also be a list of yearly data files to combine (see
+    multi_year.py).'''
+    if isinstance(data_file_name, (list, tuple)):
+        import multi_year
+        data = multi_year.load_multi_year(data_file_name)
+    else:
+        data = columnar.load_columnar(data_file_name)
+    row_indices = data.get_filtered_row_indices()
+    return data, row_indices, lambda key: data.strings(key)[row_indices]
+
+
+@instrument.timed('featurize.fit')
+def fit_transformer(label_keys=LABEL_KEYS, data_file_name=read_data.DEFAULT_DATA_FILE_NAME, dictionary_filename=DICTIONARY_FILENAME, normalize=False, sparse=False, dtype=regressions.DEFAULT_DTYPE):
+    '''Fit a FeatureTransformer on the rows get_examples featurizes.'''
+    data, row_indices, get_column = load_filtered_columns(data_file_name)
+    transformer = FeatureTransformer(label_keys=label_keys, normalize=normalize, sparse=sparse, dtype=dtype)
+    return transformer.fit_columns(
+        data.keys, get_column, len(row_indices), key_rows=read_key_rows(dictionary_filename),
+        profile=data.get_profile(row_indices))
+
+
+@instrument.timed('featurize')
+def get_example_matrices(label_keys=LABEL_KEYS, data_file_name=read_data.DEFAULT_DATA_FILE_NAME, dictionary_filename=DICTIONARY_FILENAME, transformer=None, columns=None):
+    '''Columnar version of get_examples.
+
+    Returns (features, feature_names, labels, label_names,
+    privacy_suppressed_values, privacy_suppressed_names) with features,
+    labels and privacy_suppressed_values as 2D float arrays, one row per
+    example (features are a CSR matrix if the transformer is sparse). Labels
+    of rows whose labels do not all parse are NaN.
+
+    A fitted transformer may be passed in to reuse its schema; an unfitted
+    one (or by default a new one) is fit on the same rows while they are
+    featurized. columns may be the result of load_filtered_columns, to
+    reuse.'''
+    data, row_indices, get_column = columns or load_filtered_columns(data_file_name)
+    if transformer is None:
+        transformer = FeatureTransformer(label_keys=label_keys)
+    if transformer.feature_layout is None:
+        features, privacy_suppressed_values = transformer.fit_transform_columns(
+            data.keys, get_column, len(row_indices), key_rows=read_key_rows(dictionary_filename),
+            profile=data.get_profile(row_indices))
+    else:
+        features, privacy_suppressed_values = transformer.transform_columns(get_column, len(row_indices))
+    labels = get_label_matrix([get_column(key).tolist() for key in label_keys], len(row_indices))
+    return (
+        features, transformer.feature_names,
+        labels, label_keys,
+        privacy_suppressed_values, transformer.privacy_suppressed_names,
+    )
+
+
+def get_example_list(features, label_keys, get_column):
+    '''(feature list, label list) examples of a feature matrix, as
+    get_examples returns them.'''
+    # Labels are re-parsed from their strings so that rows which fail to
+    # parse keep them as (stripped) strings
+    label_columns = [get_column(label_key).tolist() for label_key in label_keys]
+    return [
+        (feature_values, parse_labels(label_values))
+        for feature_values, label_values in zip(
+            (features.toarray() if scipy.sparse.issparse(features) else features).tolist(), zip(*label_columns))
+    ]
+
+
+def get_examples(label_keys=LABEL_KEYS, data_file_name=read_data.DEFAULT_DATA_FILE_NAME, dictionary_filename=DICTIONARY_FILENAME, transformer=None):
+    columns = load_filtered_columns(data_file_name)
+    features, feature_names, labels, label_names, privacy_suppressed_values, privacy_suppressed_names = get_example_matrices(
+        label_keys, data_file_name=data_file_name, dictionary_filename=dictionary_filename,
+        transformer=transformer, columns=columns)
+    examples = get_example_list(features, label_keys, columns[2])
+    return examples, feature_names, label_names, privacy_suppressed_values.tolist(), privacy_suppressed_names
 
 
 def find_all_0_features(examples, feature_names):
-    nonzero_keys = set([])
-    for features, labels in examples:
-        for i in xrange(len(feature_names)):
-            if features[i] > 0:
-                nonzero_keys.add(feature_names[i])
-    print 'Features with some nonzero values: %s' % len(nonzero_keys)
-    return [name for name in feature_names if name not in nonzero_keys]
+    stats = feature_selection.ColumnStats.from_matrix(regressions.get_feature_matrix(examples))
+    print 'Features with some nonzero values: %s' % np.count_nonzero(stats.positive_counts)
+    return [name for name, count in zip(feature_names, stats.positive_counts) if count == 0]
 
 def get_features_with_single_value(examples, feature_names):
-    all_value_sets = {i: set([]) for i in xrange(len(feature_names))}
-    for features, labels in examples:
-        for i in xrange(len(feature_names)):
-            all_value_sets[i].add(features[i])
-    return set([i for i in all_value_sets if len(all_value_sets[i]) <= 1])
+    stats = feature_selection.ColumnStats.from_matrix(regressions.get_feature_matrix(examples))
+    return set(np.flatnonzero(stats.distinct_counts <= 1).tolist())
 
+@instrument.timed('feature_filtering')
 def filter_features_with_single_values(examples, feature_names):
-    features_with_single_value = get_features_with_single_value(examples, feature_names)
-    new_examples = []
-    for features, labels in examples:
-        new_features = [
-            features[i] for i in xrange(len(feature_names))
-            if i not in features_with_single_value
-        ]
-        new_examples.append((new_features, labels))
-    new_feature_names = [
-        feature_names[i] for i in xrange(len(feature_names))
-        if i not in features_with_single_value
-    ]
-    return new_examples, new_feature_names
+    features = regressions.get_feature_matrix(examples)
+    mask = feature_selection.ColumnStats.from_matrix(features).get_mask(min_distinct=2)
+    new_examples = zip(feature_selection.select_columns(features, mask).tolist(), [labels for _, labels in examples])
+    return new_examples, feature_selection.select_names(feature_names, mask)
 
+@instrument.timed('feature_filtering')
 def filter_privacy_suppressed_features(features, feature_names, required_percent=0.0):#7):
-    filtered_features = [[] for _ in features]
-    filtered_names = []
-    
-    for i, name in enumerate(feature_names):
-        num_available = 0.0
-        for row in features:
-            if row[i] != -1.0:
-                num_available += 1
-        if num_available / len(features) >= required_percent:
-            for row_index, row in enumerate(features):
-                filtered_features[row_index].append(row[i])
-            filtered_names.append(name)
-
-    return filtered_features, filtered_names
+    '''Keep features with at least required_percent of values that are not
+    PrivacySuppressed (-1.0); features may be a 2D array or a list of rows,
+    and are returned as the same kind of value.'''
+    mask = feature_selection.ColumnStats.from_matrix(features).get_mask(required_available=required_percent)
+    return feature_selection.select_columns(features, mask), feature_selection.select_names(feature_names, mask)
 
 
 if __name__=='__main__':
-    examples, feature_names, label_names, privacy_suppressed_values, privacy_suppressed_names = get_examples()
-    # examples, feature_names = filter_features_with_single_values(examples, feature_names)
+    instrument.enable_from_argv()
+    # Create the transformer through the imported module so that the pickle
+    # refers to featurize.FeatureTransformer rather than to this script's
+    # __main__; it is fit while the examples are featurized
+    import featurize
+    transformer = featurize.FeatureTransformer(
+        sparse='--sparse' in sys.argv,
+        dtype=regressions.COMPACT_DTYPE if '--float32' in sys.argv else regressions.DEFAULT_DTYPE)
+    columns = load_filtered_columns()
+    features, feature_names, labels, label_names, privacy_suppressed_values, privacy_suppressed_names = get_example_matrices(
+        transformer=transformer, columns=columns)
+    transformer.save(TRANSFORMER_FILENAME)
     privacy_suppressed_values, privacy_suppressed_names = filter_privacy_suppressed_features(privacy_suppressed_values, privacy_suppressed_names)
-
-    with open('new_out_features.csv', 'w') as features_file:
-        with open('new_out_labels.csv', 'w') as labels_file:
-            with open('new_privacy_suppressed_features.csv', 'w') as privacy_suppressed_file:
-                features_file.write('%s\n' % (','.join([feature.replace(',', ';') for feature in feature_names])))
-                labels_file.write('%s\n' % (','.join([label.replace(',', ';') for label in label_names])))
-                privacy_suppressed_file.write('%s\n' % (','.join([name.replace(',', ';') for name in privacy_suppressed_names])))
-                for features, labels in examples:
-                    features_file.write('%s\n' % (','.join([str(feature) for feature in features])))
-                    labels_file.write('%s\n' % (','.join([str(label) for label in labels])))
-                for privacy_suppressed_line in privacy_suppressed_values:
-                    privacy_suppressed_file.write('%s\n' % (','.join([str(feature) for feature in privacy_suppressed_line])))
\ No newline at end of file
+    feature_artifacts.write_artifact(
+        features, feature_names, labels, label_names,
+        privacy_suppressed_values=privacy_suppressed_values,
+        privacy_suppressed_names=privacy_suppressed_names)
+    print 'Wrote %s examples to %s' % (features.shape[0], feature_artifacts.DEFAULT_ARTIFACT_DIR)
+
+    if '--csv' in sys.argv:
+        examples = get_example_list(features, label_names, columns[2])
+        # examples, feature_names = filter_features_with_single_values(examples, feature_names)
+        privacy_suppressed_values = privacy_suppressed_values.tolist()
+
+        with open('new_out_features.csv', 'w') as features_file:
+            with open('new_out_labels.csv', 'w') as labels_file:
+                with open('new_privacy_suppressed_features.csv', 'w') as privacy_suppressed_file:
+                    features_file.write('%s\n' % (','.join([feature.replace(',', ';') for feature in feature_names])))
+                    labels_file.write('%s\n' % (','.join([label.replace(',', ';') for label in label_names])))
+                    privacy_suppressed_file.write('%s\n' % (','.join([name.replace(',', ';') for name in privacy_suppressed_names])))
+                    for features, labels in examples:
+                        features_file.write('%s\n' % (','.join([str(feature) for feature in features])))
+                        labels_file.write('%s\n' % (','.join([str(label) for label in labels])))
+                    for privacy_suppressed_line in privacy_suppressed_values:
+                        privacy_suppressed_file.write('%s\n' % (','.join([str(feature) for feature in privacy_suppressed_line])))
@@ -0,0 +1,218 @@
+'''Incremental training set module.
+
+Keeps the featurized examples of a data file (as get_example_matrices in
+featurize.py produces them), their running feature statistics and a fitted
+KNNRegressor, and extends all of them when newly reported schools arrive
+instead of recomputing everything:
+
+    python incremental.py new_schools.csv
+
+add_rows() appends the rows to the data file and its columnar cache
+(columnar.append_rows), then profiles and featurizes only those new rows
+that pass the required-key filter. It merges their statistics into the
+FeatureScaler (partial_fit) and inserts the labeled ones into the KNN index.
+
+The feature schema depends on every row: a key that was NULL everywhere
+gains features once it has a value, and a key that gains PrivacySuppressed
+values moves to the PrivacySuppressed-coded features. Such changes are
+detected from the merged column profile. Only the feature columns that
+changed are then recomputed for the existing rows, and the KNN index (whose
+dimensions changed) is refit.
+'''
+
+import csv
+import cPickle as pickle
+import numpy as np
+import sys
+
+import columnar
+import featurize
+import instrument
+import read_data
+import regressions
+
+
+DEFAULT_STATE_FILENAME = 'incremental_training_set.pickle'
+
+
+def rebuild_matrix(old_layout, old_matrix, layout, get_column, num_rows):
+    '''Return (matrix, recomputed) with a column for each spec of layout:
+    columns whose spec is also in old_layout are copied from old_matrix and
+    the others, whose positions are listed in recomputed, are filled from
+    get_column.'''
+    old_positions = {spec: j for j, spec in enumerate(old_layout)}
+    recomputed = [j for j, spec in enumerate(layout) if spec not in old_positions]
+    reused = [j for j, spec in enumerate(layout) if spec in old_positions]
+    matrix = np.empty((num_rows, len(layout)))
+    matrix[:, reused] = old_matrix[:, [old_positions[layout[j]] for j in reused]]
+    if recomputed:
+        matrix[:, recomputed] = featurize.fill_feature_matrix([layout[j] for j in recomputed], get_column, num_rows)
+    return matrix, recomputed
+
+
+class IncrementalTrainingSet(object):
+    '''Featurized examples of a data file that can be extended in place.'''
+
+    def __init__(self, data_file_name=read_data.DEFAULT_DATA_FILE_NAME, dictionary_filename=featurize.DICTIONARY_FILENAME, label_keys=featurize.LABEL_KEYS, required_keys=read_data.DEFAULT_REQUIRED_KEYS, get_unlabeled=True, normalize=False, knn_algorithm='brute', cache_dir=columnar.DEFAULT_CACHE_DIR):
+        self.data_file_name = data_file_name
+        self.dictionary_filename = dictionary_filename
+        self.label_keys = label_keys
+        self.required_keys = required_keys
+        self.get_unlabeled = get_unlabeled
+        self.normalize = normalize
+        self.knn_algorithm = knn_algorithm
+        self.cache_dir = cache_dir
+        self.key_rows = None
+        self.transformer = None
+        self.profile = None
+        self.row_indices = None
+        self.features = None
+        self.privacy_suppressed_values = None
+        self.labels = None
+        self.model = None
+
+    def select_rows(self, data, row_indices):
+        '''The row_indices that read_data.get_filtered_rows would select.'''
+        has_null_required = np.zeros(len(row_indices), dtype=bool)
+        for key in self.required_keys:
+            has_null_required |= data.null_mask(key)[row_indices]
+        return row_indices[has_null_required == self.get_unlabeled]
+
+    def get_label_matrix(self, get_column, num_rows):
+        return featurize.get_label_matrix([get_column(key).tolist() for key in self.label_keys], num_rows)
+
+    def get_model_examples(self, features, privacy_suppressed_values, labels):
+        '''KNN training examples: the labeled rows, with the PrivacySuppressed-
+        coded features appended as in read_feature_artifact(use_privacy_suppressed=True).'''
+        if self.normalize:
+            features = self.transformer.scaler.transform(features.copy())
+        labeled = ~np.isnan(labels).any(axis=1)
+        return np.hstack([features, privacy_suppressed_values])[labeled], labels[labeled]
+
+    def fit_model(self):
+        self.model = regressions.KNNRegressor(algorithm=self.knn_algorithm).fit(
+            self.get_model_examples(self.features, self.privacy_suppressed_values, self.labels))
+
+    @instrument.timed('incremental.build')
+    def build(self):
+        '''Featurize the whole data file and fit the model from scratch.'''
+        data = columnar.load_columnar(self.data_file_name, self.cache_dir)
+        self.key_rows = featurize.read_key_rows(self.dictionary_filename)
+        self.row_indices = self.select_rows(data, np.arange(data.num_rows))
+        num_rows = len(self.row_indices)
+        get_column = lambda key: data.strings(key)[self.row_indices]
+        self.profile = columnar.ColumnProfile.from_columns(data.keys, get_column, num_rows)
+        self.transformer = featurize.FeatureTransformer(self.label_keys)
+        self.features, self.privacy_suppressed_values = self.transformer.fit_transform_columns(
+            data.keys, get_column, num_rows, key_rows=self.key_rows, profile=self.profile)
+        self.labels = self.get_label_matrix(get_column, num_rows)
+        self.fit_model()
+        return self
+
+    def rebuild_columns(self, data, feature_layout, privacy_suppressed_layout):
+        '''Switch the existing examples to new layouts, recomputing only the
+        feature columns (and their statistics) that are new.'''
+        old_feature_layout = self.transformer.feature_layout
+        old_privacy_suppressed_layout = self.transformer.privacy_suppressed_layout
+        self.transformer.feature_layout = feature_layout
+        self.transformer.privacy_suppressed_layout = privacy_suppressed_layout
+        num_rows = len(self.row_indices)
+        get_column = lambda key: data.strings(key)[self.row_indices]
+
+        self.features, recomputed = rebuild_matrix(
+            old_feature_layout, self.features, feature_layout,
+            self.transformer.get_feature_column_getter(get_column), num_rows)
+        self.privacy_suppressed_values, recomputed_privacy_suppressed = rebuild_matrix(
+            old_privacy_suppressed_layout, self.privacy_suppressed_values, privacy_suppressed_layout,
+            get_column, num_rows)
+        instrument.count('incremental_columns_recomputed', len(recomputed) + len(recomputed_privacy_suppressed))
+
+        old_scaler = self.transformer.scaler
+        old_positions = {spec: j for j, spec in enumerate(old_feature_layout)}
+        means = np.empty(len(feature_layout))
+        variances = np.empty(len(feature_layout))
+        for j, spec in enumerate(feature_layout):
+            if spec in old_positions:
+                means[j] = old_scaler.means[old_positions[spec]]
+                variances[j] = old_scaler.variances[old_positions[spec]]
+        if recomputed:
+            recomputed_scaler = regressions.FeatureScaler().fit(self.features[:, recomputed])
+            means[recomputed] = recomputed_scaler.means
+            variances[recomputed] = recomputed_scaler.variances
+        self.transformer.scaler = regressions.FeatureScaler()
+        self.transformer.scaler.means = means
+        self.transformer.scaler.set_variances(num_rows, variances)
+        return [feature_layout[j][0] for j in recomputed] + [privacy_suppressed_layout[j][0] for j in recomputed_privacy_suppressed]
+
+    @instrument.timed('incremental.add_rows')
+    def add_rows(self, rows, keys=None):
+        '''Append rows (lists of strings in the order of keys, by default the
+        data file's own keys) to the data file and update the examples,
+        statistics and model to match. Returns a dict summarizing the update.'''
+        data = columnar.append_rows(self.data_file_name, rows, keys, self.cache_dir)
+        new_row_indices = self.select_rows(data, np.arange(data.num_rows - len(rows), data.num_rows))
+        num_new_rows = len(new_row_indices)
+        get_new_column = lambda key: data.strings(key)[new_row_indices]
+        self.profile = self.profile.merge(columnar.ColumnProfile.from_columns(data.keys, get_new_column, num_new_rows))
+
+        feature_layout, privacy_suppressed_layout = featurize.get_profile_layouts(data.keys, self.key_rows, self.profile)
+        old_specs = set(self.transformer.feature_layout + self.transformer.privacy_suppressed_layout)
+        new_specs = set(feature_layout + privacy_suppressed_layout)
+        schema_changed = old_specs != new_specs
+        rebuilt_features = []
+        if schema_changed:
+            rebuilt_features = self.rebuild_columns(data, feature_layout, privacy_suppressed_layout)
+
+        new_features, new_privacy_suppressed_values = self.transformer.transform_columns(get_new_column, num_new_rows)
+        new_labels = self.get_label_matrix(get_new_column, num_new_rows)
+        self.transformer.scaler.partial_fit(new_features)
+        self.row_indices = np.concatenate([self.row_indices, new_row_indices])
+        self.features = np.vstack([self.features, new_features])
+        self.privacy_suppressed_values = np.vstack([self.privacy_suppressed_values, new_privacy_suppressed_values])
+        self.labels = np.vstack([self.labels, new_labels])
+
+        # Normalized examples all shift when the scaler is updated
+        if schema_changed or self.normalize:
+            self.fit_model()
+        else:
+            self.model.add(self.get_model_examples(new_features, new_privacy_suppressed_values, new_labels))
+        return {
+            'rows_appended': len(rows),
+            'examples_added': num_new_rows,
+            'schema_changed': schema_changed,
+            'rebuilt_features': rebuilt_features,
+            'removed_features': sorted([spec[0] for spec in old_specs - new_specs]),
+        }
+
+    def save(self, filename=DEFAULT_STATE_FILENAME):
+        with open(filename, 'wb') as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(filename=DEFAULT_STATE_FILENAME):
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+
+
+if __name__=='__main__':
+    # Work through the imported module so that the pickled state refers to
+    # incremental.IncrementalTrainingSet rather than to this script's __main__
+    import incremental
+    import os
+    instrument.enable_from_argv()
+    if os.path.exists(DEFAULT_STATE_FILENAME):
+        training_set = incremental.IncrementalTrainingSet.load()
+    else:
+        print 'Building training set from %s...' % (read_data.DEFAULT_DATA_FILE_NAME)
+        training_set = incremental.IncrementalTrainingSet().build()
+    for file_name in [arg for arg in sys.argv[1:] if not arg.startswith('--')]:
+        with open(file_name, 'rb') as f:
+            reader = csv.reader(f)
+            keys = read_data.get_header(reader)
+            summary = training_set.add_rows([row for row in reader if row], keys)
+        print 'Added %s examples from %s rows of %s' % (summary['examples_added'], summary['rows_appended'], file_name)
+        if summary['schema_changed']:
+            print '\tSchema changed: recomputed %s, removed %s' % (
+                ', '.join(summary['rebuilt_features']) or 'nothing', ', '.join(summary['removed_features']) or 'nothing')
+    training_set.save()
+    print 'Training set has %s examples and %s features' % (len(training_set.features), len(training_set.transformer.feature_names))
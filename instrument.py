@@ -0,0 +1,211 @@
+'''Instrumentation module.
+
+Stage timers, counters and memory snapshots for the pipeline. Instrumentation
+is off by default, in which case stage() returns a shared no-op context, and
+count() and functions decorated with timed() return right away. Turn it on
+with the CS229_TRACE environment variable (set to the trace file to write, or
+to 1 for trace.json), with the --trace flag of the pipeline scripts, or by
+calling enable().
+
+While enabled, each stage records its wall time, the process RSS before and
+after, the peak RSS so far, and its own peak RSS (the highest RSS while the
+stage ran, on Linux; elsewhere the peak so far). The trace is written when the process exits
+(or on write_trace()) as Chrome trace-event JSON, which chrome://tracing,
+Perfetto and speedscope show as a flame graph of nested stages; it also
+holds the counters and a per-stage summary.
+'''
+
+import atexit
+import functools
+import json
+import os
+import resource
+import sys
+import time
+
+
+ENV_VAR = 'CS229_TRACE'
+DEFAULT_TRACE_FILENAME = 'trace.json'
+
+ENABLED = False
+TRACE_FILENAME = None
+EVENTS = []
+COUNTERS = {}
+START_TIME = time.time()
+PEAK_RSS_MB = 0.0
+# Stages entered and not yet exited, outermost first
+OPEN_STAGES = []
+
+
+def get_peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux (bytes on OS X). Resetting the
+    # high-water mark for stage peaks (see reset_high_water_rss) also
+    # lowers ru_maxrss, so the highest value seen is kept.
+    global PEAK_RSS_MB
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    PEAK_RSS_MB = max(PEAK_RSS_MB, peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0)
+    return PEAK_RSS_MB
+
+
+def get_rss_mb():
+    '''Current resident set size, or None where /proc is unavailable.'''
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024.0 * 1024.0)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def get_high_water_rss_mb():
+    '''RSS high-water mark since the last reset_high_water_rss, or None
+    where /proc is unavailable.'''
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+def reset_high_water_rss():
+    '''Reset the RSS high-water mark to the current RSS (Linux 4.0 and
+    later); returns whether that worked.'''
+    get_peak_rss_mb()
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+class Stage(object):
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        # Each open stage's peak is the highest RSS seen while it is open:
+        # the high-water mark is folded into the enclosing stages and reset
+        # whenever a stage starts, and folded in again when it ends
+        self.rss_before_mb = get_rss_mb()
+        high_water_mb = get_high_water_rss_mb()
+        for stage in OPEN_STAGES:
+            stage.stage_peak_mb = max(stage.stage_peak_mb, high_water_mb)
+        self.tracks_peak = reset_high_water_rss() and high_water_mb is not None
+        self.stage_peak_mb = self.rss_before_mb
+        OPEN_STAGES.append(self)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.time()
+        OPEN_STAGES.remove(self)
+        high_water_mb = get_high_water_rss_mb()
+        self.stage_peak_mb = max(self.stage_peak_mb, high_water_mb)
+        for stage in OPEN_STAGES:
+            stage.stage_peak_mb = max(stage.stage_peak_mb, self.stage_peak_mb)
+        args = dict(self.args)
+        args.update({
+            'rss_before_mb': self.rss_before_mb,
+            'rss_after_mb': get_rss_mb(),
+            'peak_rss_mb': get_peak_rss_mb(),
+            # Without a resettable high-water mark, the process peak so far
+            'stage_peak_rss_mb': self.stage_peak_mb if self.tracks_peak else get_peak_rss_mb(),
+        })
+        if exc_type is not None:
+            args['error'] = exc_type.__name__
+        EVENTS.append({
+            'name': self.name,
+            'ph': 'X',
+            'ts': int((self.start - START_TIME) * 1e6),
+            'dur': int((end - self.start) * 1e6),
+            'pid': os.getpid(),
+            'tid': 0,
+            'args': args,
+        })
+        return False
+
+
+class NullStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+def stage(name, **args):
+    '''Context manager timing a named pipeline stage; extra keyword
+    arguments (such as row counts) are stored with the event.'''
+    if not ENABLED:
+        return NULL_STAGE
+    return Stage(name, args)
+
+
+def timed(name, **args):
+    '''Decorator running every call of a function as a stage.'''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*function_args, **function_kwargs):
+            if not ENABLED:
+                return function(*function_args, **function_kwargs)
+            with Stage(name, dict(args, function=function.__name__)):
+                return function(*function_args, **function_kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    if ENABLED:
+        COUNTERS[name] = COUNTERS.get(name, 0) + value
+
+
+def enable(trace_filename=DEFAULT_TRACE_FILENAME):
+    global ENABLED, TRACE_FILENAME
+    if not ENABLED:
+        atexit.register(write_trace)
+    ENABLED = True
+    TRACE_FILENAME = trace_filename
+
+
+def enable_from_argv(argv=None):
+    '''Enable instrumentation if --trace is among the command-line arguments.'''
+    if '--trace' in (sys.argv if argv is None else argv):
+        enable()
+
+
+def get_summary():
+    '''Return {stage name: {'calls', 'seconds', 'peak_rss_mb', 'stage_peak_rss_mb'}}.'''
+    summary = {}
+    for event in EVENTS:
+        stage_summary = summary.setdefault(event['name'], {'calls': 0, 'seconds': 0.0, 'peak_rss_mb': 0.0, 'stage_peak_rss_mb': 0.0})
+        stage_summary['calls'] += 1
+        stage_summary['seconds'] += event['dur'] / 1e6
+        stage_summary['peak_rss_mb'] = max(stage_summary['peak_rss_mb'], event['args']['peak_rss_mb'])
+        stage_summary['stage_peak_rss_mb'] = max(stage_summary['stage_peak_rss_mb'], event['args']['stage_peak_rss_mb'])
+    return summary
+
+
+def write_trace(filename=None):
+    filename = filename or TRACE_FILENAME
+    if not ENABLED or not filename:
+        return
+    with open(filename, 'w') as f:
+        json.dump({
+            'traceEvents': EVENTS,
+            'displayTimeUnit': 'ms',
+            'counters': COUNTERS,
+            'summary': get_summary(),
+        }, f, indent=1, sort_keys=True)
+    print >> sys.stderr, 'Wrote trace of %s stages to %s' % (len(EVENTS), filename)
+
+
+if os.environ.get(ENV_VAR):
+    enable(DEFAULT_TRACE_FILENAME if os.environ[ENV_VAR] == '1' else os.environ[ENV_VAR])
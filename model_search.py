@@ -0,0 +1,229 @@
+'''Model search module.
+
+Cross-validates grids of KNN and SVR configurations over seeded K-fold
+splits, spreading the work over a process pool. Per-fold work is done once
+and reused across configurations: fold indices and (optionally) scalers are
+computed up front, and each fold's KNN neighbors are searched once at the
+largest k and shared by every k and weighting in the grid.
+
+Features are normalized per fold unless --no-normalize is given: libsvm
+converges slowly (if at all) on the raw, heavy-tailed Scorecard features.
+SVR fits stop after SVR_MAX_ITER solver iterations, and configurations with
+a fit that stopped there are reported as not converged. Linear kernels with
+a large C rarely converge within that limit even on normalized features, so
+they are only searched with --large-c-linear.
+
+Reports the mean and standard deviation over folds of each configuration's
+compute_percent_errors, e.g.:
+
+    python model_search.py --folds 5 --repeats 2 --seed 229 --n_jobs -1
+'''
+
+import argparse
+import csv
+import itertools
+import numpy as np
+import warnings
+from sklearn.exceptions import ConvergenceWarning
+
+import instrument
+import parallel
+import regressions
+
+
+RESULTS_FILENAME = 'model_search_results.csv'
+
+KNN_GRID = {
+    'k': range(1, 16),
+    'weighting': regressions.KNN_WEIGHTINGS,
+}
+
+SVR_GRID = [
+    {
+        'C': [0.00000005, 0.001, 1.0, 1000.0],
+        'epsilon': [0.1, 1.0],
+        'kernel': ['rbf'],
+    },
+    {
+        'C': [0.00000005, 0.001],
+        'epsilon': [0.1, 1.0],
+        'kernel': ['linear'],
+    },
+]
+
+LARGE_C_LINEAR_SVR_GRID = {
+    'C': [1.0, 1000.0],
+    'epsilon': [0.1, 1.0],
+    'kernel': ['linear'],
+}
+
+# Solver iterations after which an SVR fit is stopped and marked not converged
+SVR_MAX_ITER = 100000
+
+
+def get_folds(num_examples, num_folds=5, num_repeats=1, seed=229):
+    '''Return (train_indices, dev_indices) pairs for num_repeats differently
+    shuffled K-fold splits generated from seed.'''
+    random_state = np.random.RandomState(seed)
+    folds = []
+    for _ in xrange(num_repeats):
+        order = random_state.permutation(num_examples)
+        for dev_indices in np.array_split(order, num_folds):
+            train_mask = np.ones(num_examples, dtype=bool)
+            train_mask[dev_indices] = False
+            folds.append((np.flatnonzero(train_mask), np.sort(dev_indices)))
+    return folds
+
+
+def get_grid(param_grid):
+    '''Expand a {name: [values]} grid, or a list of such grids, into a list
+    of parameter dicts.'''
+    if isinstance(param_grid, list):
+        return [params for grid in param_grid for params in get_grid(grid)]
+    names = sorted(param_grid)
+    return [dict(zip(names, values)) for values in itertools.product(*[param_grid[name] for name in names])]
+
+
+def get_fold_matrices(fold_index):
+    '''Return (train_features, train_labels, dev_features, dev_labels) of a
+    fold, normalized with the fold's scaler if one was fit.'''
+    features = parallel.SHARED_ARRAYS['features']
+    labels = parallel.SHARED_ARRAYS['labels']
+    train_indices, dev_indices = parallel.SHARED_ARRAYS['folds'][fold_index]
+    train_features = features[train_indices]
+    dev_features = features[dev_indices]
+    scaler = parallel.SHARED_ARRAYS['scalers'][fold_index]
+    if scaler is not None:
+        train_features = scaler.transform(train_features)
+        dev_features = scaler.transform(dev_features)
+    return train_features, labels[train_indices], dev_features, labels[dev_indices]
+
+
+def evaluate_knn_fold(task):
+    fold_index, configs = task
+    train_features, train_labels, dev_features, dev_labels = get_fold_matrices(fold_index)
+    max_k = max(config['k'] for config in configs)
+    model = regressions.KNNRegressor().fit((train_features, train_labels))
+    neighbors, distances = model.kneighbors(dev_features, max_k)
+
+    fold_errors = []
+    for config in configs:
+        k = config['k']
+        predictions = regressions.get_knn_label_predictions(
+            train_labels, neighbors[:, :k], distances[:, :k], k, config['weighting'])
+        fold_errors.append(regressions.compute_percent_errors(dev_labels, predictions)[0])
+    return fold_errors
+
+
+def evaluate_svr_fold(task):
+    '''Return (percent errors, whether every label's fit converged).'''
+    fold_index, config = task
+    train_features, train_labels, dev_features, dev_labels = get_fold_matrices(fold_index)
+    with warnings.catch_warnings():
+        # Fits stopped at max_iter are reported in the results instead
+        warnings.simplefilter('ignore', ConvergenceWarning)
+        models = regressions.fit_svr_models(train_features, train_labels, max_iter=SVR_MAX_ITER, **config)
+    converged = all(model.fit_status_ == 0 for model in models)
+    predictions = regressions.predict_svr_models(models, dev_features)
+    return regressions.compute_percent_errors(dev_labels, predictions)[0], converged
+
+
+def run_search(features, labels, knn_grid=KNN_GRID, svr_grid=SVR_GRID, num_folds=5, num_repeats=1, seed=229, normalize=True, n_jobs=-1):
+    '''Cross-validate every configuration in the grids.
+
+    Returns a list of (model name, params, mean percent errors, std of
+    percent errors, converged) tuples, with one error per label; converged
+    is False for SVR configurations with a fit stopped at SVR_MAX_ITER.'''
+    features = regressions.as_feature_matrix(features)
+    labels = np.asarray(labels, dtype=float)
+    folds = get_folds(features.shape[0], num_folds, num_repeats, seed)
+    scalers = [
+        regressions.FeatureScaler().fit(features[train_indices]) if normalize else None
+        for train_indices, dev_indices in folds
+    ]
+    knn_configs = get_grid(knn_grid) if knn_grid else []
+    svr_configs = get_grid(svr_grid) if svr_grid else []
+
+    knn_tasks = [(fold_index, knn_configs) for fold_index in xrange(len(folds))] if knn_configs else []
+    svr_tasks = [(fold_index, config) for config in svr_configs for fold_index in xrange(len(folds))]
+    print 'Evaluating %s KNN and %s SVR configurations on %s folds...' % (len(knn_configs), len(svr_configs), len(folds))
+    shared = {'features': features, 'labels': labels, 'folds': folds, 'scalers': scalers}
+    knn_results = parallel.map_with_shared_arrays(evaluate_knn_fold, knn_tasks, n_jobs=n_jobs, **shared)
+    svr_results = parallel.map_with_shared_arrays(evaluate_svr_fold, svr_tasks, n_jobs=n_jobs, **shared)
+
+    def summarize(fold_errors):
+        fold_errors = np.array(fold_errors)
+        return list(fold_errors.mean(axis=0)), list(fold_errors.std(axis=0))
+
+    results = []
+    for config_index, config in enumerate(knn_configs):
+        mean_errors, std_errors = summarize([fold_errors[config_index] for fold_errors in knn_results])
+        results.append(('knn', config, mean_errors, std_errors, True))
+    for config_index, config in enumerate(svr_configs):
+        config_results = svr_results[config_index * len(folds):(config_index + 1) * len(folds)]
+        mean_errors, std_errors = summarize([fold_errors for fold_errors, converged in config_results])
+        converged = all(converged for fold_errors, converged in config_results)
+        results.append(('svr', config, mean_errors, std_errors, converged))
+    return results
+
+
+def write_results(results, label_names, filename=RESULTS_FILENAME):
+    with open(filename, 'wb') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        header = ['model', 'params']
+        for label_name in label_names:
+            header.extend([label_name, '%s_fold_std' % (label_name)])
+        header.append('converged')
+        writer.writerow(header)
+        for model_name, params, mean_errors, std_errors, converged in results:
+            row = [model_name, ' '.join(['%s=%s' % (name, params[name]) for name in sorted(params)])]
+            for mean_error, std_error in zip(mean_errors, std_errors):
+                row.extend([repr(mean_error), repr(std_error)])
+            row.append(int(converged))
+            writer.writerow(row)
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Cross-validated KNN/SVR hyperparameter search')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=229)
+    parser.add_argument('--n_jobs', type=int, default=-1)
+    parser.add_argument('--no-normalize', dest='normalize', action='store_false', help='search on unscaled features')
+    parser.add_argument('--large-c-linear', action='store_true', help='also search linear SVRs with C >= 1 (slow to converge)')
+    parser.add_argument('--artifact', action='store_true', help='read features from the featurize.py artifact')
+    parser.add_argument('--models', default='knn,svr', help='comma-separated subset of knn,svr')
+    parser.add_argument('--trace', action='store_true', help='record a stage trace (see instrument.py)')
+    args = parser.parse_args()
+    if args.trace:
+        instrument.enable()
+
+    print 'Reading features and labels...'
+    if args.artifact:
+        feature_names, features, label_names, labels = regressions.read_feature_artifact(use_privacy_suppressed=True)
+    else:
+        feature_names, features, label_names, labels = regressions.read_features_and_labels(use_privacy_suppressed=True)
+    labels = np.asarray(labels, dtype=float)
+    labeled = ~np.isnan(labels).any(axis=1)
+    features = regressions.as_feature_matrix(features)[labeled]
+    labels = labels[labeled]
+
+    models = args.models.split(',')
+    svr_grid = SVR_GRID + [LARGE_C_LINEAR_SVR_GRID] if args.large_c_linear else SVR_GRID
+    results = run_search(
+        features, labels,
+        knn_grid=KNN_GRID if 'knn' in models else None,
+        svr_grid=svr_grid if 'svr' in models else None,
+        num_folds=args.folds, num_repeats=args.repeats, seed=args.seed,
+        normalize=args.normalize, n_jobs=args.n_jobs)
+    write_results(results, label_names)
+
+    num_unconverged = sum(1 for result in results if not result[4])
+    if num_unconverged:
+        print '%s SVR configurations did not converge within %s iterations' % (num_unconverged, SVR_MAX_ITER)
+    converged_results = [result for result in results if result[4]] or results
+    print '\nBest configurations by mean error:'
+    for i in xrange(len(label_names)):
+        model_name, params, mean_errors, std_errors, converged = min(converged_results, key=lambda result: result[2][i])
+        print '%s: %s %s, %s +/- %s%% error' % (label_names[i], model_name, params, mean_errors[i], std_errors[i])
+    print '\nWrote %s results to %s' % (len(results), RESULTS_FILENAME)
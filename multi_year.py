@@ -0,0 +1,167 @@
+'''Multi-year data module.
+
+The Scorecard ships one merged file per year (data/MERGED1996_PP.csv through
+data/MERGED2014_PP.csv and so on). This module combines several of them into
+a single columnar dataset (see columnar.py):
+
+    python multi_year.py 'data/MERGED*_PP.csv'
+
+Each year's columnar cache is built (if needed) and filtered on its required
+keys in a pool of worker processes, so the CSV parsing is spread across
+cores. The selected rows are then concatenated into a combined cache under
+a unified schema: the union of every year's keys in order of first
+appearance, with columns a year lacks filled with NULL, plus a numeric YEAR
+column tagging each row with the year of its file. A required key missing
+from a year counts as NULL in every row of that year.
+
+The combined cache is reused until one of the source files changes.
+'''
+
+import glob
+import hashlib
+import json
+import numpy as np
+import os
+import re
+import sys
+
+import columnar
+import instrument
+import parallel
+import read_data
+
+
+YEAR_KEY = 'YEAR'
+YEAR_PATTERN = re.compile(r'MERGED(\d{4})')
+MULTI_YEAR_CACHE_PREFIX = 'MULTI_'
+
+
+def get_year(data_file_name):
+    match = YEAR_PATTERN.search(os.path.basename(data_file_name))
+    if match is None:
+        raise ValueError('Cannot find the year in data file name %s' % (data_file_name))
+    return int(match.group(1))
+
+
+def get_unified_keys(key_lists):
+    '''Union of several key lists, in order of first appearance.'''
+    keys = []
+    seen = set()
+    for key_list in key_lists:
+        for key in key_list:
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+    return keys
+
+
+def get_multi_year_cache_path(data_file_names, required_keys, get_unlabeled, cache_dir=columnar.DEFAULT_CACHE_DIR):
+    sha1 = hashlib.sha1(json.dumps([
+        sorted([os.path.abspath(data_file_name) for data_file_name in data_file_names]),
+        list(required_keys), get_unlabeled,
+    ]))
+    return os.path.join(cache_dir, MULTI_YEAR_CACHE_PREFIX + sha1.hexdigest()[:16])
+
+
+def load_year_worker(task):
+    '''Build or validate one year's cache and select its rows; returns
+    (cache path, source SHA-1, selected row indices).'''
+    data_file_name, required_keys, get_unlabeled, cache_dir = task
+    data = columnar.load_columnar(data_file_name, cache_dir)
+    has_null_required = np.zeros(data.num_rows, dtype=bool)
+    for key in required_keys:
+        if key not in data.key_indices:
+            has_null_required[:] = True
+            break
+        has_null_required |= data.null_mask(key)
+    return data.cache_path, columnar.get_content_hash(data.meta), np.flatnonzero(has_null_required == get_unlabeled)
+
+
+def is_multi_year_cache_valid(cache_path, sources):
+    meta_path = os.path.join(cache_path, columnar.META_FILENAME)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    return meta.get('version') == columnar.CACHE_FORMAT_VERSION and meta['sources'] == sources
+
+
+@instrument.timed('build_multi_year_cache')
+def build_multi_year_cache(cache_path, years, year_data, year_row_indices, sources, required_keys, get_unlabeled):
+    '''Concatenate the selected rows of each year's ColumnarData into a
+    combined cache at cache_path, one unified column at a time.'''
+    columnar.prepare_cache_path(cache_path)
+    keys = get_unified_keys([data.keys for data in year_data])
+    if YEAR_KEY in keys:
+        raise ValueError('Data files already have a %s column' % (YEAR_KEY))
+    num_rows = sum(len(row_indices) for row_indices in year_row_indices)
+
+    numeric = [
+        all(data.is_numeric(key) for data in year_data if key in data.key_indices)
+        for key in keys
+    ] + [True]
+
+    def iter_columns():
+        for key in keys:
+            yield np.concatenate([
+                data.strings(key)[row_indices] if key in data.key_indices
+                else np.array(['NULL'] * len(row_indices), dtype='S4')
+                for data, row_indices in zip(year_data, year_row_indices)
+            ])
+        yield np.concatenate([
+            np.array([str(year)] * len(row_indices), dtype='S4')
+            for year, row_indices in zip(years, year_row_indices)
+        ])
+    columnar.save_columns(cache_path, iter_columns(), num_rows, numeric)
+
+    columnar.write_meta(cache_path, {
+        'version': columnar.CACHE_FORMAT_VERSION,
+        'sources': sources,
+        'required_keys': list(required_keys),
+        'get_unlabeled': get_unlabeled,
+        'keys': keys + [YEAR_KEY],
+        'num_rows': num_rows,
+        'numeric': numeric,
+    })
+    return cache_path
+
+
+@instrument.timed('load_multi_year')
+def load_multi_year(data_file_names, required_keys=read_data.DEFAULT_REQUIRED_KEYS, get_unlabeled=True, cache_dir=columnar.DEFAULT_CACHE_DIR, n_jobs=-1):
+    '''Return ColumnarData holding the rows of several yearly data files that
+    read_data.get_filtered_rows would select, combined as described above.
+
+    The data files are processed in year order; the per-file caches are
+    built or checked in up to n_jobs worker processes.'''
+    data_file_names = sorted(data_file_names, key=get_year)
+    years = [get_year(data_file_name) for data_file_name in data_file_names]
+    tasks = [(data_file_name, required_keys, get_unlabeled, cache_dir) for data_file_name in data_file_names]
+    results = parallel.map_with_shared_arrays(load_year_worker, tasks, n_jobs=n_jobs)
+    sources = [
+        {'source': os.path.abspath(data_file_name), 'sha1': sha1}
+        for data_file_name, (cache_path, sha1, row_indices) in zip(data_file_names, results)
+    ]
+
+    cache_path = get_multi_year_cache_path(data_file_names, required_keys, get_unlabeled, cache_dir)
+    if not is_multi_year_cache_valid(cache_path, sources):
+        print 'Building combined cache for %s data files...' % (len(data_file_names))
+        build_multi_year_cache(
+            cache_path, years,
+            [columnar.ColumnarData(year_cache_path) for year_cache_path, sha1, row_indices in results],
+            [row_indices for year_cache_path, sha1, row_indices in results],
+            sources, required_keys, get_unlabeled)
+    return columnar.ColumnarData(cache_path)
+
+
+if __name__=='__main__':
+    instrument.enable_from_argv()
+    patterns = [arg for arg in sys.argv[1:] if not arg.startswith('--')] or ['data/MERGED*_PP.csv']
+    data_file_names = sorted(set([file_name for pattern in patterns for file_name in glob.glob(pattern)]))
+    if not data_file_names:
+        print 'No data files match %s' % (' '.join(patterns))
+        sys.exit(1)
+    data = load_multi_year(data_file_names)
+    years = data.values(YEAR_KEY)
+    print 'Combined %s rows and %s columns from %s files into %s' % (data.num_rows, len(data.keys), len(data_file_names), data.cache_path)
+    for year in np.unique(years):
+        print '\t%d: %s rows' % (year, np.count_nonzero(years == year))
@@ -0,0 +1,111 @@
+'''Null profile module.
+
+Answers questions about missing values (NULL, and by default also
+PrivacySuppressed) straight from the bit-packed bitmaps of a columnar cache
+(see columnar.py), without re-reading the data file or unpacking whole
+columns:
+
+    - which rows have (or lack) values for a set of required keys
+    - per-key missing counts, over all rows or a subset of them
+    - co-missing counts and missing-value patterns within a group of keys
+        (for example every _earn_wne_p8 key)
+    - value breakdowns of a key (for example PREDDEG) over a subset of rows
+
+Row subsets are passed around as packed row masks (one bit per row, as in the
+bitmaps), so combining filters and counting within them are bytewise
+operations over num_rows / 8 bytes per key.
+'''
+
+import numpy as np
+from collections import Counter
+
+
+# Number of set bits in each possible byte value
+POPCOUNT = np.array([bin(i).count('1') for i in xrange(256)], dtype=np.int64)
+
+
+def count_bits(packed):
+    '''Number of set bits along the last axis of a packed uint8 array.'''
+    return POPCOUNT[packed].sum(axis=-1)
+
+
+class NullProfile(object):
+    '''Vectorized missing-value queries over a ColumnarData.'''
+
+    def __init__(self, data, count_private_as_null=True):
+        self.data = data
+        self.keys = data.keys
+        self.num_rows = data.num_rows
+        self.missing_bitmap = np.array(data.null_bitmap)
+        if count_private_as_null:
+            self.missing_bitmap |= data.private_bitmap
+        self.all_rows = np.packbits(np.ones(self.num_rows, dtype=bool))
+        self.row_masks = {}
+
+    def key_indices(self, keys):
+        return [self.data.column_index(key) for key in keys]
+
+    def get_keys_matching(self, substring):
+        return [key for key in self.keys if substring in key]
+
+    def get_rows_missing_any(self, keys):
+        '''Packed mask of rows missing a value for at least one of keys.'''
+        if not keys:
+            return np.zeros_like(self.all_rows)
+        return np.bitwise_or.reduce(self.missing_bitmap[self.key_indices(keys)], axis=0)
+
+    def get_rows_missing_all(self, keys):
+        '''Packed mask of rows missing a value for every one of keys.'''
+        if not keys:
+            return self.all_rows.copy()
+        return np.bitwise_and.reduce(self.missing_bitmap[self.key_indices(keys)], axis=0)
+
+    def get_row_mask(self, required_keys, get_unlabeled=False):
+        '''Packed mask of rows that have every required key (or, with
+        get_unlabeled, that miss at least one, as read_data.get_filtered_rows
+        selects by default). Masks are remembered per set of keys.'''
+        cache_key = (tuple(required_keys), get_unlabeled)
+        if cache_key not in self.row_masks:
+            rows_missing_any = self.get_rows_missing_any(required_keys)
+            self.row_masks[cache_key] = rows_missing_any if get_unlabeled else ~rows_missing_any & self.all_rows
+        return self.row_masks[cache_key]
+
+    def get_row_indices(self, row_mask):
+        return np.flatnonzero(np.unpackbits(row_mask)[:self.num_rows])
+
+    def count_rows(self, row_mask):
+        return int(count_bits(row_mask))
+
+    def missing_counts(self, row_mask=None, keys=None):
+        '''Number of rows (within row_mask, if given) missing each key (every
+        key by default).'''
+        bitmap = self.missing_bitmap if keys is None else self.missing_bitmap[self.key_indices(keys)]
+        return count_bits(bitmap if row_mask is None else bitmap & row_mask)
+
+    def co_missing_counts(self, keys, row_mask=None):
+        '''Matrix whose (i, j) entry is the number of rows (within row_mask)
+        missing both keys[i] and keys[j].'''
+        bitmap = self.missing_bitmap[self.key_indices(keys)]
+        if row_mask is not None:
+            bitmap = bitmap & row_mask
+        return count_bits(bitmap[:, np.newaxis, :] & bitmap[np.newaxis, :, :])
+
+    def missing_patterns(self, keys, row_mask=None):
+        '''Return (pattern, count) pairs, most common first, where pattern is a
+        tuple of booleans telling which of keys a row is missing.'''
+        row_indices = np.arange(self.num_rows) if row_mask is None else self.get_row_indices(row_mask)
+        missing = np.unpackbits(self.missing_bitmap[self.key_indices(keys)], axis=1)[:, row_indices]
+        patterns, counts = np.unique(np.packbits(missing, axis=0).T, axis=0, return_counts=True)
+        order = np.argsort(-counts, kind='mergesort')
+        return [
+            (tuple(np.unpackbits(patterns[i])[:len(keys)].astype(bool)), int(counts[i]))
+            for i in order
+        ]
+
+    def value_counts(self, key, row_mask=None):
+        '''Counter of a key's raw string values (within row_mask).'''
+        column = self.data.strings(key)
+        if row_mask is not None:
+            column = column[self.get_row_indices(row_mask)]
+        values, counts = np.unique(column, return_counts=True)
+        return Counter(dict(zip(values.tolist(), counts.tolist())))
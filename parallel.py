@@ -0,0 +1,48 @@
+'''Process-pool helpers.
+
+Large arrays are shared with worker processes by placing them in
+SHARED_ARRAYS before the pool is created: the forked workers inherit them
+(copy-on-write) instead of receiving a pickled copy with every task. Worker
+functions must be module-level so that they can be pickled, and read their
+inputs from SHARED_ARRAYS.
+'''
+
+import multiprocessing
+
+
+SHARED_ARRAYS = {}
+
+
+def get_num_jobs(n_jobs):
+    '''Resolve an n_jobs setting: None or 1 means serial, -1 means all cores.'''
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(1, multiprocessing.cpu_count() + 1 + n_jobs)
+    return max(1, n_jobs)
+
+
+def map_with_shared_arrays(function, tasks, n_jobs=1, **arrays):
+    '''Return [function(task) for task in tasks], run over a pool of n_jobs
+    worker processes that can read the given arrays from SHARED_ARRAYS.'''
+    n_jobs = min(get_num_jobs(n_jobs), max(1, len(tasks)))
+    SHARED_ARRAYS.update(arrays)
+    try:
+        if n_jobs == 1:
+            return [function(task) for task in tasks]
+        pool = multiprocessing.Pool(n_jobs)
+        try:
+            return pool.map(function, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        for name in arrays:
+            del SHARED_ARRAYS[name]
+
+
+def get_chunks(num_items, num_chunks):
+    '''Split range(num_items) into up to num_chunks contiguous (start, stop) ranges.'''
+    num_chunks = max(1, min(num_chunks, num_items))
+    bounds = [num_items * i // num_chunks for i in xrange(num_chunks + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in xrange(num_chunks) if bounds[i] < bounds[i + 1]]
@@ -1,91 +1,80 @@
 from matplotlib import pyplot as plt
+import csv
+import sys
 
-# k, earnings % error, debt % error
 
-results_uniform = [
-    (1, 15.7433376472, 25.5333903809),
-    (2, 14.7362538724, 25.1462091067),
-    (3, 14.8240456659, 25.9020462885),
-    (4, 14.8049785354, 25.7045893325),
-    (5, 14.764642661, 25.6369962414),
-    (6, 14.6403030834, 25.3814759274),
-    (7, 14.7444364365, 25.7399827522),
-    (8, 14.9226502556, 25.9533358865),
-    (9, 15.0744272556, 26.1958266139),
-    (10, 15.1089090577, 26.3899637849),
-    (11, 15.1417380958, 26.6974126924),
-    (12, 15.3511511477, 26.8911514307),
-    (13, 15.4634503175, 27.0134878753),
-]
+# Written by `python regressions.py --sweep`; one row per (k, weighting) with a
+# percent error and standard error column per label, and with --bootstrap
+# also the bounds of a bootstrap confidence interval, drawn as error bars
+RESULTS_FILENAME = 'knn_sweep_results.csv'
 
-results_distance = [
-    (1, 15.7433376472, 25.5333903809),
-    (2, 14.4611113293, 24.3793347796),
-    (3, 14.4209528009, 24.7070060743),
-    (4, 14.3162239352, 24.3667778512),
-    (5, 14.1749412881, 24.143473456),
-    (6, 14.0338239028, 23.9233611165),
-    (7, 14.070952968, 24.1709686638),
-    (8, 14.1884970546, 24.2899348437),
-    (9, 14.2765378209, 24.5338221617),
-    (10, 14.291136179, 24.7194246147),
-    (11, 14.3373145841, 24.9653430745),
-    (12, 14.5107844022, 25.1126863648),
-    (13, 14.5822070109, 25.262472256),
-]
+LABEL_PLOT_NAMES = {
+    'GRAD_DEBT_MDN': 'Debt',
+    'md_earn_wne_p6': 'Earnings',
+}
+WEIGHTING_PLOT_NAMES = {
+    'uniform': 'uniform-weighted',
+    'inverse_distance': 'distance-weighted',
+}
+WEIGHTING_COLORS = ['m', 'b', 'g', 'r']
+LABEL_MARKERS = ['o', '*', 's', '^']
 
-selected_debt_results_uniform = [
-    (1, 18.2682423828, 27.1670176306),
-    (2, 17.6092004231, 25.8139059257),
-    (3, 17.3873998499, 25.2510325286),
-    (4, 17.2933338301, 26.0905410367),
-    (5, 17.2563046909, 26.6248262912),
-    (6, 17.2707019587, 26.9844024182),
-    (7, 17.4966548441, 27.6000282138),
-    (8, 17.5771031422, 27.8882036157),
-    (9, 17.5797642028, 27.7751435902),
-    (10, 17.6017607192, 28.2921010623),
-    (11, 17.8128943645, 28.3948576962),
-    (12, 17.8921417449, 28.4876828823),
-    (13, 18.0453458565, 28.627932679),
-    (14, 18.0768933682, 28.7237842929),
-    (15, 18.1781966611, 29.1561384453),
-]
 
-selected_debt_results_distance = [
-    (1, 18.2682423828, 27.1670176306),
-    (2, 17.0679342724, 24.9498648788),
-    (3, 16.7217230876, 24.2333463894),
-    (4, 16.5091036143, 24.6052124893),
-    (5, 16.3451571666, 24.8894930736),
-    (6, 16.2619610041, 24.9809273146),
-    (7, 16.3076911148, 25.3377388127),
-    (8, 16.3620085932, 25.4145287756),
-    (9, 16.3311333933, 25.4010186768),
-    (10, 16.3502413156, 25.7542269969),
-    (11, 16.4823260067, 25.8663288699),
-    (12, 16.5163693873, 25.9151793909),
-    (13, 16.6200104691, 26.0162446052),
-    (14, 16.6704177721, 26.1076945191),
-    (15, 16.7737259646, 26.4396573588),
-]
+def read_knn_sweep_results(filename=RESULTS_FILENAME):
+    '''Return label names and a {weighting: [(k, {label: percent error},
+    {label: (interval lower, upper)})]} map; the intervals are empty if the
+    sweep was not bootstrapped.'''
+    with open(filename, 'r') as results_file:
+        rows = [row for row in csv.DictReader(results_file)]
+    header = rows[0].keys() if rows else []
+    label_names = [
+        name for name in header
+        if name not in ['k', 'weighting'] and not name.endswith(('_std_error', '_ci_lower', '_ci_upper'))
+    ]
+    results = {}
+    for row in rows:
+        errors = {label: float(row[label]) for label in label_names}
+        intervals = {
+            label: (float(row['%s_ci_lower' % (label)]), float(row['%s_ci_upper' % (label)]))
+            for label in label_names if row.get('%s_ci_lower' % (label))
+        }
+        results.setdefault(row['weighting'], []).append((int(row['k']), errors, intervals))
+    for weighting in results:
+        results[weighting].sort()
+    return sorted(label_names), results
 
 
 if __name__=='__main__':
-    ks = [i+1 for i in xrange(len(results_uniform))]
-    earnings_err_uniform = [earnings_err for k, earnings_err, debt_err in results_uniform]
-    debt_err_uniform = [debt_err for k, earnings_err, debt_err in results_uniform]
-    earnings_err_distance = [earnings_err for k, earnings_err, debt_err in results_distance]
-    debt_err_distance = [debt_err for k, earnings_err, debt_err in results_distance]
-    
+    results_filename = sys.argv[1] if len(sys.argv) > 1 else RESULTS_FILENAME
+    label_names, results = read_knn_sweep_results(results_filename)
+
     plt.title('KNN-regression performance')
     plt.xlabel('k')
     plt.ylabel('% error, dev set')
-    plt.axis([0, 14, 12, 28])
-    plt.plot(ks, debt_err_uniform, color='m', marker='o', label='Debt, uniform-weighted')
-    plt.plot(ks, debt_err_distance, color='b', marker='o', label='Debt, distance-weighted')
-    plt.plot(ks, earnings_err_uniform, color='m', marker='*', label='Earnings, uniform-weighted')
-    plt.plot(ks, earnings_err_distance, color='b', marker='*', label='Earnings, distance-weighted')
+    all_ks = [k for weighting in results for k, errors, intervals in results[weighting]]
+    all_errors = [
+        error for weighting in results
+        for k, errors, intervals in results[weighting] for label in label_names
+        for error in [errors[label]] + list(intervals.get(label, ()))
+    ]
+    plt.axis([0, max(all_ks) + 1, int(min(all_errors)) - 2, int(max(all_errors)) + 2])
+    for label_index, label in enumerate(label_names):
+        for weighting_index, weighting in enumerate(sorted(results, reverse=True)):
+            ks = [k for k, errors, intervals in results[weighting]]
+            label_errors = [errors[label] for k, errors, intervals in results[weighting]]
+            y_errors = None
+            if all(label in intervals for k, errors, intervals in results[weighting]):
+                y_errors = [
+                    [errors[label] - intervals[label][0] for k, errors, intervals in results[weighting]],
+                    [intervals[label][1] - errors[label] for k, errors, intervals in results[weighting]],
+                ]
+            plt.errorbar(
+                ks, label_errors, yerr=y_errors, capsize=2,
+                color=WEIGHTING_COLORS[weighting_index % len(WEIGHTING_COLORS)],
+                marker=LABEL_MARKERS[label_index % len(LABEL_MARKERS)],
+                label='%s, %s' % (
+                    LABEL_PLOT_NAMES.get(label, label),
+                    WEIGHTING_PLOT_NAMES.get(weighting, weighting)))
     plt.legend(loc='center right')
     plt.show()
-    print 'Done'
\ No newline at end of file
+    print 'Done'
@@ -0,0 +1,336 @@
+'''Prediction server module.
+
+Serves debt/earnings predictions for raw school rows over local HTTP. The
+fitted FeatureTransformer (featurize.py's feature_transformer.pickle) and the
+training examples of the feature artifact are loaded once at startup and the
+model (KNN or SVR) is fit once; requests are then featurized with the stored
+schema. Concurrent requests are gathered into micro-batches: each request's
+rows are featurized on their own, so that rows the transformer rejects only
+fail their own request (with a 400), and the features of the whole batch
+are then predicted with one vectorized call.
+
+    python prediction_server.py --model knn --k 6 --weighting inverse_distance --port 8229
+
+Endpoints:
+
+    POST /predict  {"rows": [{"INSTNM": "...", "PREDDEG": "3", ...}, ...]}
+        Keys missing from a row, and null values, are treated as NULL. Returns
+        {"label_names": [...], "predictions": [[...], ...], "latency_ms": ...}
+    GET /metrics   request, row and batch counts, batch sizes, latency
+        percentiles and throughput since startup
+'''
+
+import argparse
+import BaseHTTPServer
+import json
+import numpy as np
+import Queue
+import SocketServer
+import threading
+import time
+
+import feature_artifacts
+import featurize
+import instrument
+import regressions
+
+
+DEFAULT_PORT = 8229
+# A batch is predicted once it holds MAX_BATCH_ROWS rows or its first
+# request has waited MAX_BATCH_WAIT_SECONDS
+MAX_BATCH_ROWS = 256
+MAX_BATCH_WAIT_SECONDS = 0.005
+# Number of most recent requests kept for latency percentiles
+LATENCY_WINDOW = 10000
+
+
+def to_string(value):
+    # Data files hold UTF-8 bytes and spell missing values NULL; JSON
+    # numbers are accepted as their text
+    if value is None:
+        return 'NULL'
+    return value.encode('utf-8') if isinstance(value, unicode) else str(value)
+
+
+class Predictor(object):
+    '''Featurizes raw rows with a fitted FeatureTransformer and predicts them
+    with a KNN or SVR model fit once on the artifact's labeled examples.'''
+
+    def __init__(self, transformer, model='knn', k=5, weighting='uniform', normalize=False, artifact_dir=feature_artifacts.DEFAULT_ARTIFACT_DIR, **svr_params):
+        self.transformer = transformer
+        self.model_name = model
+        self.k = k
+        self.weighting = weighting
+        feature_names, features, self.label_names, labels = regressions.read_feature_artifact(
+            artifact_dir, use_privacy_suppressed=True)
+        # featurize.py drops some PrivacySuppressed-coded features before
+        # writing the artifact, so match the transformer's columns by name
+        transformer_names = transformer.feature_names + transformer.privacy_suppressed_names
+        name_indices = {name: i for i, name in enumerate(transformer_names)}
+        if any(name not in name_indices for name in feature_names):
+            raise ValueError('Feature artifact in %s was not written with this transformer' % (artifact_dir))
+        self.feature_indices = [name_indices[name] for name in feature_names]
+        labels = np.asarray(labels, dtype=float)
+        labeled = ~np.isnan(labels).any(axis=1)
+        features = regressions.as_feature_matrix(features)[labeled]
+        labels = labels[labeled]
+        self.scaler = regressions.normalize_features(features) if normalize else None
+
+        if model == 'knn':
+            self.model = regressions.KNNRegressor().fit((features, labels))
+        elif model == 'svr':
+            self.model = regressions.fit_svr_models(features, labels, **svr_params)
+        else:
+            raise ValueError('Unknown model %s' % (model))
+
+    @instrument.timed('serve.featurize')
+    def featurize(self, rows):
+        '''Feature matrix for rows given as {key: string value} dicts.
+        Raises ValueError for values the transformer cannot parse.'''
+        keys = sorted(set([key for row in rows for key in row]))
+        row_lists = [[row.get(key, 'NULL') for key in keys] for row in rows]
+        features, privacy_suppressed_values = self.transformer.transform(row_lists, keys)
+        if self.transformer.sparse:
+            features = features.toarray()
+        features = np.hstack([features, privacy_suppressed_values])[:, self.feature_indices]
+        if self.scaler is not None:
+            self.scaler.transform(features)
+        return features
+
+    def predict(self, rows):
+        '''Return a (num_rows, num_labels) array of predictions.'''
+        return self.predict_features(self.featurize(rows))
+
+    @instrument.timed('serve.predict')
+    def predict_features(self, features):
+        '''Predict rows already featurized by featurize.'''
+        if self.model_name == 'knn':
+            return self.model.predict(features, k=self.k, weighting=self.weighting)
+        return regressions.predict_svr_models(self.model, features)
+
+
+class PendingRequest(object):
+    def __init__(self, rows):
+        self.rows = rows
+        self.received = time.time()
+        self.done = threading.Event()
+        self.features = None
+        self.predictions = None
+        self.error = None
+        self.status = None
+
+    def fail(self, status, error):
+        self.status = status
+        self.error = '%s: %s' % (type(error).__name__, error)
+        self.done.set()
+
+
+class Metrics(object):
+    '''Thread-safe request, batch and latency statistics.'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.requests = 0
+        self.rows = 0
+        self.errors = 0
+        self.batches = 0
+        self.batch_rows = []
+        self.latencies = []
+
+    def record_batch(self, num_rows):
+        with self.lock:
+            self.batches += 1
+            self.batch_rows.append(num_rows)
+            del self.batch_rows[:-LATENCY_WINDOW]
+
+    def record_request(self, num_rows, latency, error=False):
+        with self.lock:
+            self.requests += 1
+            self.rows += num_rows
+            self.errors += int(error)
+            self.latencies.append(latency)
+            del self.latencies[:-LATENCY_WINDOW]
+
+    def get_summary(self):
+        with self.lock:
+            seconds = time.time() - self.start
+            latencies_ms = 1000.0 * np.array(self.latencies)
+            summary = {
+                'uptime_seconds': seconds,
+                'requests': self.requests,
+                'rows': self.rows,
+                'errors': self.errors,
+                'batches': self.batches,
+                'mean_batch_rows': float(np.mean(self.batch_rows)) if self.batch_rows else None,
+                'requests_per_second': self.requests / seconds if seconds > 0 else None,
+                'rows_per_second': self.rows / seconds if seconds > 0 else None,
+            }
+            for percentile in [50, 95, 99]:
+                summary['latency_ms_p%s' % (percentile)] = (
+                    float(np.percentile(latencies_ms, percentile)) if len(latencies_ms) else None)
+            return summary
+
+
+class MicroBatcher(object):
+    '''Collects rows from concurrent requests into batches that a single
+    worker thread predicts with one call to predict(features).
+
+    Each request's rows are first featurized on their own with
+    featurize(rows); a request whose rows raise one of INPUT_ERRORS fails
+    with status 400 without affecting the rest of the batch.'''
+
+    INPUT_ERRORS = (ValueError, TypeError, KeyError)
+
+    def __init__(self, featurize, predict, metrics, max_batch_rows=MAX_BATCH_ROWS, max_wait_seconds=MAX_BATCH_WAIT_SECONDS):
+        self.featurize = featurize
+        self.predict = predict
+        self.metrics = metrics
+        self.max_batch_rows = max_batch_rows
+        self.max_wait_seconds = max_wait_seconds
+        self.queue = Queue.Queue()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, rows):
+        '''Queue rows for prediction and block until they are predicted.'''
+        request = PendingRequest(rows)
+        self.queue.put(request)
+        request.done.wait()
+        return request
+
+    def get_batch(self):
+        batch = [self.queue.get()]
+        num_rows = len(batch[0].rows)
+        deadline = batch[0].received + self.max_wait_seconds
+        while num_rows < self.max_batch_rows:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=timeout)
+            except Queue.Empty:
+                break
+            batch.append(request)
+            num_rows += len(request.rows)
+        return batch
+
+    def featurize_requests(self, batch):
+        '''Featurize each request of a batch, failing the ones with bad
+        input; returns the requests that remain.'''
+        featurized = []
+        for request in batch:
+            try:
+                request.features = self.featurize(request.rows)
+            except self.INPUT_ERRORS as e:
+                request.fail(400, e)
+            except Exception as e:
+                request.fail(500, e)
+            else:
+                featurized.append(request)
+        return featurized
+
+    def run(self):
+        while True:
+            batch = self.featurize_requests(self.get_batch())
+            if not batch:
+                continue
+            self.metrics.record_batch(sum(len(request.rows) for request in batch))
+            try:
+                predictions = self.predict(np.vstack([request.features for request in batch]))
+            except Exception as e:
+                for request in batch:
+                    request.fail(500, e)
+                continue
+            start = 0
+            for request in batch:
+                request.predictions = predictions[start:start + len(request.rows)]
+                request.features = None
+                start += len(request.rows)
+                request.done.set()
+
+
+class PredictionRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def send_json(self, status, response):
+        body = json.dumps(response)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self.send_json(200, self.server.metrics.get_summary())
+        else:
+            self.send_json(404, {'error': 'Unknown path %s' % (self.path)})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self.send_json(404, {'error': 'Unknown path %s' % (self.path)})
+            return
+        start = time.time()
+        try:
+            rows = json.loads(self.rfile.read(int(self.headers.getheader('Content-Length', 0))))['rows']
+            rows = [dict((to_string(key), to_string(value)) for key, value in row.items()) for row in rows]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.server.metrics.record_request(0, time.time() - start, error=True)
+            self.send_json(400, {'error': 'Expected {"rows": [{key: value}, ...]}: %s' % (e)})
+            return
+        request = self.server.batcher.submit(rows) if rows else None
+        latency = time.time() - start
+        if request is not None and request.error:
+            self.server.metrics.record_request(len(rows), latency, error=True)
+            self.send_json(request.status, {'error': request.error})
+            return
+        self.server.metrics.record_request(len(rows), latency)
+        self.send_json(200, {
+            'label_names': self.server.predictor.label_names,
+            'predictions': request.predictions.tolist() if request is not None else [],
+            'latency_ms': 1000.0 * latency,
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PredictionServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, predictor, max_batch_rows=MAX_BATCH_ROWS, max_wait_seconds=MAX_BATCH_WAIT_SECONDS):
+        BaseHTTPServer.HTTPServer.__init__(self, address, PredictionRequestHandler)
+        self.predictor = predictor
+        self.metrics = Metrics()
+        self.batcher = MicroBatcher(
+            predictor.featurize, predictor.predict_features, self.metrics, max_batch_rows, max_wait_seconds)
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Serve KNN/SVR predictions for raw school rows')
+    parser.add_argument('--model', default='knn', choices=['knn', 'svr'])
+    parser.add_argument('--k', type=int, default=6)
+    parser.add_argument('--weighting', default='inverse_distance', choices=regressions.KNN_WEIGHTINGS)
+    parser.add_argument('--normalize', action='store_true')
+    parser.add_argument('--transformer', default=featurize.TRANSFORMER_FILENAME)
+    parser.add_argument('--artifact-dir', default=feature_artifacts.DEFAULT_ARTIFACT_DIR)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-batch-rows', type=int, default=MAX_BATCH_ROWS)
+    parser.add_argument('--max-wait-ms', type=float, default=1000 * MAX_BATCH_WAIT_SECONDS)
+    parser.add_argument('--trace', action='store_true', help='record a stage trace (see instrument.py)')
+    args = parser.parse_args()
+    if args.trace:
+        instrument.enable()
+
+    print 'Loading transformer and fitting %s model...' % (args.model)
+    predictor = Predictor(
+        featurize.FeatureTransformer.load(args.transformer), model=args.model, k=args.k,
+        weighting=args.weighting, normalize=args.normalize, artifact_dir=args.artifact_dir)
+    server = PredictionServer((args.host, args.port), predictor, args.max_batch_rows, args.max_wait_ms / 1000.0)
+    print 'Serving predictions on http://%s:%s/predict' % (args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
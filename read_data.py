@@ -6,7 +6,8 @@ set of fields.
 '''
 
 import codecs
-# import csv
+import csv
+import instrument
 
 
 DEFAULT_DATA_FILE_NAME = 'data/MERGED2011_PP.csv'
@@ -23,32 +24,100 @@ def is_null(row, key_index, count_private_as_null=True):
     return row[key_index] == 'NULL' or (count_private_as_null and row[key_index] == 'PrivacySuppressed')
 
 
-def get_all_rows(data_file_name=DEFAULT_DATA_FILE_NAME):
-    with open(data_file_name, 'r') as data_file:
-        # reader = csv.reader(data_file)
-        # rows = [row for row in csv.reader(data_file)]
-        rows = data_file.readlines()
-        for i in xrange(len(rows)):
-            if rows[i].startswith(codecs.BOM_UTF8):
-                rows[i] = rows[i][len(codecs.BOM_UTF8):]
-            rows[i] = rows[i].strip().split(',')
-        return rows[1:], rows[0]
+def read_keys(data_file_name=DEFAULT_DATA_FILE_NAME):
+    '''Return the column names from the header of a data file.'''
+    with open(data_file_name, 'rb') as data_file:
+        return get_header(csv.reader(data_file))
 
 
-def get_filtered_rows(data_file_name=DEFAULT_DATA_FILE_NAME, required_keys=DEFAULT_REQUIRED_KEYS, get_unlabeled=True):
-    '''Return all rows that have non-NULL/PrivacySuppressed entries for all required keys.'''
-    all_rows, keys = get_all_rows(data_file_name=data_file_name)
+def get_header(reader):
+    keys = next(reader)
+    if keys and keys[0].startswith(codecs.BOM_UTF8):
+        keys[0] = keys[0][len(codecs.BOM_UTF8):]
+    return keys
+
+
+def get_key_indices(keys, selected_keys):
+    if selected_keys is None:
+        return None
+    return [keys.index(key) for key in selected_keys]
+
+
+def iter_rows(data_file_name=DEFAULT_DATA_FILE_NAME, selected_keys=None, row_filter=None):
+    '''Generate the data rows of a file one at a time.
+
+    Rows are parsed with the csv module, so quoted fields may contain commas.
+    If given, row_filter(row) is called on each full row and rows for
+    which it returns False are skipped. If selected_keys is given, the rows
+    that are generated contain only those columns, in that order.'''
+    with open(data_file_name, 'rb') as data_file:
+        reader = csv.reader(data_file)
+        keys = get_header(reader)
+        selected_indices = get_key_indices(keys, selected_keys)
+        for row in reader:
+            if not row:
+                continue
+            if row_filter is not None and not row_filter(row):
+                continue
+            if selected_indices is not None:
+                row = [row[i] for i in selected_indices]
+            yield row
+
+
+def get_required_keys_filter(keys, required_keys=DEFAULT_REQUIRED_KEYS, get_unlabeled=True):
+    '''Return a row_filter for iter_rows implementing get_filtered_rows' selection.'''
     required_indices = [keys.index(key) for key in required_keys]
-    filtered_rows = []
-    for row in all_rows:
-        has_null_required = any([is_null(row, i) for i in required_indices])
-        if (get_unlabeled and has_null_required) or ((not get_unlabeled) and (not has_null_required)):
-            filtered_rows.append(row)
-    return filtered_rows, keys
+
+    def row_filter(row):
+        has_null_required = any(is_null(row, i) for i in required_indices)
+        return has_null_required == get_unlabeled
+    return row_filter
+
+
+def iter_filtered_rows(data_file_name=DEFAULT_DATA_FILE_NAME, required_keys=DEFAULT_REQUIRED_KEYS, get_unlabeled=True, selected_keys=None):
+    '''Generate the rows get_filtered_rows would return, one at a time.'''
+    keys = read_keys(data_file_name)
+    row_filter = get_required_keys_filter(keys, required_keys, get_unlabeled)
+    return iter_rows(data_file_name, selected_keys=selected_keys, row_filter=row_filter)
+
+
+@instrument.timed('read')
+def get_all_rows(data_file_name=DEFAULT_DATA_FILE_NAME, selected_keys=None, use_cache=False):
+    '''Return all data rows and the keys naming their columns.
+
+    With use_cache, rows are served from the columnar cache (see columnar.py),
+    which is built on first use and rebuilt when the data file changes.'''
+    if use_cache:
+        import columnar
+        data = columnar.load_columnar(data_file_name)
+        rows, keys = data.rows(selected_keys=selected_keys), data.keys
+    else:
+        keys = read_keys(data_file_name)
+        rows = list(iter_rows(data_file_name, selected_keys=selected_keys))
+    instrument.count('rows_read', len(rows))
+    return rows, (selected_keys if selected_keys is not None else keys)
+
+
+@instrument.timed('filter')
+def get_filtered_rows(data_file_name=DEFAULT_DATA_FILE_NAME, required_keys=DEFAULT_REQUIRED_KEYS, get_unlabeled=True, selected_keys=None, use_cache=False):
+    '''Return all rows that have non-NULL/PrivacySuppressed entries for all required keys.'''
+    if use_cache:
+        import columnar
+        data = columnar.load_columnar(data_file_name)
+        row_indices = data.get_filtered_row_indices(required_keys, get_unlabeled)
+        filtered_rows, keys = data.rows(row_indices, selected_keys=selected_keys), data.keys
+    else:
+        keys = read_keys(data_file_name)
+        filtered_rows = list(iter_filtered_rows(
+            data_file_name, required_keys=required_keys, get_unlabeled=get_unlabeled,
+            selected_keys=selected_keys))
+    instrument.count('rows_kept', len(filtered_rows))
+    return filtered_rows, (selected_keys if selected_keys is not None else keys)
 
 
 if __name__=='__main__':
-    all_rows, keys = get_all_rows()
+    instrument.enable_from_argv()
+    all_rows, keys = get_all_rows(use_cache=True)
     filtered_rows, keys2 = get_filtered_rows()
     assert keys == keys2
     print 'Filter step selected %s of %s rows' % (len(filtered_rows), len(all_rows))
\ No newline at end of file
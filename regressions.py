@@ -1,15 +1,53 @@
 '''Module to run regressions on data from Python.'''
 
+import cPickle as pickle
 import csv
+import feature_artifacts
+import instrument
 import numpy as np
+import parallel
+import scipy.sparse
+import scoring
+import sys
+import time
 from sklearn import svm
+from sklearn.neighbors import BallTree, KDTree
 
 
 FEATURES_FILENAME = 'out_features.csv'
 LABELS_FILENAME = 'out_labels.csv'
 DATA_SPLIT_FILENAME = 'data_split_indices.csv'
 
+# Feature matrices are float64 unless the compact (float32) mode is chosen;
+# labels, statistics and distances returned to callers stay float64
+DEFAULT_DTYPE = np.float64
+COMPACT_DTYPE = np.float32
 
+# Rows per block when fitting FeatureScaler statistics
+SCALER_BLOCK_SIZE = 4096
+
+# Rough cap on the number of values in each block of KNN scratch arrays
+KNN_BLOCK_ELEMENTS = 2 ** 22
+
+# Above this many features KNNRegressor skips tree indexes by default
+KNN_TREE_MAX_DIMENSIONS = 20
+
+# Inverted-file (IVF) approximate KNN: k-means iterations when fitting the
+# coarse clustering, training rows sampled per list to fit it, and the
+# default number of lists searched per query
+IVF_KMEANS_ITERATIONS = 20
+IVF_SAMPLE_ROWS_PER_LIST = 256
+IVF_DEFAULT_PROBES = 8
+
+KNN_WEIGHTINGS = ['uniform', 'inverse_distance']
+KNN_SWEEP_FILENAME = 'knn_sweep_results.csv'
+
+SVR_PARAMS = {'C': 0.00000005}
+# Don't split SVR predictions over processes for fewer rows than this
+SVR_MIN_CHUNK_ROWS = 1000
+
+
+@instrument.timed('read_features')
 def read_features_and_labels(features_filename=FEATURES_FILENAME, labels_filename=LABELS_FILENAME, feature_selection=None, use_privacy_suppressed=False):
     if use_privacy_suppressed:
         feature_names = None
@@ -22,9 +60,8 @@ def read_features_and_labels(features_filename=FEATURES_FILENAME, labels_filenam
             feature_names = raw_rows[0]
             feature_rows = [[float(val) for val in row] for row in raw_rows[1:]]
             if feature_selection:
-                with open(feature_selection, 'r') as f:
-                    indices = [int(s.strip()) for s in f.read().strip().split(',')]
-                feature_rows = [[v for i, v in enumerate(row) if indices[i]] for row in feature_rows]
+                indices = feature_artifacts.read_feature_selection(feature_selection)
+                feature_rows = np.array(feature_rows)[:, indices].tolist()
     with open(labels_filename, 'r') as labels_file:
         raw_rows = [row for row in csv.reader(labels_file)]
         label_names = raw_rows[0]
@@ -32,116 +69,897 @@ def read_features_and_labels(features_filename=FEATURES_FILENAME, labels_filenam
     return feature_names, feature_rows, label_names, label_rows
 
 
-def normalize_features(feature_rows):
-    for i in xrange(len(feature_rows[0])):
-        values = [row[i] for row in feature_rows]
-        mean = np.mean(values)
-        std = np.std(values)
-        for j in xrange(len(feature_rows)):
-            feature_rows[j][i] = (feature_rows[j][i] - mean) / std
+@instrument.timed('read_features')
+def read_feature_artifact(artifact_dir=feature_artifacts.DEFAULT_ARTIFACT_DIR, feature_selection=None, use_privacy_suppressed=False, dtype=None):
+    '''Like read_features_and_labels, but memory-maps a featurize.py artifact
+    and returns the features and labels as 2D arrays.
 
+    With use_privacy_suppressed, the PrivacySuppressed-coded features are
+    appended after the (selected) regular features. Dense features are
+    returned as an array of dtype (by default the artifact's), copied at
+    most once. Without a conversion, all features or a selection of
+    consecutive ones are returned as a view of the memory map; any other
+    selection is gathered into a contiguous array a block of rows at a time
+    (see take_columns).'''
+    header, features, labels, privacy_suppressed_values = feature_artifacts.read_artifact(artifact_dir)
+    feature_names = header['feature_names']
+    dtype = get_float_dtype(features, dtype)
+    indices = None
+    if feature_selection:
+        indices = feature_artifacts.read_feature_selection(feature_selection)
+        feature_names = [feature_names[i] for i in indices]
+        column_slice = get_contiguous_slice(indices)
+        if scipy.sparse.issparse(features) or column_slice is not None:
+            features = features[:, indices if column_slice is None else column_slice]
+            indices = None
+    if use_privacy_suppressed and scipy.sparse.issparse(features):
+        features = scipy.sparse.hstack([features, privacy_suppressed_values], format='csr', dtype=dtype)
+        feature_names = feature_names + header['privacy_suppressed_names']
+    elif use_privacy_suppressed:
+        features = take_columns(features, indices, dtype, privacy_suppressed_values)
+        feature_names = feature_names + header['privacy_suppressed_names']
+    elif indices is not None:
+        features = take_columns(features, indices, dtype)
+    return feature_names, as_feature_matrix(features, dtype), header['label_names'], labels
 
-def get_data_splits(feature_rows, label_rows):
-    with open(DATA_SPLIT_FILENAME, 'r') as f:
+
+def get_contiguous_slice(indices):
+    '''A slice selecting the same columns as indices if they are
+    consecutive and ascending, else None.'''
+    if len(indices) == 0:
+        return slice(0, 0)
+    if np.array_equal(indices, np.arange(indices[0], indices[0] + len(indices))):
+        return slice(indices[0], indices[-1] + 1)
+    return None
+
+
+def take_columns(matrix, indices, dtype, extra_columns=None):
+    '''Return matrix[:, indices] (all columns if indices is None), followed
+    by extra_columns if given, as one new array of dtype. Rows are copied a
+    block at a time, so a memory-mapped matrix is never read into a
+    full-size temporary.'''
+    num_selected = matrix.shape[1] if indices is None else len(indices)
+    num_extra = 0 if extra_columns is None else extra_columns.shape[1]
+    columns = np.empty((matrix.shape[0], num_selected + num_extra), dtype=dtype)
+    for start in xrange(0, matrix.shape[0], SCALER_BLOCK_SIZE):
+        rows = slice(start, start + SCALER_BLOCK_SIZE)
+        columns[rows, :num_selected] = matrix[rows] if indices is None else matrix[rows][:, indices]
+        if num_extra:
+            columns[rows, num_selected:] = extra_columns[rows]
+    return columns
+
+
+class FeatureScaler(object):
+    '''Standardizes features with means and standard deviations fit once
+    (normally on the training split) and reused for any other rows.
+
+    Zero-variance columns are only centered, not divided by zero. Sparse
+    (scipy.sparse) features are only divided by the standard deviations, not
+    centered, so that their zeros stay zero; Euclidean distances, and so KNN,
+    are unaffected by the missing shift.'''
+
+    def __init__(self, block_size=SCALER_BLOCK_SIZE):
+        self.block_size = block_size
+        self.num_rows = 0
+        self.means = None
+        self.variances = None
+        self.stds = None
+
+    def fit(self, features):
+        if scipy.sparse.issparse(features):
+            return self.fit_sparse(features)
+        # Statistics are accumulated in float64 over blocks of rows so that
+        # no temporary the size of the whole matrix is created
+        features = as_feature_matrix(features)
+        num_rows = len(features)
+        sums = np.zeros(features.shape[1])
+        for start in xrange(0, num_rows, self.block_size):
+            sums += features[start:start + self.block_size].sum(axis=0, dtype=np.float64)
+        self.means = sums / num_rows
+        squared_deviations = np.zeros(features.shape[1])
+        for start in xrange(0, num_rows, self.block_size):
+            deviations = features[start:start + self.block_size] - self.means
+            squared_deviations += np.einsum('ij,ij->j', deviations, deviations)
+        return self.set_variances(num_rows, squared_deviations / num_rows)
+
+    def fit_sparse(self, features):
+        # Each column's squared deviations are those of its stored values
+        # plus those of its implicit zeros, so only nonzeros are visited
+        features = scipy.sparse.csc_matrix(features)
+        num_rows, num_features = features.shape
+        self.means = np.asarray(features.sum(axis=0, dtype=np.float64)).ravel() / num_rows
+        counts = np.diff(features.indptr)
+        columns = np.repeat(np.arange(num_features), counts)
+        deviations = features.data.astype(np.float64) - self.means[columns]
+        squared_deviations = np.bincount(columns, weights=deviations * deviations, minlength=num_features)
+        squared_deviations += (num_rows - counts) * self.means ** 2
+        return self.set_variances(num_rows, squared_deviations / num_rows)
+
+    def set_variances(self, num_rows, variances):
+        self.num_rows = num_rows
+        self.variances = variances
+        self.stds = np.sqrt(variances)
+        self.stds[self.stds == 0] = 1.0
+        return self
+
+    def partial_fit(self, features):
+        '''Update the statistics with more rows, as if fit on all rows seen.
+
+        The new rows' means and variances are merged into the running ones
+        with the pairwise update of Chan et al., so earlier rows are not
+        needed again.'''
+        features = as_feature_matrix(features)
+        if features.shape[0] == 0:
+            return self
+        if self.means is None or self.num_rows == 0:
+            return self.fit(features)
+        batch = FeatureScaler(self.block_size).fit(features)
+        num_rows = self.num_rows + batch.num_rows
+        deltas = batch.means - self.means
+        squared_deviations = (
+            self.variances * self.num_rows + batch.variances * batch.num_rows
+            + deltas ** 2 * self.num_rows * batch.num_rows / float(num_rows))
+        self.means = self.means + deltas * batch.num_rows / float(num_rows)
+        return self.set_variances(num_rows, squared_deviations / num_rows)
+
+    def transform(self, features):
+        '''Standardize a 2D float array (of any float dtype) in place and
+        return it. Other inputs (such as lists of rows) are converted to a new
+        array first. CSR and CSC matrices are scaled in place; other sparse
+        formats are converted to a new CSR matrix.'''
+        if scipy.sparse.issparse(features):
+            if features.format not in ('csr', 'csc') or features.dtype.kind != 'f':
+                features = scipy.sparse.csr_matrix(features, dtype=get_float_dtype(features))
+            if features.format == 'csr':
+                features.data /= self.stds[features.indices]
+            else:
+                features.data /= np.repeat(self.stds, np.diff(features.indptr))
+            return features
+        features = as_feature_matrix(features)
+        for start in xrange(0, len(features), self.block_size):
+            block = features[start:start + self.block_size]
+            block -= self.means
+            block /= self.stds
+        return features
+
+    def fit_transform(self, features):
+        return self.fit(features).transform(features)
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            np.savez(f, num_rows=self.num_rows, means=self.means, variances=self.variances, stds=self.stds)
+
+    @staticmethod
+    def load(filename):
+        scaler = FeatureScaler()
+        with np.load(filename) as arrays:
+            scaler.means = arrays['means']
+            scaler.stds = arrays['stds']
+            # Scalers saved before partial_fit existed lack the running statistics
+            if 'variances' in arrays:
+                scaler.num_rows = int(arrays['num_rows'])
+                scaler.variances = arrays['variances']
+        return scaler
+
+
+@instrument.timed('normalize')
+def normalize_features(feature_rows, scaler=None):
+    '''Standardize feature_rows (a list of rows, a 2D float array or a
+    sparse CSR matrix) in place.
+
+    Fits a new FeatureScaler unless one is passed in; returns the scaler so
+    that other splits can be normalized with the same statistics.'''
+    if scaler is None:
+        scaler = FeatureScaler().fit(feature_rows)
+    if isinstance(feature_rows, np.ndarray) or scipy.sparse.issparse(feature_rows):
+        scaler.transform(feature_rows)
+    else:
+        normalized_rows = scaler.transform(np.array(feature_rows, dtype=float)).tolist()
+        for row, normalized_row in zip(feature_rows, normalized_rows):
+            row[:] = normalized_row
+    return scaler
+
+
+def get_data_split_indices(num_rows, split_filename=DATA_SPLIT_FILENAME):
+    '''Return (train, dev, test) arrays of row indices: the first 3500 rows
+    listed (1-based) in split_filename are for training, the next 1000 for
+    development and all other rows for testing.'''
+    with open(split_filename, 'r') as f:
         indices = [int(row.strip()) - 1 for row in f]
-    train_indices = set(indices[:3500])
-    dev_indices = set(indices[3500:4500])
-    train, dev, test = [], [], []
-    for i in xrange(len(feature_rows)):
-        example = (feature_rows[i], label_rows[i])
-        if i in train_indices:
-            train.append(example)
-        elif i in dev_indices:
-            dev.append(example)
+    split = np.full(num_rows, 2, dtype=np.int8)
+    split[[i for i in indices[3500:4500] if 0 <= i < num_rows]] = 1
+    split[[i for i in indices[:3500] if 0 <= i < num_rows]] = 0
+    return tuple(np.flatnonzero(split == i) for i in xrange(3))
+
+
+@instrument.timed('split')
+def get_data_split_views(features, labels, split_filename=DATA_SPLIT_FILENAME, dtype=None):
+    '''Return (train, dev, test) as (RowView of features, label array)
+    pairs: the feature rows of each split are gathered (in dtype) only when
+    a model reads them, instead of being copied into per-split lists.'''
+    if not scipy.sparse.issparse(features) and not isinstance(features, np.ndarray):
+        features = as_feature_matrix(features, dtype)
+    labels = np.asarray(labels, dtype=float)
+    return tuple(
+        (RowView(features, split_indices, dtype), labels[split_indices])
+        for split_indices in get_data_split_indices(labels.shape[0], split_filename)
+    )
+
+
+@instrument.timed('split')
+def get_data_splits(feature_rows, label_rows):
+    return tuple(
+        [(feature_rows[i], label_rows[i]) for i in split_indices]
+        for split_indices in get_data_split_indices(len(feature_rows))
+    )
+
+
+def get_feature_matrix(examples, dtype=None):
+    '''Return the features of a list of (features, labels) examples (or of a
+    (feature matrix, label matrix) pair) as a 2D array, or as a CSR matrix
+    if the pair's feature matrix is sparse.'''
+    if isinstance(examples, tuple):
+        return as_feature_matrix(examples[0], dtype)
+    return np.array([features for features, labels in examples], dtype=get_float_dtype(None, dtype))
+
+
+def get_feature_rows(examples):
+    '''Like get_feature_matrix, but leaves a RowView to be read block by block.'''
+    if isinstance(examples, tuple) and isinstance(examples[0], RowView):
+        return examples[0]
+    return get_feature_matrix(examples)
+
+
+def get_float_dtype(features, dtype=None):
+    '''dtype if given, else the float dtype of features, else DEFAULT_DTYPE.'''
+    if dtype is not None:
+        return np.dtype(dtype)
+    feature_dtype = getattr(features, 'dtype', None)
+    if feature_dtype is not None and feature_dtype.kind == 'f':
+        return feature_dtype
+    return np.dtype(DEFAULT_DTYPE)
+
+
+def as_feature_matrix(features, dtype=None):
+    '''Return features as a 2D float array (or CSR matrix), keeping their
+    float dtype unless dtype is given.'''
+    if isinstance(features, RowView):
+        return features.take(dtype=dtype)
+    dtype = get_float_dtype(features, dtype)
+    if scipy.sparse.issparse(features):
+        return scipy.sparse.csr_matrix(features, dtype=dtype)
+    return np.asarray(features, dtype=dtype)
+
+
+def take_rows(matrix, indices, dtype=None):
+    '''Gather rows of a 2D array (or CSR matrix) into a new contiguous matrix
+    of dtype, converting block by block so that no full-size temporary of
+    the source dtype is made.'''
+    dtype = get_float_dtype(matrix, dtype)
+    if scipy.sparse.issparse(matrix):
+        return scipy.sparse.csr_matrix(matrix)[indices].astype(dtype)
+    rows = np.empty((len(indices), matrix.shape[1]), dtype=dtype)
+    for start in xrange(0, len(indices), SCALER_BLOCK_SIZE):
+        rows[start:start + SCALER_BLOCK_SIZE] = matrix[indices[start:start + SCALER_BLOCK_SIZE]]
+    return rows
+
+
+class RowView(object):
+    '''The rows of a feature matrix at the given indices, without a copy.
+
+    Slicing a RowView gathers just the selected rows (converted to dtype,
+    by default the matrix's own float dtype), so brute-force KNN can read
+    a split's queries block by block; take() gathers every row at once.'''
+
+    def __init__(self, matrix, indices, dtype=None):
+        self.matrix = matrix
+        self.indices = np.asarray(indices, dtype=np.intp)
+        self.dtype = get_float_dtype(matrix, dtype)
+
+    @property
+    def shape(self):
+        return (len(self.indices), self.matrix.shape[1])
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, rows):
+        if not isinstance(rows, slice):
+            raise TypeError('RowView only supports slices of rows')
+        return take_rows(self.matrix, self.indices[rows], self.dtype)
+
+    def take(self, dtype=None):
+        return take_rows(self.matrix, self.indices, dtype or self.dtype)
+
+    def with_dtype(self, dtype):
+        return RowView(self.matrix, self.indices, dtype)
+
+
+def get_label_matrix(examples):
+    '''Return the labels of a list of (features, labels) examples (or of a
+    (feature matrix, label matrix) pair) as a 2D float64 array.'''
+    if isinstance(examples, tuple):
+        return np.asarray(examples[1], dtype=float)
+    return np.array([labels for features, labels in examples], dtype=float)
+
+
+def get_knn_block_size(num_train, num_features, k):
+    '''Number of queries to process at once so each block's scratch arrays
+    hold about KNN_BLOCK_ELEMENTS values.'''
+    per_query = max(num_train, k * num_features, 1)
+    return max(1, KNN_BLOCK_ELEMENTS // per_query)
+
+
+def select_k_smallest(values, k):
+    '''Return, for each row, the column indices of its k smallest values,
+    ordered by value and then by index as a stable sort orders them (ties
+    straddling the k-th place go to the lower index).'''
+    if k >= values.shape[1]:
+        return np.argsort(values, axis=1, kind='mergesort')
+    if k == 1 and not np.isnan(values).any():
+        # argmin already returns the first of tied minima
+        return np.argmin(values, axis=1)[:, np.newaxis]
+    kth_values = np.partition(values, k - 1, axis=1)[:, k - 1]
+    rows, columns = get_candidates(values, kth_values)
+    return columns[select_candidates(rows, columns, values[rows, columns], values.shape[0], k)]
+
+
+def get_candidates(values, thresholds):
+    '''Return (rows, columns) of the values at most their row's threshold,
+    in row order. NaNs are kept, so every row has at least as many
+    candidates as values at most the threshold would give it.'''
+    with np.errstate(invalid='ignore'):
+        return np.nonzero(np.logical_not(values > thresholds[:, np.newaxis]))
+
+
+def select_candidates(rows, columns, keys, num_rows, k):
+    '''Given candidate (row, column) pairs in row order with at least k per
+    row, return a (num_rows, k) array of the positions of each row's k
+    candidates with the smallest keys, ordered by key and then by column.'''
+    order = np.lexsort((columns, keys, rows))
+    starts = np.searchsorted(rows, np.arange(num_rows))
+    return order[starts[:, np.newaxis] + np.arange(k)]
+
+
+def get_sq_distance_error_bounds(query_sq_norms, point_sq_norms, num_features, dtype):
+    '''Bound on the rounding error of each query's squared distances as
+    get_squared_distances expands them.'''
+    max_point_sq_norm = point_sq_norms.max() if len(point_sq_norms) else 0.0
+    return (num_features + 3) * np.finfo(dtype).eps * (query_sq_norms + max_point_sq_norm)
+
+
+def get_knn_neighbors(train_features, query_features, k, block_size=None):
+    '''Find the k nearest training rows (Euclidean distance) for each query row.
+
+    Returns (indices, distances) arrays of shape (num_queries, k), with each
+    row ordered by distance and then by training index. The features may be
+    2D arrays or sparse CSR matrices.
+
+    Expanded squared distances only shortlist candidates: every training row
+    that could, within their rounding error, be among the k nearest is
+    rescored from its differences to the query, and the neighbors are chosen
+    from the exact distances, as the original per-row sort chose them.'''
+    num_train, num_features = train_features.shape
+    num_queries = query_features.shape[0]
+    k = min(k, num_train)
+    if block_size is None:
+        block_size = get_knn_block_size(num_train, num_features, k)
+    instrument.count('knn_queries', num_queries)
+    instrument.count('knn_distances', num_queries * num_train)
+    train_sq_norms = get_row_sq_norms(train_features)
+
+    all_indices = np.empty((num_queries, k), dtype=np.intp)
+    all_distances = np.empty((num_queries, k))
+    for start in xrange(0, num_queries, block_size):
+        print '\tIteration %s of %s' % (start + 1, num_queries)
+        block = query_features[start:start + block_size]
+        sq_distances = get_squared_distances(block, train_features, train_sq_norms)
+        kth_sq_distances = np.partition(sq_distances, k - 1, axis=1)[:, k - 1]
+        # A row whose expanded distance is off by up to the error bound may
+        # still beat one whose expanded distance is the k-th smallest
+        error_bounds = get_sq_distance_error_bounds(
+            get_row_sq_norms(block), train_sq_norms, num_features, sq_distances.dtype)
+        rows, columns = get_candidates(sq_distances, kth_sq_distances + 2 * error_bounds)
+        instrument.count('knn_rescored_distances', len(rows))
+        distances = get_candidate_distances(train_features, block, rows, columns)
+        selected = select_candidates(rows, columns, distances, block.shape[0], k)
+        all_indices[start:start + len(selected)] = columns[selected]
+        all_distances[start:start + len(selected)] = distances[selected]
+    return all_indices, all_distances
+
+
+def get_row_sq_norms(features):
+    if scipy.sparse.issparse(features):
+        return np.asarray(features.multiply(features).sum(axis=1)).ravel()
+    return np.einsum('ij,ij->i', features, features)
+
+
+def get_squared_distances(queries, points, point_sq_norms):
+    '''Squared Euclidean distances from each query row to each point row.'''
+    sq_distances = queries.dot(points.T)
+    if scipy.sparse.issparse(sq_distances):
+        sq_distances = sq_distances.toarray()
+    sq_distances *= -2.0
+    sq_distances += point_sq_norms
+    sq_distances += get_row_sq_norms(queries)[:, np.newaxis]
+    return np.maximum(sq_distances, 0.0, out=sq_distances)
+
+
+def get_candidate_distances(train_features, queries, rows, columns):
+    '''Distances from query rows to training rows (the pairs of rows and
+    columns), computed from the differences directly rather than by the
+    expansion in get_squared_distances, which loses precision for
+    near-identical rows; duplicates of a training row come out at exactly
+    zero.'''
+    distances = np.empty(len(rows))
+    chunk_size = max(1, KNN_BLOCK_ELEMENTS // max(1, train_features.shape[1]))
+    for start in xrange(0, len(rows), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        differences = train_features[columns[chunk]] - queries[rows[chunk]]
+        distances[chunk] = np.sqrt(get_row_sq_norms(differences))
+    return distances
+
+
+def get_pair_distances(train_features, queries, indices):
+    '''Distances from each query row to the training rows in its row of indices.'''
+    rows = np.repeat(np.arange(indices.shape[0]), indices.shape[1])
+    return get_candidate_distances(train_features, queries, rows, indices.ravel()).reshape(indices.shape)
+
+
+def get_nearest_centroids(features, centroids, n):
+    '''Indices of the n nearest centroids of each feature row, nearest first.'''
+    n = min(n, len(centroids))
+    centroid_sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+    block_size = get_knn_block_size(len(centroids), features.shape[1], n)
+    nearest = np.empty((len(features), n), dtype=np.intp)
+    for start in xrange(0, len(features), block_size):
+        sq_distances = get_squared_distances(features[start:start + block_size], centroids, centroid_sq_norms)
+        nearest[start:start + block_size] = select_k_smallest(sq_distances, n)
+    return nearest
+
+
+def fit_kmeans(features, num_clusters, num_iterations=IVF_KMEANS_ITERATIONS, seed=229):
+    '''Lloyd's k-means from randomly chosen rows; returns the centroids.
+    Clusters that empty out are restarted at a random row.'''
+    random_state = np.random.RandomState(seed)
+    centroids = features[random_state.choice(len(features), num_clusters, replace=False)].copy()
+    for _ in xrange(num_iterations):
+        assignments = get_nearest_centroids(features, centroids, 1)[:, 0]
+        counts = np.bincount(assignments, minlength=num_clusters)
+        # Sum each cluster's rows as one product with a sparse (cluster, row)
+        # assignment matrix
+        membership = scipy.sparse.csr_matrix(
+            (np.ones(len(features)), (assignments, np.arange(len(features)))),
+            shape=(num_clusters, len(features)))
+        sums = membership.dot(features)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty][:, np.newaxis]
+        centroids[empty] = features[random_state.randint(0, len(features), np.count_nonzero(empty))]
+    return centroids
+
+
+class IVFIndex(object):
+    '''Inverted-file index for approximate nearest-neighbor search.
+
+    Training rows are partitioned into num_lists clusters by k-means; a query
+    only compares against the rows of the n_probe clusters whose centroids
+    are nearest to it. Raising n_probe trades speed for recall; with n_probe
+    equal to num_lists every training row is compared against, as in the
+    exact search. Queries for which the probed
+    clusters hold fewer than k rows fall back to the exact search.
+    '''
+
+    def __init__(self, features, num_lists=None, seed=229):
+        self.features = features
+        num_lists = num_lists or int(np.sqrt(len(features)))
+        self.num_lists = max(1, min(num_lists, len(features)))
+        sample_size = min(len(features), self.num_lists * IVF_SAMPLE_ROWS_PER_LIST)
+        sample = features[np.sort(np.random.RandomState(seed).choice(len(features), sample_size, replace=False))]
+        self.centroids = fit_kmeans(sample, self.num_lists, seed=seed)
+        assignments = get_nearest_centroids(features, self.centroids, 1)[:, 0]
+        order = np.argsort(assignments, kind='mergesort')
+        bounds = np.searchsorted(assignments[order], np.arange(self.num_lists + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in xrange(self.num_lists)]
+        self.sq_norms = get_row_sq_norms(features)
+
+    def add(self, features):
+        '''Insert rows into the lists of their nearest centroids; the
+        centroids themselves are not refit.'''
+        offset = len(self.features)
+        assignments = get_nearest_centroids(features, self.centroids, 1)[:, 0]
+        for list_index in np.unique(assignments):
+            new_members = offset + np.flatnonzero(assignments == list_index)
+            self.lists[list_index] = np.concatenate([self.lists[list_index], new_members])
+        self.features = np.vstack([self.features, features])
+        self.sq_norms = np.concatenate([self.sq_norms, get_row_sq_norms(features)])
+
+    @staticmethod
+    def merge_candidates(best_sq_distances, best_indices, rows, members, sq_distances):
+        '''Update the k best (squared distance, index) pairs of the given
+        query rows with their squared distances to the rows in members,
+        breaking ties in favor of the lower index.'''
+        k = best_indices.shape[1]
+        # Candidates that have not been filled yet sit at infinity
+        merged_sq_distances = np.hstack([best_sq_distances[rows], sq_distances])
+        kth_sq_distances = np.partition(merged_sq_distances, k - 1, axis=1)[:, k - 1]
+        candidate_rows, columns = get_candidates(merged_sq_distances, kth_sq_distances)
+        candidate_indices = np.where(
+            columns < k, best_indices[rows[candidate_rows], np.minimum(columns, k - 1)],
+            members[np.maximum(columns - k, 0)])
+        candidate_sq_distances = merged_sq_distances[candidate_rows, columns]
+        selected = select_candidates(candidate_rows, candidate_indices, candidate_sq_distances, len(rows), k)
+        best_sq_distances[rows] = candidate_sq_distances[selected]
+        best_indices[rows] = candidate_indices[selected]
+
+    def query(self, queries, k, n_probe=IVF_DEFAULT_PROBES):
+        '''Return approximate (indices, distances) as get_knn_neighbors does.'''
+        k = min(k, len(self.features))
+        probes = get_nearest_centroids(queries, self.centroids, n_probe)
+        best_sq_distances = np.full((len(queries), k), np.inf)
+        best_indices = np.full((len(queries), k), -1, dtype=np.intp)
+        num_distances = 0
+        # Group the queries by the lists they probe, once for all lists
+        probe_order = np.argsort(probes.ravel(), kind='mergesort')
+        probe_bounds = np.searchsorted(probes.ravel()[probe_order], np.arange(self.num_lists + 1))
+        probe_queries = probe_order // probes.shape[1]
+        for list_index in xrange(self.num_lists):
+            members = self.lists[list_index]
+            query_rows = probe_queries[probe_bounds[list_index]:probe_bounds[list_index + 1]]
+            if len(members) == 0 or len(query_rows) == 0:
+                continue
+            num_distances += len(query_rows) * len(members)
+            block_size = get_knn_block_size(len(members) + k, queries.shape[1], k)
+            for start in xrange(0, len(query_rows), block_size):
+                rows = query_rows[start:start + block_size]
+                self.merge_candidates(
+                    best_sq_distances, best_indices, rows, members,
+                    get_squared_distances(queries[rows], self.features[members], self.sq_norms[members]))
+        instrument.count('knn_queries', len(queries))
+        instrument.count('knn_distances', num_distances)
+
+        short_rows = np.flatnonzero((best_indices < 0).any(axis=1))
+        instrument.count('knn_ivf_exact_fallbacks', len(short_rows))
+        found_rows = np.flatnonzero((best_indices >= 0).all(axis=1))
+        all_indices = np.empty((len(queries), k), dtype=np.intp)
+        all_distances = np.empty((len(queries), k))
+        if len(found_rows):
+            # Recompute the selected distances exactly, as get_knn_neighbors does
+            indices = best_indices[found_rows]
+            distances = get_pair_distances(self.features, queries[found_rows], indices)
+            order = np.lexsort((indices, distances))
+            rows = np.arange(len(found_rows))[:, np.newaxis]
+            all_indices[found_rows] = indices[rows, order]
+            all_distances[found_rows] = distances[rows, order]
+        if len(short_rows):
+            all_indices[short_rows], all_distances[short_rows] = get_knn_neighbors(self.features, queries[short_rows], k)
+        return all_indices, all_distances
+
+
+def get_knn_recall(exact_indices, approximate_indices):
+    '''Fraction of the exact nearest neighbors that an approximate search found.'''
+    found = (approximate_indices[:, :, np.newaxis] == exact_indices[:, np.newaxis, :]).any(axis=1)
+    return found.mean()
+
+
+def get_knn_weights(distances, k, weighting='uniform'):
+    '''Weights for each query's neighbors, given their distances.'''
+    if weighting == 'inverse_distance':
+        # An exact-zero distance makes its inverse infinite and the weights NaN,
+        # which is what the original per-example loop produced as well.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inverse_distances = 1.0 / distances
+            return inverse_distances / inverse_distances.sum(axis=1)[:, np.newaxis]
+    elif weighting != 'uniform':
+        print 'Unknown weighting scheme %s; defaulting to uniform weights' % (weighting)
+    return np.full(distances.shape, 1.0 / k)
+
+
+def get_knn_label_predictions(train_labels, neighbors, distances, k, weighting='uniform'):
+    '''Combine the labels of each query's neighbors into a prediction.'''
+    weights = get_knn_weights(distances, k, weighting)
+    with np.errstate(invalid='ignore'):
+        return np.einsum('ij,ijl->il', weights, train_labels[neighbors])
+
+
+class KNNRegressor(object):
+    '''K-nearest-neighbors regressor that is fit once on a training split.
+
+    Fitting builds a KD-tree or ball tree over the training features so that
+    repeated predictions reuse the index. Trees stop paying off in high
+    dimensions, so by default data with more than KNN_TREE_MAX_DIMENSIONS
+    features falls back to the blocked brute-force search. Tree searches may
+    order neighbors at exactly equal distances differently than brute force.
+
+    The 'ivf' algorithm is approximate (see IVFIndex): num_lists sets the
+    number of clusters and n_probe, which may be changed after fitting, the
+    number searched per query.
+
+    Sparse (CSR) features are only supported by the brute-force search,
+    which 'auto' then selects.
+    '''
+
+    ALGORITHMS = ['auto', 'kd_tree', 'ball_tree', 'brute', 'ivf']
+
+    def __init__(self, algorithm='auto', leaf_size=40, num_lists=None, n_probe=IVF_DEFAULT_PROBES):
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError('Unknown KNN algorithm %s' % (algorithm))
+        self.algorithm = algorithm
+        self.leaf_size = leaf_size
+        self.num_lists = num_lists
+        self.n_probe = n_probe
+        self.index_algorithm = None
+        self.index = None
+        self.features = None
+        self.labels = None
+
+    @instrument.timed('fit', model='knn')
+    def fit(self, train):
+        self.features = get_feature_matrix(train)
+        self.labels = get_label_matrix(train)
+        self.index_algorithm = self.algorithm
+        sparse = scipy.sparse.issparse(self.features)
+        if self.index_algorithm == 'auto':
+            self.index_algorithm = (
+                'kd_tree' if self.features.shape[1] <= KNN_TREE_MAX_DIMENSIONS and not sparse
+                else 'brute'
+            )
+        if sparse and self.index_algorithm != 'brute':
+            raise ValueError('KNN algorithm %s does not support sparse features' % (self.index_algorithm))
+        if self.index_algorithm == 'kd_tree':
+            self.index = KDTree(self.features, leaf_size=self.leaf_size)
+        elif self.index_algorithm == 'ball_tree':
+            self.index = BallTree(self.features, leaf_size=self.leaf_size)
+        elif self.index_algorithm == 'ivf':
+            self.index = IVFIndex(self.features, num_lists=self.num_lists)
+        else:
+            self.index = None
+        return self
+
+    @instrument.timed('add', model='knn')
+    def add(self, train):
+        '''Insert more training examples. Brute-force and IVF indexes are
+        extended in place; tree indexes cannot be, and are rebuilt.'''
+        features = get_feature_matrix(train, self.features.dtype)
+        labels = get_label_matrix(train)
+        if features.shape[0] == 0:
+            return self
+        instrument.count('knn_examples_added', features.shape[0])
+        if self.index_algorithm == 'ivf':
+            self.index.add(features)
+            self.features = self.index.features
+        elif scipy.sparse.issparse(self.features):
+            self.features = scipy.sparse.vstack([self.features, features], format='csr')
         else:
-            test.append(example)
-    return train, dev, test
+            self.features = np.vstack([self.features, features])
+        self.labels = np.vstack([self.labels, labels])
+        if self.index_algorithm == 'kd_tree':
+            self.index = KDTree(self.features, leaf_size=self.leaf_size)
+        elif self.index_algorithm == 'ball_tree':
+            self.index = BallTree(self.features, leaf_size=self.leaf_size)
+        return self
+
+    @instrument.timed('predict', model='knn')
+    def kneighbors(self, batch, k, block_size=None):
+        '''Return (indices, distances) of the k nearest training rows for each
+        row of the 2D feature array batch. A RowView batch is gathered block
+        by block by the brute-force search, in the training features' dtype;
+        block_size (queries per block) bounds that search's scratch memory.'''
+        if self.index is None and isinstance(batch, RowView):
+            return get_knn_neighbors(self.features, batch.with_dtype(self.features.dtype), k, block_size)
+        batch = as_feature_matrix(batch, self.features.dtype)
+        if self.index is None:
+            return get_knn_neighbors(self.features, batch, k, block_size)
+        if self.index_algorithm == 'ivf':
+            return self.index.query(batch, k, self.n_probe)
+        distances, indices = self.index.query(batch, k=min(k, self.features.shape[0]))
+        return indices, distances
+
+    def predict(self, batch, k=5, weighting='uniform', block_size=None):
+        indices, distances = self.kneighbors(batch, k, block_size)
+        return get_knn_label_predictions(self.labels, indices, distances, k, weighting)
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(filename):
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
 
 
-def get_knn_predictions(train, dev, k=5, weighting='uniform'):
-    predictions = []
-    train_indices = [i for i in xrange(len(train))]
-    iters = 0
+def get_knn_predictions(train, dev, k=5, weighting='uniform', model=None, block_size=None):
     print 'Using k=%s and %s weighting' % (k, weighting)
+    if model is None:
+        model = KNNRegressor(algorithm='brute').fit(train)
+    return list(model.predict(get_feature_rows(dev), k=k, weighting=weighting, block_size=block_size))
 
-    for features, labels in dev:
-        iters += 1
-        if iters == 1 or iters % 100 == 0 :
-            print '\tIteration %s of %s' % (iters, len(dev))
-
-        features = np.array(features)
-        distances = {}
-        for i in train_indices:
-            other_features = np.array(train[i][0])
-            distances[i] = np.linalg.norm(features - other_features)
-        neighbors = sorted(train_indices, key=distances.get)[:k]
-        
-        weights = {i: 1.0 / k for i in neighbors}
-        if weighting == 'inverse_distance':
-            sum_inv_distances = sum([1.0 / distances[i] for i in neighbors])
-            weights = {i: (1.0 / distances[i]) / sum_inv_distances for i in neighbors}
-        elif weighting != 'uniform':
-            print 'Unknown weighting scheme %s; defaulting to uniform weights' % (weighting)
-
-        predicted_labels = np.zeros(len(labels))
-        for i in neighbors:
-            predicted_labels += weights[i] * np.array(train[i][1])
-        predictions.append(predicted_labels)
 
-    return predictions
+def get_knn_sweep_errors(train, dev, max_k=15, weightings=KNN_WEIGHTINGS, model=None, num_resamples=0, n_jobs=1, block_size=None):
+    '''Evaluate KNN for every k <= max_k and every weighting scheme.
+
+    Neighbors are searched once at max_k; smaller k reuse the nearest
+    columns of the same neighbor and distance arrays. Returns a list of
+    (k, weighting, percent_errors, error_ranges, intervals) tuples. With
+    num_resamples, intervals holds a 95% bootstrap (lower, upper) interval
+    of each label's percent error, all configurations being scored on the
+    same resamples (see scoring.py); otherwise it is None.'''
+    print 'Sweeping k=1..%s with %s weighting' % (max_k, ' and '.join(weightings))
+    if model is None:
+        model = KNNRegressor(algorithm='brute').fit(train)
+    neighbors, distances = model.kneighbors(get_feature_rows(dev), max_k, block_size)
+    dev_labels = get_label_matrix(dev)
+
+    configurations, all_predictions = [], []
+    for weighting in weightings:
+        for k in xrange(1, max_k + 1):
+            configurations.append((k, weighting))
+            all_predictions.append(get_knn_label_predictions(
+                model.labels, neighbors[:, :k], distances[:, :k], k, weighting))
+    all_intervals = [None] * len(configurations)
+    if num_resamples:
+        lower, upper = scoring.bootstrap_intervals(
+            dev_labels, all_predictions, num_resamples=num_resamples, n_jobs=n_jobs)['percent_error']
+        all_intervals = [zip(lower[i], upper[i]) for i in xrange(len(configurations))]
+
+    results = []
+    for (k, weighting), predictions, intervals in zip(configurations, all_predictions, all_intervals):
+        percent_errors, error_ranges = compute_percent_errors(dev_labels, predictions)
+        results.append((k, weighting, percent_errors, error_ranges, intervals))
+    return results
+
+
+def write_knn_sweep_results(results, label_names, filename=KNN_SWEEP_FILENAME):
+    '''Write get_knn_sweep_errors results in the format plot_knn.py reads.
+    Bootstrap intervals, if computed, add _ci_lower and _ci_upper columns.'''
+    with_intervals = any(result[4] is not None for result in results)
+    with open(filename, 'wb') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        header = ['k', 'weighting']
+        for label_name in label_names:
+            header.extend([label_name, '%s_std_error' % (label_name)])
+            if with_intervals:
+                header.extend(['%s_ci_lower' % (label_name), '%s_ci_upper' % (label_name)])
+        writer.writerow(header)
+        for k, weighting, percent_errors, error_ranges, intervals in results:
+            row = [k, weighting]
+            for i, (percent_error, error_range) in enumerate(zip(percent_errors, error_ranges)):
+                row.extend([repr(percent_error), repr(error_range)])
+                if with_intervals:
+                    row.extend([repr(bound) for bound in intervals[i]] if intervals is not None else ['', ''])
+            writer.writerow(row)
+
+
+def get_ivf_tradeoffs(train, dev, k=5, probes=(1, 2, 4, 8, 16, 32), num_lists=None):
+    '''Measure approximate KNN against the exact search on the same split.
 
+    Returns the exact search time and a list of (n_probe, recall, seconds,
+    percent_errors) tuples, where recall is the fraction of the exact k
+    nearest neighbors found and percent_errors are those of uniform k-NN
+    predictions from the approximate neighbors.'''
+    dev_features = get_feature_matrix(dev)
+    dev_labels = get_label_matrix(dev)
+    exact_model = KNNRegressor(algorithm='brute').fit(train)
+    start = time.time()
+    exact_indices, exact_distances = exact_model.kneighbors(dev_features, k)
+    exact_seconds = time.time() - start
 
-def get_svm_predictions(train, dev):
-    train_features = [features for features, labels in train]
-    dev_features = [features for features, labels in dev]
-    all_predictions = []
-    for i in xrange(len(train[0][1])):
-        model = svm.SVR(C=0.00000005)
-        labels = [labels[i] for features, labels in train]
-        model.fit(train_features, labels)
-        all_predictions.append(model.predict(dev_features))
+    model = KNNRegressor(algorithm='ivf', num_lists=num_lists).fit(train)
+    tradeoffs = []
+    for n_probe in probes:
+        model.n_probe = n_probe
+        start = time.time()
+        indices, distances = model.kneighbors(dev_features, k)
+        seconds = time.time() - start
+        predictions = get_knn_label_predictions(model.labels, indices, distances, k)
+        percent_errors, error_ranges = compute_percent_errors(dev_labels, predictions)
+        tradeoffs.append((n_probe, get_knn_recall(exact_indices, indices), seconds, percent_errors))
+    return exact_seconds, tradeoffs
 
-    predictions = []
-    for i in xrange(len(all_predictions[0])):
-        predictions.append([label_predictions[i] for label_predictions in all_predictions])
+
+def fit_svr_worker(task):
+    label_index, svr_params = task
+    model = svm.SVR(**svr_params)
+    model.fit(parallel.SHARED_ARRAYS['train_features'], parallel.SHARED_ARRAYS['train_labels'][:, label_index])
+    return model
+
+
+def predict_svr_worker(task):
+    label_index, start, stop = task
+    model = parallel.SHARED_ARRAYS['models'][label_index]
+    return model.predict(parallel.SHARED_ARRAYS['dev_features'][start:stop])
+
+
+@instrument.timed('fit', model='svr')
+def fit_svr_models(train_features, train_labels, n_jobs=1, **svr_params):
+    '''Fit one SVR per label column, with the labels fit concurrently in up
+    to n_jobs processes that share the training matrix.'''
+    svr_params = dict(SVR_PARAMS, **svr_params)
+    # libsvm works in float64; convert once here rather than in every fit
+    train_features = as_feature_matrix(train_features, np.float64)
+    tasks = [(i, svr_params) for i in xrange(train_labels.shape[1])]
+    return parallel.map_with_shared_arrays(
+        fit_svr_worker, tasks, n_jobs=n_jobs,
+        train_features=train_features, train_labels=train_labels)
+
+
+@instrument.timed('predict', model='svr')
+def predict_svr_models(models, dev_features, n_jobs=1):
+    '''Predict every label for dev_features, splitting the rows into chunks
+    spread over up to n_jobs processes. Returns a (num_rows, num_labels) array.'''
+    num_rows = dev_features.shape[0]
+    instrument.count('svr_predictions', num_rows * len(models))
+    num_jobs = parallel.get_num_jobs(n_jobs)
+    num_chunks = max(1, num_jobs // len(models)) if num_rows >= SVR_MIN_CHUNK_ROWS else 1
+    chunks = parallel.get_chunks(num_rows, num_chunks)
+    tasks = [(i, start, stop) for i in xrange(len(models)) for start, stop in chunks]
+    results = parallel.map_with_shared_arrays(
+        predict_svr_worker, tasks, n_jobs=n_jobs, models=models, dev_features=dev_features)
+
+    predictions = np.empty((num_rows, len(models)))
+    for (label_index, start, stop), label_predictions in zip(tasks, results):
+        predictions[start:stop, label_index] = label_predictions
     return predictions
 
 
+def get_svm_predictions(train, dev, n_jobs=1, **svr_params):
+    models = fit_svr_models(get_feature_matrix(train), get_label_matrix(train), n_jobs=n_jobs, **svr_params)
+    return predict_svr_models(models, get_feature_matrix(dev), n_jobs=n_jobs).tolist()
+
+
+@instrument.timed('score')
 def compute_percent_errors(all_labels, all_predictions, use_rmse=False):
-    num_labels = len(all_labels[0])
-    all_errors = [[] for _ in xrange(num_labels)]
-    for labels, predictions in zip(all_labels, all_predictions):
-        for i in xrange(num_labels):
-            error = (predictions[i] - labels[i]) / labels[i]
-            if use_rmse:
-                error = (error * labels[i]) ** 2
-            all_errors[i].append(abs(error))
-    
-    def get_percent_error(errors):
-        if use_rmse:
-            return np.sqrt(np.mean(errors))
-        return 100.0 * np.mean(errors)
-
-    def get_std_error(errors):
-        return 100.0 * np.std(errors) / np.sqrt(len(errors))
-
-    return [get_percent_error(errors) for errors in all_errors], [get_std_error(errors) for errors in all_errors]
-
-    
+    '''Return per-label mean absolute percent errors (or, with use_rmse,
+    root mean squared errors) and their standard errors; see scoring.py.'''
+    if use_rmse:
+        absolute_errors, _ = scoring.get_errors(all_labels, all_predictions)
+        squared_errors = absolute_errors ** 2
+        errors = np.sqrt(np.mean(squared_errors, axis=1))
+        error_ranges = 100.0 * np.std(squared_errors, axis=1) / np.sqrt(squared_errors.shape[1])
+    else:
+        errors, error_ranges = scoring.get_percent_errors(all_labels, all_predictions)
+    return list(errors), list(error_ranges)
+
+
 if __name__=='__main__':
+    instrument.enable_from_argv()
     print 'Reading features and labels...'
     # feature_names, feature_rows, label_names, label_rows = read_features_and_labels(feature_selection='critical_features_debt.csv')
-    feature_names, feature_rows, label_names, label_rows = read_features_and_labels(use_privacy_suppressed=True)
-    train, dev, test = get_data_splits(feature_rows, label_rows)
+    # --float32 holds features as float32 from reading through KNN
+    dtype = COMPACT_DTYPE if '--float32' in sys.argv else None
+    if '--artifact' in sys.argv:
+        feature_names, feature_rows, label_names, label_rows = read_feature_artifact(use_privacy_suppressed=True, dtype=dtype)
+    else:
+        feature_names, feature_rows, label_names, label_rows = read_features_and_labels(use_privacy_suppressed=True)
+    train, dev, test = get_data_split_views(feature_rows, label_rows, dtype=dtype)
     dev = test # Use test set for evaluation
 
-    print '\nMaking predictions...'
-    predictions = get_knn_predictions(train, dev, k=6, weighting='inverse_distance')
-    # predictions = get_knn_predictions(train, dev, k=13, weighting='uniform')
-    # predictions = get_svm_predictions(train, dev)
-    
-    print '\nComputing errors...'
-    percent_errors, error_ranges = compute_percent_errors([labels for features, labels in dev], predictions)
-    for i in xrange(len(label_names)):
-        print '%s: %s +/- %s%% average error' % (label_names[i], percent_errors[i], error_ranges[i])
-    print '\nDone.'
\ No newline at end of file
+    if '--sweep' in sys.argv:
+        print '\nSweeping KNN parameters...'
+        # --bootstrap adds confidence intervals for plot_knn.py's error bars
+        num_resamples = scoring.DEFAULT_NUM_RESAMPLES if '--bootstrap' in sys.argv else 0
+        results = get_knn_sweep_errors(train, dev, max_k=15, num_resamples=num_resamples, n_jobs=-1)
+        write_knn_sweep_results(results, label_names)
+        print 'Wrote %s results to %s' % (len(results), KNN_SWEEP_FILENAME)
+    elif '--ivf' in sys.argv:
+        print '\nMeasuring approximate KNN recall...'
+        exact_seconds, tradeoffs = get_ivf_tradeoffs(train, dev, k=6)
+        print 'Exact search: %.3fs' % (exact_seconds)
+        for n_probe, recall, seconds, percent_errors in tradeoffs:
+            print 'n_probe=%s: recall %.4f, %.3fs (%.1fx), errors %s' % (
+                n_probe, recall, seconds, exact_seconds / seconds if seconds > 0 else float('inf'), percent_errors)
+    else:
+        print '\nMaking predictions...'
+        predictions = get_knn_predictions(train, dev, k=6, weighting='inverse_distance')
+        # predictions = get_knn_predictions(train, dev, k=13, weighting='uniform')
+        # predictions = get_svm_predictions(train, dev)
+
+        print '\nComputing errors...'
+        percent_errors, error_ranges = compute_percent_errors(get_label_matrix(dev), predictions)
+        for i in xrange(len(label_names)):
+            print '%s: %s +/- %s%% average error' % (label_names[i], percent_errors[i], error_ranges[i])
+        if '--bootstrap' in sys.argv:
+            lower, upper = scoring.bootstrap_intervals(get_label_matrix(dev), [predictions], n_jobs=-1)['percent_error']
+            for i in xrange(len(label_names)):
+                print '%s: 95%% bootstrap interval %s to %s%%' % (label_names[i], lower[0][i], upper[0][i])
+    print '\nDone.'
@@ -0,0 +1,188 @@
+'''Scoring module.
+
+Vectorized error metrics over (num_examples, num_labels) label and
+prediction arrays, computed for every label at once:
+
+    - percent_error: mean absolute percent error, in percent
+    - rmse: root mean squared error
+    - mae: mean absolute error
+    - median_ape: median absolute percent error, in percent
+
+and bootstrap estimates of their uncertainty. Resamples are represented by
+how often each example is drawn, so a batch of resamples turns the means into
+one matrix product (and the median into a cumulative count over the examples
+sorted once). Batches of BOOTSTRAP_BATCH_SIZE resamples are spread over a
+process pool, each with its own seed, so results depend only on seed.
+
+Several models' predictions can be bootstrapped on the same resamples, which
+pairs them: bootstrap_intervals gives each model's confidence intervals and
+paired_bootstrap the interval and p-value of the difference between two.
+'''
+
+import numpy as np
+
+import instrument
+import parallel
+
+
+METRICS = ['percent_error', 'rmse', 'mae', 'median_ape']
+
+DEFAULT_NUM_RESAMPLES = 1000
+DEFAULT_CONFIDENCE = 0.95
+# Resamples drawn per batch (and process-pool task)
+BOOTSTRAP_BATCH_SIZE = 100
+
+
+def as_matrix(values):
+    '''2D float64 (num_examples, num_labels) array of labels or predictions.'''
+    values = np.asarray(values, dtype=np.float64)
+    return values.reshape(len(values), -1)
+
+
+def get_errors(labels, predictions):
+    '''Return (absolute errors, absolute percent errors) as (num_labels,
+    num_examples) arrays, one contiguous row per label.'''
+    labels = as_matrix(labels)
+    predictions = as_matrix(predictions)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        absolute_errors = np.ascontiguousarray(np.abs(predictions - labels).T)
+        absolute_percent_errors = np.ascontiguousarray(np.abs((predictions - labels) / labels).T)
+    return absolute_errors, absolute_percent_errors
+
+
+@instrument.timed('score')
+def score(labels, predictions):
+    '''Return {metric: array of one value per label} for every metric in METRICS.'''
+    absolute_errors, absolute_percent_errors = get_errors(labels, predictions)
+    return {
+        'percent_error': 100.0 * np.mean(absolute_percent_errors, axis=1),
+        'rmse': np.sqrt(np.mean(absolute_errors ** 2, axis=1)),
+        'mae': np.mean(absolute_errors, axis=1),
+        'median_ape': 100.0 * np.median(absolute_percent_errors, axis=1),
+    }
+
+
+def get_percent_errors(labels, predictions):
+    '''Return (mean absolute percent errors, their standard errors) per label.'''
+    absolute_errors, absolute_percent_errors = get_errors(labels, predictions)
+    return (
+        100.0 * np.mean(absolute_percent_errors, axis=1),
+        100.0 * np.std(absolute_percent_errors, axis=1) / np.sqrt(absolute_percent_errors.shape[1]),
+    )
+
+
+def get_resample_counts(num_examples, num_resamples, random_state):
+    '''(num_resamples, num_examples) array of how often each example is drawn
+    in each resample of num_examples draws with replacement.'''
+    draws = random_state.randint(0, num_examples, (num_resamples, num_examples))
+    draws += num_examples * np.arange(num_resamples)[:, np.newaxis]
+    return np.bincount(draws.ravel(), minlength=num_resamples * num_examples).reshape(num_resamples, num_examples)
+
+
+def get_resampled_medians(sorted_errors, sorted_counts):
+    '''Median of each resample, given values sorted ascending and each
+    resample's counts of them in the same order; like np.median, the mean of
+    the two middle values when there is an even number of them.'''
+    num_examples = sorted_errors.shape[0]
+    cumulative_counts = np.cumsum(sorted_counts, axis=1)
+    # Position p (0-based) of a resample's sorted values is the first value
+    # whose cumulative count exceeds p
+    lower = (cumulative_counts <= (num_examples - 1) // 2).sum(axis=1)
+    upper = (cumulative_counts <= num_examples // 2).sum(axis=1)
+    return 0.5 * (sorted_errors[lower] + sorted_errors[upper])
+
+
+def get_resampled_metrics(absolute_errors, absolute_percent_errors, counts):
+    '''Return {metric: (num_resamples, num_labels) array} for one model's
+    errors (as returned by get_errors) under the resamples in counts.'''
+    num_examples = float(counts.shape[1])
+    metrics = {
+        'percent_error': 100.0 * counts.dot(absolute_percent_errors.T) / num_examples,
+        'rmse': np.sqrt(counts.dot((absolute_errors ** 2).T) / num_examples),
+        'mae': counts.dot(absolute_errors.T) / num_examples,
+    }
+    medians = np.empty((counts.shape[0], absolute_percent_errors.shape[0]))
+    for label_index, label_errors in enumerate(absolute_percent_errors):
+        if np.isnan(label_errors).any():
+            # As np.median, which is NaN if any value is
+            medians[:, label_index] = np.nan
+            continue
+        order = np.argsort(label_errors, kind='mergesort')
+        medians[:, label_index] = get_resampled_medians(label_errors[order], counts[:, order])
+    metrics['median_ape'] = 100.0 * medians
+    return metrics
+
+
+def bootstrap_worker(task):
+    '''Metrics of every model under one batch of resamples.'''
+    batch_index, num_resamples, seed = task
+    labels = parallel.SHARED_ARRAYS['labels']
+    counts = get_resample_counts(len(labels), num_resamples, np.random.RandomState([seed, batch_index]))
+    results = []
+    for predictions in parallel.SHARED_ARRAYS['predictions']:
+        absolute_errors, absolute_percent_errors = get_errors(labels, predictions)
+        results.append(get_resampled_metrics(absolute_errors, absolute_percent_errors, counts))
+    return results
+
+
+@instrument.timed('bootstrap')
+def bootstrap_metrics(labels, predictions_list, num_resamples=DEFAULT_NUM_RESAMPLES, seed=229, n_jobs=1):
+    '''Return {metric: (num_models, num_resamples, num_labels) array} of the
+    metrics of each model's predictions in predictions_list, all under the
+    same num_resamples bootstrap resamples of the examples.'''
+    labels = as_matrix(labels)
+    predictions = np.array([as_matrix(model_predictions) for model_predictions in predictions_list])
+    instrument.count('bootstrap_resamples', num_resamples * len(predictions))
+    tasks = [
+        (batch_index, min(BOOTSTRAP_BATCH_SIZE, num_resamples - start), seed)
+        for batch_index, start in enumerate(xrange(0, num_resamples, BOOTSTRAP_BATCH_SIZE))
+    ]
+    results = parallel.map_with_shared_arrays(
+        bootstrap_worker, tasks, n_jobs=n_jobs, labels=labels, predictions=predictions)
+    return {
+        metric: np.array([
+            np.concatenate([batch_results[model_index][metric] for batch_results in results])
+            for model_index in xrange(len(predictions))
+        ])
+        for metric in METRICS
+    }
+
+
+def get_interval(resampled_values, confidence=DEFAULT_CONFIDENCE):
+    '''Percentile bootstrap interval along the resample axis (the second to last).'''
+    alpha = 100.0 * (1.0 - confidence) / 2.0
+    return (
+        np.percentile(resampled_values, alpha, axis=-2),
+        np.percentile(resampled_values, 100.0 - alpha, axis=-2),
+    )
+
+
+def bootstrap_intervals(labels, predictions_list, confidence=DEFAULT_CONFIDENCE, num_resamples=DEFAULT_NUM_RESAMPLES, seed=229, n_jobs=1):
+    '''Return {metric: (lower, upper)}, each a (num_models, num_labels) array
+    of bootstrap confidence interval bounds.'''
+    resampled = bootstrap_metrics(labels, predictions_list, num_resamples, seed, n_jobs)
+    return {metric: get_interval(resampled[metric], confidence) for metric in METRICS}
+
+
+def paired_bootstrap(labels, predictions_a, predictions_b, confidence=DEFAULT_CONFIDENCE, num_resamples=DEFAULT_NUM_RESAMPLES, seed=229, n_jobs=1):
+    '''Compare two models' predictions on the same examples.
+
+    Returns {metric: {'difference', 'lower', 'upper', 'p_value'}} with arrays
+    of one value per label: the observed metric of model a minus that of
+    model b, the bootstrap confidence interval of that difference, and the
+    two-sided bootstrap p-value of the models being equally good.'''
+    resampled = bootstrap_metrics(labels, [predictions_a, predictions_b], num_resamples, seed, n_jobs)
+    scores_a = score(labels, predictions_a)
+    scores_b = score(labels, predictions_b)
+    comparison = {}
+    for metric in METRICS:
+        differences = resampled[metric][0] - resampled[metric][1]
+        lower, upper = get_interval(differences, confidence)
+        one_sided = np.minimum((differences <= 0).mean(axis=0), (differences >= 0).mean(axis=0))
+        comparison[metric] = {
+            'difference': scores_a[metric] - scores_b[metric],
+            'lower': lower,
+            'upper': upper,
+            'p_value': np.minimum(1.0, 2.0 * one_sided),
+        }
+    return comparison
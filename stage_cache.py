@@ -0,0 +1,409 @@
+'''Stage cache module.
+
+Memoizes the stages of the read -> featurize -> split -> fit pipeline in a
+local, content-addressed cache:
+
+    python stage_cache.py --model knn --k 6 --normalize
+
+Each stage result is stored under a key hashing the stage name, the source
+code of the modules it depends on, its parameters (such as required_keys or
+get_unlabeled), the contents of its input files and the keys of the stage
+results it consumes. Changing a parameter therefore only reruns the stage it
+belongs to and the stages downstream of it; editing a data file or a module
+reruns the stages that read it.
+
+Results are pickled into DEFAULT_STAGE_CACHE_DIR, which is kept under
+max_bytes by evicting the least recently used results.
+'''
+
+import argparse
+import cPickle as pickle
+import hashlib
+import inspect
+import json
+import numpy as np
+import os
+import scipy.sparse
+import sys
+
+import columnar
+import featurize
+import feature_artifacts
+import feature_selection
+import instrument
+import parallel
+import read_data
+import regressions
+
+
+DEFAULT_STAGE_CACHE_DIR = os.path.join(columnar.DEFAULT_CACHE_DIR, 'stages')
+DEFAULT_MAX_CACHE_BYTES = 2 ** 30
+STAGE_CACHE_VERSION = 1
+FILE_HASHES_FILENAME = 'file_hashes.json'
+RESULT_EXTENSION = '.pickle'
+
+
+class FileInput(object):
+    '''A stage input naming a file: hashed by its contents, passed to the
+    stage function as the file name.'''
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+
+class CachedValue(object):
+    '''A stage result: passed to downstream stages as its value, hashed by its key.'''
+
+    def __init__(self, key, value, hit):
+        self.key = key
+        self.value = value
+        self.hit = hit
+
+
+def get_source_file(module_or_function):
+    source_file = inspect.getsourcefile(module_or_function)
+    if source_file is None:
+        raise ValueError('No source file for %s' % (module_or_function))
+    return os.path.abspath(source_file)
+
+
+def unwrap(value):
+    '''Replace FileInputs and CachedValues in a stage input by what the stage
+    function receives.'''
+    if isinstance(value, FileInput):
+        return value.file_name
+    if isinstance(value, CachedValue):
+        return value.value
+    if isinstance(value, (list, tuple)):
+        return type(value)(unwrap(item) for item in value)
+    if isinstance(value, dict):
+        return dict((key, unwrap(item)) for key, item in value.items())
+    return value
+
+
+class StageCache(object):
+    '''Content-addressed store of stage results with LRU eviction by size.'''
+
+    def __init__(self, cache_dir=DEFAULT_STAGE_CACHE_DIR, max_bytes=DEFAULT_MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.source_hashes = {}
+        self.file_hashes_path = os.path.join(cache_dir, FILE_HASHES_FILENAME)
+        self.file_hashes = {}
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        if os.path.exists(self.file_hashes_path):
+            with open(self.file_hashes_path, 'r') as f:
+                self.file_hashes = json.load(f)
+
+    def hash_file(self, file_name):
+        '''SHA-1 of a file's contents, remembered (across runs) until its size
+        or modification time changes.'''
+        path = os.path.abspath(file_name)
+        stamp = columnar.get_source_stamp(path)
+        known = self.file_hashes.get(path)
+        if known is not None and known['size'] == stamp['size'] and known['mtime'] == stamp['mtime']:
+            return known['sha1']
+        stamp['sha1'] = columnar.hash_file(path)
+        self.file_hashes[path] = stamp
+        self.write_file_hashes()
+        return stamp['sha1']
+
+    def write_file_hashes(self):
+        tmp_path = self.file_hashes_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.file_hashes, f)
+        os.rename(tmp_path, self.file_hashes_path)
+
+    def hash_source(self, module_or_function):
+        source_file = get_source_file(module_or_function)
+        if source_file not in self.source_hashes:
+            self.source_hashes[source_file] = columnar.hash_file(source_file)
+        return self.source_hashes[source_file]
+
+    def update_hash(self, sha1, value):
+        '''Feed a canonical encoding of a stage input into sha1.'''
+        if isinstance(value, CachedValue):
+            sha1.update('stage:%s;' % (value.key))
+        elif isinstance(value, FileInput):
+            sha1.update('file:%s;' % (self.hash_file(value.file_name)))
+        elif value is None or isinstance(value, (bool, int, long, float, str, unicode)):
+            sha1.update('%s:%r;' % (type(value).__name__, value))
+        elif isinstance(value, (list, tuple)):
+            sha1.update('%s:%s[' % (type(value).__name__, len(value)))
+            for item in value:
+                self.update_hash(sha1, item)
+            sha1.update(']')
+        elif isinstance(value, dict):
+            sha1.update('dict:%s{' % (len(value)))
+            for key in sorted(value):
+                self.update_hash(sha1, key)
+                self.update_hash(sha1, value[key])
+            sha1.update('}')
+        elif isinstance(value, np.ndarray):
+            sha1.update('ndarray:%s:%s;' % (value.dtype.str, value.shape))
+            sha1.update(np.ascontiguousarray(value).tostring())
+        else:
+            raise TypeError('Cannot hash stage input of type %s' % (type(value).__name__))
+
+    def get_key(self, name, function, modules, inputs):
+        sha1 = hashlib.sha1()
+        self.update_hash(sha1, [STAGE_CACHE_VERSION, name, function.__name__])
+        for module_or_function in [function] + list(modules):
+            sha1.update('source:%s;' % (self.hash_source(module_or_function)))
+        self.update_hash(sha1, inputs)
+        return '%s-%s' % (name, sha1.hexdigest())
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key + RESULT_EXTENSION)
+
+    def load(self, key):
+        '''Return (found, value), marking the result as recently used.'''
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return False, None
+        os.utime(path, None)
+        return True, value
+
+    def store(self, key, value):
+        path = self.get_path(key)
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+        self.evict(keep=path)
+
+    def get_entries(self):
+        '''Return (last used time, size, path) of every stored result.'''
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(RESULT_EXTENSION):
+                stat = os.stat(os.path.join(self.cache_dir, file_name))
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(self.cache_dir, file_name)))
+        return entries
+
+    def evict(self, keep=None):
+        '''Delete least recently used results until the cache fits in
+        max_bytes (never deleting keep, the result just stored).'''
+        entries = sorted(self.get_entries())
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total_bytes -= size
+            instrument.count('stage_cache_evictions')
+
+    def clear(self):
+        for _, _, path in self.get_entries():
+            os.remove(path)
+
+    def run(self, name, function, modules=(), **inputs):
+        '''Return a CachedValue for function(**inputs), computing and storing
+        it unless a result with the same key is cached. modules lists the
+        modules (besides the function's own) whose code the result depends on.'''
+        key = self.get_key(name, function, modules, inputs)
+        found, value = self.load(key)
+        instrument.count('stage_cache_hits' if found else 'stage_cache_misses')
+        if not found:
+            with instrument.stage('stage.' + name):
+                value = function(**unwrap(inputs))
+            self.store(key, value)
+        return CachedValue(key, value, found)
+
+
+def load_data(data_file_name, required_keys=read_data.DEFAULT_REQUIRED_KEYS, get_unlabeled=True):
+    if isinstance(data_file_name, (list, tuple)):
+        import multi_year
+        return multi_year.load_multi_year(data_file_name, required_keys, get_unlabeled)
+    return columnar.load_columnar(data_file_name)
+
+
+def filter_rows_stage(data_file_name, required_keys, get_unlabeled):
+    '''Indices of the rows get_filtered_rows selects.'''
+    data = load_data(data_file_name, required_keys, get_unlabeled)
+    return data.get_filtered_row_indices(required_keys, get_unlabeled)
+
+
+def fit_transformer_stage(data_file_name, dictionary_filename, row_indices, label_keys, required_keys, get_unlabeled, sparse, dtype):
+    data = load_data(data_file_name, required_keys, get_unlabeled)
+    get_column = lambda key: data.strings(key)[row_indices]
+    transformer = featurize.FeatureTransformer(label_keys=label_keys, sparse=sparse, dtype=np.dtype(dtype))
+    return transformer.fit_columns(
+        data.keys, get_column, len(row_indices), key_rows=featurize.read_key_rows(dictionary_filename),
+        profile=data.get_profile(row_indices))
+
+
+def featurize_stage(data_file_name, row_indices, transformer, required_keys, get_unlabeled):
+    '''Return (features, privacy_suppressed_values, labels) of the rows, as
+    get_example_matrices does.'''
+    data = load_data(data_file_name, required_keys, get_unlabeled)
+    get_column = lambda key: data.strings(key)[row_indices]
+    features, privacy_suppressed_values = transformer.transform_columns(get_column, len(row_indices))
+    labels = featurize.get_label_matrix([get_column(key).tolist() for key in transformer.label_keys], len(row_indices))
+    return features, privacy_suppressed_values, labels
+
+
+def filter_features_stage(examples, transformer, feature_selection_file, required_percent, min_distinct, min_variance):
+    '''Return (features, feature_names): the regular features kept by
+    feature_selection_file, then the PrivacySuppressed-coded features with at
+    least required_percent of values available (as featurize.py writes them
+    and read_feature_artifact(use_privacy_suppressed=True) reads them), of
+    which the columns with at least min_distinct values and more than
+    min_variance variance are kept.'''
+    features, privacy_suppressed_values, labels = examples
+    feature_names = transformer.feature_names
+    if feature_selection_file:
+        indices = feature_artifacts.read_feature_selection(feature_selection_file)
+        features = features[:, indices]
+        feature_names = [feature_names[i] for i in indices]
+    privacy_suppressed_values, privacy_suppressed_names = featurize.filter_privacy_suppressed_features(
+        privacy_suppressed_values, transformer.privacy_suppressed_names, required_percent)
+    if scipy.sparse.issparse(features):
+        features = scipy.sparse.hstack([features, privacy_suppressed_values], format='csr')
+    else:
+        features = np.hstack([features, privacy_suppressed_values])
+    feature_names = feature_names + privacy_suppressed_names
+    if min_distinct is not None or min_variance is not None:
+        mask = feature_selection.ColumnStats.from_matrix(features).get_mask(
+            min_distinct=min_distinct, min_variance=min_variance)
+        features = feature_selection.select_columns(features, mask)
+        feature_names = feature_selection.select_names(feature_names, mask)
+    return features, feature_names
+
+
+def split_stage(split_filename, examples):
+    features, privacy_suppressed_values, labels = examples
+    return regressions.get_data_split_indices(labels.shape[0], split_filename)
+
+
+def get_labeled_split(features, labels, indices):
+    indices = indices[~np.isnan(labels[indices]).any(axis=1)]
+    return features[indices], labels[indices]
+
+
+def normalize_stage(filtered_features, splits):
+    '''FeatureScaler fit on the training split.'''
+    features, feature_names = filtered_features
+    return regressions.FeatureScaler().fit(features[splits[0]])
+
+
+def fit_model_stage(filtered_features, examples, splits, scaler, model, model_params):
+    features, feature_names = filtered_features
+    train_features, train_labels = get_labeled_split(features, examples[2], splits[0])
+    if scaler is not None:
+        train_features = scaler.transform(train_features)
+    if model == 'knn':
+        return regressions.KNNRegressor(**model_params).fit((train_features, train_labels))
+    return regressions.fit_svr_models(train_features, train_labels, **model_params)
+
+
+def predict_stage(filtered_features, examples, splits, scaler, model, fitted_model, eval_split, prediction_params):
+    features, feature_names = filtered_features
+    eval_features, eval_labels = get_labeled_split(features, examples[2], splits[eval_split])
+    if scaler is not None:
+        eval_features = scaler.transform(eval_features)
+    if model == 'knn':
+        predictions = fitted_model.predict(eval_features, **prediction_params)
+    else:
+        predictions = regressions.predict_svr_models(fitted_model, eval_features)
+    return eval_labels, predictions
+
+
+def run_pipeline(cache, data_file_name=read_data.DEFAULT_DATA_FILE_NAME, dictionary_filename=featurize.DICTIONARY_FILENAME, label_keys=featurize.LABEL_KEYS, required_keys=read_data.DEFAULT_REQUIRED_KEYS, get_unlabeled=True, sparse=False, dtype='float64', feature_selection_file=None, required_percent=0.0, min_distinct=None, min_variance=None, split_filename=regressions.DATA_SPLIT_FILENAME, normalize=False, model='knn', model_params=None, prediction_params=None, eval_split=2):
+    '''Run every stage through cache; return {stage name: CachedValue}.
+    eval_split selects the split that is predicted (0 train, 1 dev, 2 test).'''
+    if isinstance(data_file_name, (list, tuple)):
+        data_file = [FileInput(file_name) for file_name in data_file_name]
+    else:
+        data_file = FileInput(data_file_name)
+    data_modules = [read_data, columnar]
+    stages = {}
+    stages['filter'] = cache.run(
+        'filter', filter_rows_stage, data_modules,
+        data_file_name=data_file, required_keys=required_keys, get_unlabeled=get_unlabeled)
+    stages['transformer'] = cache.run(
+        'transformer', fit_transformer_stage, data_modules + [featurize, regressions],
+        data_file_name=data_file, dictionary_filename=FileInput(dictionary_filename),
+        row_indices=stages['filter'], label_keys=label_keys, required_keys=required_keys,
+        get_unlabeled=get_unlabeled, sparse=sparse, dtype=dtype)
+    stages['examples'] = cache.run(
+        'examples', featurize_stage, data_modules + [featurize, regressions],
+        data_file_name=data_file, row_indices=stages['filter'], transformer=stages['transformer'],
+        required_keys=required_keys, get_unlabeled=get_unlabeled)
+    stages['feature_filtering'] = cache.run(
+        'feature_filtering', filter_features_stage, [featurize, feature_artifacts, feature_selection],
+        examples=stages['examples'], transformer=stages['transformer'],
+        feature_selection_file=FileInput(feature_selection_file) if feature_selection_file else None,
+        required_percent=required_percent, min_distinct=min_distinct, min_variance=min_variance)
+    stages['split'] = cache.run(
+        'split', split_stage, [regressions],
+        split_filename=FileInput(split_filename), examples=stages['examples'])
+    stages['normalize'] = None
+    if normalize:
+        stages['normalize'] = cache.run(
+            'normalize', normalize_stage, [regressions],
+            filtered_features=stages['feature_filtering'], splits=stages['split'])
+    stages['model'] = cache.run(
+        'model', fit_model_stage, [regressions, parallel],
+        filtered_features=stages['feature_filtering'], examples=stages['examples'], splits=stages['split'],
+        scaler=stages['normalize'], model=model, model_params=model_params or {})
+    stages['predictions'] = cache.run(
+        'predictions', predict_stage, [regressions],
+        filtered_features=stages['feature_filtering'], examples=stages['examples'], splits=stages['split'],
+        scaler=stages['normalize'], model=model, fitted_model=stages['model'], eval_split=eval_split,
+        prediction_params=prediction_params or {})
+    return stages
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Run the read -> featurize -> split -> fit pipeline with cached stages')
+    parser.add_argument('--data-file', nargs='+', default=[read_data.DEFAULT_DATA_FILE_NAME])
+    parser.add_argument('--model', default='knn', choices=['knn', 'svr'])
+    parser.add_argument('--k', type=int, default=6)
+    parser.add_argument('--weighting', default='inverse_distance', choices=regressions.KNN_WEIGHTINGS)
+    parser.add_argument('--algorithm', default='auto')
+    parser.add_argument('--normalize', action='store_true')
+    parser.add_argument('--sparse', action='store_true')
+    parser.add_argument('--float32', action='store_true', help='hold features as float32')
+    parser.add_argument('--labeled', action='store_true', help='select rows with every required key (get_unlabeled=False)')
+    parser.add_argument('--feature-selection')
+    parser.add_argument('--required-percent', type=float, default=0.0)
+    parser.add_argument('--min-distinct', type=int)
+    parser.add_argument('--cache-dir', default=DEFAULT_STAGE_CACHE_DIR)
+    parser.add_argument('--max-cache-mb', type=float, default=DEFAULT_MAX_CACHE_BYTES / 2.0 ** 20)
+    parser.add_argument('--clear', action='store_true', help='delete every cached result first')
+    parser.add_argument('--trace', action='store_true', help='record a stage trace (see instrument.py)')
+    args = parser.parse_args()
+    if args.trace:
+        instrument.enable()
+
+    cache = StageCache(args.cache_dir, int(args.max_cache_mb * 2 ** 20))
+    if args.clear:
+        cache.clear()
+    if args.model == 'knn':
+        model_params = {'algorithm': args.algorithm}
+        prediction_params = {'k': args.k, 'weighting': args.weighting}
+    else:
+        model_params, prediction_params = {}, {}
+    stages = run_pipeline(
+        cache, data_file_name=args.data_file[0] if len(args.data_file) == 1 else args.data_file,
+        get_unlabeled=not args.labeled, sparse=args.sparse, dtype='float32' if args.float32 else 'float64', feature_selection_file=args.feature_selection,
+        required_percent=args.required_percent, min_distinct=args.min_distinct, normalize=args.normalize,
+        model=args.model, model_params=model_params, prediction_params=prediction_params)
+    for name in ['filter', 'transformer', 'examples', 'feature_filtering', 'split', 'normalize', 'model', 'predictions']:
+        if stages[name] is not None:
+            print '%s: %s' % (name, 'cached' if stages[name].hit else 'computed')
+
+    labels, predictions = stages['predictions'].value
+    if len(labels) == 0:
+        print 'No labeled examples to evaluate'
+        sys.exit(1)
+    percent_errors, error_ranges = regressions.compute_percent_errors(labels.tolist(), predictions.tolist())
+    for label_name, percent_error, error_range in zip(featurize.LABEL_KEYS, percent_errors, error_ranges):
+        print '%s: %s +/- %s%% average error' % (label_name, percent_error, error_range)
@@ -0,0 +1,122 @@
+'''Synthetic data module.
+
+Generates data files shaped like the College Scorecard merged files (and a
+matching data dictionary) for benchmarking when the real data is not
+available. Columns include the identifying text fields, the default required
+and label keys, categorical keys with dictionary-defined values, cohort size
+(_N) keys, earnings/repayment prediction keys and plain numeric keys, with
+configurable NULL and PrivacySuppressed rates.
+
+    python synthetic_data.py 5000 data/SYNTHETIC_PP.csv data/SyntheticDictionary.csv
+'''
+
+import codecs
+import csv
+import numpy as np
+import sys
+
+import featurize
+import read_data
+
+
+DEFAULT_NUM_COLUMNS = 300
+DEFAULT_NULL_RATE = 0.3
+DEFAULT_PRIVATE_RATE = 0.05
+# Fraction of numeric columns that may contain PrivacySuppressed values
+DEFAULT_PRIVATE_COLUMN_RATE = 0.2
+DEFAULT_NUM_CATEGORICAL = 10
+DEFAULT_NUM_CATEGORIES = 5
+
+TEXT_KEYS = ['INSTNM', 'CITY', 'STABBR', 'ZIP']
+WRITE_CHUNK_SIZE = 10000
+
+
+def get_synthetic_keys(num_columns=DEFAULT_NUM_COLUMNS, num_categorical=DEFAULT_NUM_CATEGORICAL):
+    '''Return (keys, kinds) where kinds maps each key to 'id', 'text',
+    'categorical', 'cohort', 'prediction', 'private' or 'numeric'.'''
+    kinds = {'UNITID': 'id'}
+    keys = ['UNITID'] + TEXT_KEYS
+    kinds.update({key: 'text' for key in TEXT_KEYS})
+    for key in read_data.DEFAULT_REQUIRED_KEYS + featurize.LABEL_KEYS:
+        if key not in kinds:
+            keys.append(key)
+            kinds[key] = 'private'
+    extra_keys = []
+    num_extra = max(0, num_columns - len(keys))
+    for i in xrange(num_extra):
+        if i < num_categorical:
+            key, kind = 'CAT%s' % (i), 'categorical'
+        elif i % 20 == 1:
+            key, kind = 'COHORT%s_N' % (i), 'cohort'
+        elif i % 20 == 2:
+            key, kind = 'mn_earn_wne_p%s' % (i), 'prediction'
+        elif i % 20 == 3:
+            key, kind = 'RPY_%sYR_RT' % (i), 'prediction'
+        elif (i % 100) < 100 * DEFAULT_PRIVATE_COLUMN_RATE:
+            key, kind = 'PRIV%s' % (i), 'private'
+        else:
+            key, kind = 'NUM%s' % (i), 'numeric'
+        extra_keys.append(key)
+        kinds[key] = kind
+    return keys + extra_keys, kinds
+
+
+def write_dictionary(dictionary_filename, keys, kinds, num_categories=DEFAULT_NUM_CATEGORIES):
+    '''Write a data dictionary in the layout featurize.py reads: one row per
+    key (variable name in column 4, category in column 2) followed by one
+    row per categorical value (value and label in columns 7 and 8).'''
+    with open(dictionary_filename, 'wb') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['NAME OF DATA ELEMENT', 'dev-category', 'developer-friendly name', 'API data type', 'VARIABLE NAME', 'SOURCE', 'NOTES', 'VALUE', 'LABEL'])
+        for key in keys:
+            category = 'earnings' if kinds[key] == 'prediction' else 'school'
+            writer.writerow(['%s element' % (key), 'school', category, 'float', key, 'synthetic', '', '', ''])
+            if kinds[key] == 'categorical':
+                for value in xrange(num_categories):
+                    writer.writerow(['', '', '', '', '', '', '', str(value), '%s label %s' % (key, value)])
+
+
+def get_column_values(key, kind, row_ids, random_state, null_rate, private_rate, num_categories):
+    num_rows = len(row_ids)
+    if kind == 'id':
+        return row_ids.astype(str)
+    if kind == 'text':
+        # Institution-style names with commas exercise quoted CSV fields
+        return np.array(['%s %s, Campus %s' % (key, row_id, row_id % 7) for row_id in row_ids])
+    if kind == 'categorical':
+        values = random_state.randint(0, num_categories, num_rows).astype(str)
+    elif kind == 'cohort':
+        values = random_state.randint(1, 5000, num_rows).astype(str)
+    else:
+        values = np.array(['%.6g' % (value) for value in random_state.lognormal(8, 1.5, num_rows)], dtype='S16')
+    values = values.astype('S17')
+    draws = random_state.random_sample(num_rows)
+    values[draws < null_rate] = 'NULL'
+    if kind == 'private':
+        values[(draws >= null_rate) & (draws < null_rate + private_rate)] = 'PrivacySuppressed'
+    return values
+
+
+def generate_data(num_rows, data_file_name, dictionary_filename, num_columns=DEFAULT_NUM_COLUMNS, null_rate=DEFAULT_NULL_RATE, private_rate=DEFAULT_PRIVATE_RATE, num_categorical=DEFAULT_NUM_CATEGORICAL, num_categories=DEFAULT_NUM_CATEGORIES, seed=229):
+    '''Write a synthetic data file and its dictionary; returns the keys.'''
+    random_state = np.random.RandomState(seed)
+    keys, kinds = get_synthetic_keys(num_columns, num_categorical)
+    write_dictionary(dictionary_filename, keys, kinds, num_categories)
+    with open(data_file_name, 'wb') as f:
+        f.write(codecs.BOM_UTF8)
+        writer = csv.writer(f, lineterminator='\r\n')
+        writer.writerow(keys)
+        for start in xrange(0, num_rows, WRITE_CHUNK_SIZE):
+            row_ids = np.arange(start, min(num_rows, start + WRITE_CHUNK_SIZE)) + 100000
+            columns = [
+                get_column_values(key, kinds[key], row_ids, random_state, null_rate, private_rate, num_categories).tolist()
+                for key in keys
+            ]
+            writer.writerows(zip(*columns))
+    return keys
+
+
+if __name__=='__main__':
+    num_rows = int(sys.argv[1])
+    generate_data(num_rows, sys.argv[2], sys.argv[3])
+    print 'Wrote %s synthetic rows to %s' % (num_rows, sys.argv[2])